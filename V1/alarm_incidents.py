@@ -0,0 +1,59 @@
+import re
+
+# ----------------------------------------------------------------------
+# Incremental parsing of the alarm list of variable 447.
+# Each log entry holds the alarms active at that moment, e.g.
+#   [["PLC00586","ABRIR CARENADO CE",3,3,50332234],[...]]
+# An incident starts at the first entry listing an alarm and ends at the
+# first later entry that no longer lists it (same Islands & Gaps result as
+# the SQL of get_machine_alarms, without window functions).
+# ----------------------------------------------------------------------
+
+ALARM_ENTRY_RE = re.compile(r'\["([^"]+)","([^"]+)",([0-9]+),([0-9]+),([0-9]+)\]')
+
+
+def parse_alarm_list(value: str) -> set:
+    """Set of (alarm_code, alarm_text) listed in one 447 payload."""
+    if not value:
+        return set()
+    return {(m.group(1), m.group(2)) for m in ALARM_ENTRY_RE.finditer(value)}
+
+
+class AlarmIncidentTracker:
+    """
+    Feed it the 447 entries in chronological order; it keeps the open
+    incidents and returns open / close events as they happen:
+        ("open", alarm_code, alarm_text, start_ms)
+        ("close", alarm_code, alarm_text, start_ms, end_ms)
+    Entries matching `noise_pattern` are ignored entirely, like the early
+    filter of the SQL version.
+    """
+
+    def __init__(self, noise_pattern: str = None):
+        self.noise_re = re.compile(noise_pattern) if noise_pattern else None
+        self.open_incidents = {}   # (alarm_code, alarm_text) -> start_ms
+        self.last_ms = None
+
+    def feed(self, date_ms: int, value: str) -> list:
+        if self.noise_re is not None and value and self.noise_re.search(value):
+            return []
+
+        events = []
+        active = parse_alarm_list(value)
+        for key in [k for k in self.open_incidents if k not in active]:
+            start_ms = self.open_incidents.pop(key)
+            events.append(("close", key[0], key[1], start_ms, date_ms))
+        for key in active:
+            if key not in self.open_incidents:
+                self.open_incidents[key] = date_ms
+                events.append(("open", key[0], key[1], date_ms))
+
+        self.last_ms = date_ms
+        return events
+
+    def close_all(self, date_ms: int = None) -> list:
+        """Closes the incidents still open (end of range) at `date_ms` or the last entry."""
+        end_ms = date_ms if date_ms is not None else self.last_ms
+        events = [("close", code, text, start_ms, end_ms) for (code, text), start_ms in self.open_incidents.items()]
+        self.open_incidents = {}
+        return events
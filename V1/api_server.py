@@ -0,0 +1,431 @@
+import argparse
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import pandas as pd
+from aiohttp import web
+
+from batch import METRICS, STREAMS, run_batch
+from database_dao import DB_BACKEND, DB_CONFIG, get_engine, raise_query_errors, run_query_data
+from metrics import INGEST_WATERMARK, register_cache, render, track_service
+from responses import FORMATS, batch_response, build_response, dataframe_response, format_error, serialize_dataframe
+from live import EventLog, LiveMonitor
+from prefetch import RangePrefetcher
+from profiling import PROFILING_ENABLED, profile_request
+from result_cache import ResultCache
+
+# ----------------------------------------------------------------------
+# Long-running HTTP JSON API (replaces the one-shot argparse CLI of
+# backend/V1-2nd_requirement/app.py, same datatypes and same envelope).
+#
+#   GET /api/<datatype>?from=YYYY-MM-DD[ HH:MM:SS]&until=...[&format=json|ndjson|arrow|parquet][&profile=1]
+#   GET /api/<datatype>/stream?from=...&until=...   (ndjson rows while they are fetched)
+#   POST /api/batch   {"items": [{"metric": "wh", "from": ..., "until": ...}, ...]}
+#   GET /health
+#   GET /metrics   (Prometheus text format)
+#   GET /live/events   (server-sent events of the current day, see LiveHub)
+# After a range is served, its previous and next windows are prefetched
+# into the result cache (PREFETCH_ENABLED, PREFETCH_WORKERS; client scope
+# from the X-Client-Id header or the remote address).
+# ----------------------------------------------------------------------
+
+# wh = work hours per state, ec = energy per day, alarms = alarm statistics, stops = stoppages,
+# stops_summary = stoppages per day and variable
+DATATYPES = {name: single for name, (single, _) in METRICS.items()}
+
+RESULT_CACHE = ResultCache(
+    max_entries=DB_CONFIG.get('API_CACHE_ENTRIES', 256),
+    ttl_sec=DB_CONFIG.get('API_CACHE_TTL_SEC', 300),
+)
+register_cache("api", RESULT_CACHE)
+
+# Blocking service calls run here; sized like the connection pool
+WORKERS = DB_CONFIG.get('DB_POOL_SIZE', 5)
+EXECUTOR = ThreadPoolExecutor(max_workers=WORKERS)
+
+
+def run_service(datatype: str, from_date: str, until_date: str) -> pd.DataFrame:
+    # Query errors are raised: never cached, never served as 'no_data'
+    service = DATATYPES[datatype]
+    with track_service(service.__name__), raise_query_errors():
+        return service(from_date, until_date)
+
+
+# Previous / next windows of each range served, computed in the background
+PREFETCH_ENABLED = DB_CONFIG.get('PREFETCH_ENABLED', True)
+PREFETCHER = RangePrefetcher(
+    RESULT_CACHE,
+    {name: partial(run_service, name) for name in DATATYPES},
+    max_workers=DB_CONFIG.get('PREFETCH_WORKERS', 1),
+)
+
+
+def fetch_dataframe(datatype: str, from_date: str, until_date: str) -> pd.DataFrame:
+    """Runs the service function of a datatype, through the result cache."""
+    with PREFETCHER.foreground():
+        return RESULT_CACHE.get_or_compute((datatype, from_date, until_date),
+                                           lambda: run_service(datatype, from_date, until_date))
+
+
+def prefetch_scope(request: web.Request, datatype: str) -> tuple:
+    # One scope per client and datatype: a new range cancels the prefetch of the previous one
+    return request.headers.get("X-Client-Id") or request.remote, datatype
+
+
+def json_response(payload: dict, status: int = 200) -> web.Response:
+    # ensure_ascii=False keeps the accents of the alarm messages; dates fall back to str
+    body = json.dumps(payload, ensure_ascii=False, default=str)
+    return web.Response(text=body, status=status, content_type="application/json")
+
+
+async def handle_datatype(request: web.Request) -> web.Response:
+    datatype = request.match_info["datatype"]
+    from_date = request.query.get("from")
+    until_date = request.query.get("until")
+    fmt = request.query.get("format", "json")
+
+    if format_error(fmt):
+        # Unknown, or not available in this install: refused before running the query
+        return json_response({"status": "error", "message": format_error(fmt)}, 400)
+    if datatype not in DATATYPES:
+        return json_response({"status": "error", "message": f"Unknown datatype '{datatype}'. Use one of: {', '.join(DATATYPES)}."}, 404)
+    if not from_date or not until_date:
+        return json_response({"status": "error", "message": "Query parameters 'from' and 'until' are required."}, 400)
+
+    loop = asyncio.get_running_loop()
+    profile = request.query.get("profile") == "1" or PROFILING_ENABLED
+    if profile:
+        return await loop.run_in_executor(EXECUTOR, profiled_datatype, datatype, from_date, until_date, fmt)
+
+    try:
+        df = await loop.run_in_executor(EXECUTOR, fetch_dataframe, datatype, from_date, until_date)
+    except ValueError as e:
+        # Badly formatted dates
+        return json_response({"status": "error", "message": str(e)}, 400)
+    except Exception as e:
+        print(f"Error executing query: {e}")
+        return json_response(build_response("error", from_date, until_date, []), 500)
+
+    if PREFETCH_ENABLED:
+        PREFETCHER.schedule(prefetch_scope(request, datatype), [datatype], from_date, until_date)
+
+    if fmt == "json":
+        return json_response(dataframe_response(df, from_date, until_date))
+
+    # Columnar / line formats: rows only, the envelope goes into headers
+    try:
+        body = await loop.run_in_executor(EXECUTOR, serialize_dataframe, df, fmt)
+    except Exception as e:
+        print(f"Error serializing {datatype} as {fmt}: {e}")
+        return json_response(build_response("error", from_date, until_date, []), 500)
+    return web.Response(body=body, content_type=FORMATS[fmt][0], headers={
+        "X-Status": "success" if not df.empty else "no_data",
+        "X-Count": str(len(df)),
+        "X-Period-From": from_date,
+        "X-Period-Until": until_date,
+    })
+
+
+def profiled_datatype(datatype: str, from_date: str, until_date: str, fmt: str) -> web.Response:
+    """
+    ?profile=1: runs the service function (without the cache) and the
+    serialization under the sampling profiler, in the worker thread.
+    The profile files are named in the X-Profile header.
+    """
+    service = DATATYPES[datatype]
+    with profile_request(service.__name__, from_date, until_date, enabled=True) as profile:
+        try:
+            df = run_service(datatype, from_date, until_date)
+        except ValueError as e:
+            return json_response({"status": "error", "message": str(e)}, 400)
+        except Exception as e:
+            print(f"Error executing query: {e}")
+            return json_response(build_response("error", from_date, until_date, []), 500)
+        try:
+            if fmt == "json":
+                body, content_type = json.dumps(dataframe_response(df, from_date, until_date), ensure_ascii=False, default=str), "application/json"
+            else:
+                body, content_type = serialize_dataframe(df, fmt), FORMATS[fmt][0]
+        except Exception as e:
+            print(f"Error serializing {datatype} as {fmt}: {e}")
+            return json_response(build_response("error", from_date, until_date, []), 500)
+
+    response = web.Response(body=body.encode("utf-8") if isinstance(body, str) else body, content_type=content_type)
+    response.headers["X-Profile"] = profile["path"] or ""
+    return response
+
+
+async def handle_stream(request: web.Request) -> web.StreamResponse:
+    """
+    ndjson export of row-level data. A worker thread pulls chunks from the
+    server-side cursor and hands them over through a bounded queue: when the
+    client reads slowly, the producer waits instead of buffering the range.
+    """
+    datatype = request.match_info["datatype"]
+    from_date = request.query.get("from")
+    until_date = request.query.get("until")
+    if datatype not in STREAMS:
+        return json_response({"status": "error", "message": f"Streaming is available for: {', '.join(STREAMS)}."}, 404)
+    if not from_date or not until_date:
+        return json_response({"status": "error", "message": "Query parameters 'from' and 'until' are required."}, 400)
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=4)
+    done = object()
+    cancelled = threading.Event()
+    failed = threading.Event()
+
+    def produce():
+        try:
+            for chunk in STREAMS[datatype](from_date, until_date):
+                if cancelled.is_set():
+                    break
+                asyncio.run_coroutine_threadsafe(queue.put(serialize_dataframe(chunk, "ndjson")), loop).result()
+        except Exception as e:
+            print(f"Error streaming {datatype}: {e}")
+            failed.set()
+        finally:
+            asyncio.run_coroutine_threadsafe(queue.put(done), loop).result()
+
+    response = web.StreamResponse(headers={"Content-Type": FORMATS["ndjson"][0]})
+    await response.prepare(request)
+    producer = loop.run_in_executor(EXECUTOR, produce)
+    try:
+        while True:
+            payload = await queue.get()
+            if payload is done:
+                break
+            await response.write(payload)
+        if failed.is_set():
+            # The status is already sent: drop the connection without the final
+            # chunk, so the client sees an incomplete body rather than a short one
+            request.transport.close()
+        else:
+            await response.write_eof()
+    finally:
+        # Client gone or stream finished: stop the producer and unblock its last put
+        cancelled.set()
+        while not producer.done():
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                await asyncio.sleep(0.01)
+    return response
+
+
+async def handle_batch(request: web.Request) -> web.Response:
+    try:
+        payload = await request.json()
+        items = payload["items"]
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise TypeError("'items' must be a list of objects")
+    except (ValueError, KeyError, TypeError) as e:
+        return json_response({"status": "error", "message": f"Invalid batch body: {e}"}, 400)
+
+    loop = asyncio.get_running_loop()
+    results = await loop.run_in_executor(
+        None, lambda: run_batch(items, max_workers=WORKERS, cache=RESULT_CACHE)
+    )
+    return json_response(batch_response(results))
+
+
+# ---- Live events (server-sent events) ----
+# One poller per process refreshes the live day (live.py) while at least one
+# client is connected and appends its events to a shared bounded log; every
+# client reads that log at its own pace. A client too slow for the buffer,
+# new, or resuming with an unknown Last-Event-ID gets a 'snapshot' event
+# (full state of the day) and continues from there.
+
+LIVE_POLL_SEC = DB_CONFIG.get('LIVE_POLL_SEC', 5)
+LIVE_ENERGY_EVENT_SEC = DB_CONFIG.get('LIVE_ENERGY_EVENT_SEC', 60)
+LIVE_HEARTBEAT_SEC = 15
+
+
+def snapshot_payload(snap: dict) -> dict:
+    return {
+        "day": str(snap["day"]),
+        "state": snap["state"],
+        "state_since": snap["state_since"],
+        "state_hours": dict(zip(snap["state_hours"]["state"], snap["state_hours"]["total_hours"])),
+        "energy_kwh": round(snap["energy_kwh"], 3),
+        "open_incidents": snap["open_incidents"].to_dict(orient="records"),
+        "closed_incidents": snap["closed_incidents"],
+        "last_data": snap["last_data"],
+    }
+
+
+def sse_frame(event_id: str, event: str, payload: dict) -> str:
+    data = json.dumps(payload, ensure_ascii=False, default=str)
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+
+class LiveHub:
+    def __init__(self, max_events: int = 1000):
+        self.monitor = LiveMonitor(min_interval_sec=0)   # paced by the poller
+        self.log = EventLog(max_events)
+        self.snapshot = None
+        self.subscribers = 0
+        self._changed = asyncio.Condition()
+        self._refresh_lock = asyncio.Lock()
+        self._pending_energy = None
+        self._last_energy = 0.0
+
+    async def refresh(self) -> None:
+        async with self._refresh_lock:
+            loop = asyncio.get_running_loop()
+            snap, events = await loop.run_in_executor(EXECUTOR, self.monitor.refresh)
+
+            # Energy goes out periodically, as the running total of the day
+            for event in events:
+                if event["type"] == "energy":
+                    self._pending_energy = event
+            events = [e for e in events if e["type"] != "energy"]
+            if self._pending_energy and time.monotonic() - self._last_energy >= LIVE_ENERGY_EVENT_SEC:
+                events.append(self._pending_energy)
+                self._pending_energy, self._last_energy = None, time.monotonic()
+
+            # Snapshot and events change together (no await in between)
+            self.snapshot = snapshot_payload(snap)
+            self.log.append(events)
+            async with self._changed:
+                self._changed.notify_all()
+
+    async def poll(self) -> None:
+        while True:
+            if self.subscribers:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    print(f"Live refresh failed: {e}")
+            await asyncio.sleep(LIVE_POLL_SEC)
+
+    async def wait(self, after_seq: int, timeout: float) -> bool:
+        """
+        Waits until the log holds events after `after_seq`; False on timeout.
+        Returns at once if some came in already (e.g. while the caller was
+        writing), so no refresh is missed between two waits.
+        """
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: self.log.last_seq > after_seq), timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+
+LIVE_HUB = LiveHub(max_events=DB_CONFIG.get('LIVE_EVENT_BUFFER', 1000))
+
+
+async def handle_live_events(request: web.Request) -> web.StreamResponse:
+    """
+    text/event-stream of the live events: state, alarm_open, alarm_close,
+    energy, plus snapshot. Resumes after the Last-Event-ID header (or
+    ?last_event_id=) when the buffer still holds it.
+    Each write waits for the client to drain (backpressure); a client that
+    falls behind the buffer is resynchronized with a snapshot.
+    """
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",   # no proxy buffering (nginx)
+    })
+    await response.prepare(request)
+
+    hub = LIVE_HUB
+    hub.subscribers += 1
+    try:
+        await response.write(f"retry: {LIVE_POLL_SEC * 1000}\n\n".encode("utf-8"))
+        if hub.snapshot is None:
+            await hub.refresh()
+
+        cursor = request.headers.get("Last-Event-ID") or request.query.get("last_event_id")
+        while True:
+            events, resumed = hub.log.since(cursor)
+            if not resumed:
+                last = hub.log.last_seq
+                frames = [sse_frame(hub.log.event_id(last), "snapshot", hub.snapshot)]
+            else:
+                last = events[-1][0] if events else int(cursor.rpartition("-")[2])
+                frames = [sse_frame(hub.log.event_id(seq), event["type"], event) for seq, event in events]
+            if frames:
+                await response.write("".join(frames).encode("utf-8"))
+            cursor = hub.log.event_id(last)
+
+            if not await hub.wait(last, LIVE_HEARTBEAT_SEC):
+                await response.write(b": keep-alive\n\n")
+    except ConnectionResetError:
+        pass   # client gone
+    finally:
+        hub.subscribers -= 1
+    return response
+
+
+async def start_live_poller(app: web.Application) -> None:
+    task = asyncio.create_task(LIVE_HUB.poll())
+    yield
+    task.cancel()
+
+
+async def handle_health(request: web.Request) -> web.Response:
+    return json_response({"status": "ok", "cache": RESULT_CACHE.stats()})
+
+
+# Latest float log row, read at most once a minute for the ingest lag metric
+WATERMARK_REFRESH_SEC = 60
+_last_watermark_refresh = 0.0
+
+
+def refresh_ingest_watermark() -> None:
+    global _last_watermark_refresh
+    if time.monotonic() - _last_watermark_refresh < WATERMARK_REFRESH_SEC:
+        return
+    _last_watermark_refresh = time.monotonic()
+    # Bounded to the last days so that only the newest partitions are read
+    since_ms = int((time.time() - 7 * 86400) * 1000)
+    df = run_query_data(
+        "SELECT MAX(CAST(date AS BIGINT)) AS last_ms FROM variable_log_float WHERE CAST(date AS BIGINT) >= :since_ms;",
+        {"since_ms": since_ms},
+    )
+    if not df.empty and pd.notna(df['last_ms'].iloc[0]):
+        INGEST_WATERMARK.set_max(int(df['last_ms'].iloc[0]) / 1000, "variable_log_float")
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(EXECUTOR, refresh_ingest_watermark)
+    return web.Response(body=render().encode("utf-8"),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def warm_up(app: web.Application) -> None:
+    """Opens a first pooled connection so the first request does not pay for it."""
+    loop = asyncio.get_running_loop()
+    if DB_BACKEND == 'postgresql':
+        await loop.run_in_executor(EXECUTOR, get_engine)
+    await loop.run_in_executor(EXECUTOR, lambda: run_query_data("SELECT 1 AS ok", {}, query_name="warm_up"))
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/live/events", handle_live_events)
+    app.router.add_post("/api/batch", handle_batch)
+    app.router.add_get("/api/{datatype}/stream", handle_stream)
+    app.router.add_get("/api/{datatype}", handle_datatype)
+    app.on_startup.append(warm_up)
+    app.cleanup_ctx.append(start_live_poller)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP JSON API for the CNC machine data.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on.")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on.")
+    args = parser.parse_args()
+
+    web.run_app(create_app(), host=args.host, port=args.port)
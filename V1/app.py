@@ -1,3 +1,6 @@
+import uuid
+from functools import partial
+
 import streamlit as st
 import pandas as pd
 import altair as alt
@@ -11,8 +14,18 @@ try:
         get_state_times,
         get_machine_alarms,
         get_energy_consumption,
+        get_load_curve,
+        get_daily_kpis,
+        downsample,
+        KPI_STATE_COLUMNS,
         # get_daily_idle_trend (Removed as requested)
     )
+    from database_dao import DB_CONFIG, raise_query_errors
+    from metrics import register_cache, start_textfile_collector, track_service
+    from live import LiveMonitor
+    from prefetch import RangePrefetcher
+    from profiling import profile_request
+    from result_cache import ResultCache
 except ImportError:
     st.error("Module 'data_service' missing. Please check your files.")
     st.stop()
@@ -43,6 +56,10 @@ st.markdown("""
 STATE_DOMAIN = ['High Activity', 'Intermediate Activity', 'Low Activity', 'True Idle (Off)']
 STATE_RANGE = ['#084594', '#4292c6', '#9ecae1', '#9e3426'] 
 
+MAX_CHART_POINTS = 1500  # upper bound of points sent to any time-series chart
+
+LIVE_REFRESH_SEC = DB_CONFIG.get('LIVE_REFRESH_SEC', 10)  # auto-refresh period of the live mode
+
 EXCLUDED_FROM_GRAPHS = ['PRODUCTION', 'ALARM', 'ALARME'] 
 ACTIVE_TAGS = ['RUN', 'ACTIVE', 'AUTO', 'PRODUCTION', 'WORKING', 'HIGH ACTIVITY', 'LOW ACTIVITY', 'INTERMEDIATE ACTIVITY']
 
@@ -73,21 +90,103 @@ def clean_dataframe(df):
         df['date'] = pd.to_datetime(df['date'], errors='coerce')
     
     return df
-@st.cache_data(show_spinner=False)
-def load_data(start, end):
-    s_str = f"{start} 00:00:00"
-    e_str = f"{end} 23:59:59"
+
+@st.cache_resource
+def start_metrics():
+    # Prometheus textfile (node_exporter collector), written by one thread per server process
+    path = DB_CONFIG.get('METRICS_TEXTFILE')
+    return start_textfile_collector(path) if path else None
+
+start_metrics()
+
+def tracked(service, *args):
+    with track_service(service.__name__):
+        return service(*args)
+
+# Datasets of the pages, by name (the keys of the shared cache and of the prefetcher)
+DATASETS = {
+    "wh": get_state_times,
+    "ec": get_energy_consumption,
+    "alarms": get_machine_alarms,
+    "kpi": get_daily_kpis,
+}
+PAGE_DATASETS = {
+    "Overview": ["kpi", "alarms"],
+    "Operations": ["wh"],
+    "Energy": ["ec"],
+    "Alarms": ["alarms"],
+}
+
+def compute_dataset(name, s_str, e_str):
+    # Query errors are raised, so that the shared cache never keeps a failure
+    with raise_query_errors():
+        return tracked(DATASETS[name], s_str, e_str)
+
+@st.cache_resource
+def shared_results():
+    # Process-wide results shared by every session, also filled by the prefetcher
+    # with the previous / next windows of the range on screen
+    cache = ResultCache(max_entries=DB_CONFIG.get('APP_CACHE_ENTRIES', 256),
+                        ttl_sec=DB_CONFIG.get('APP_CACHE_TTL_SEC', 3600))
+    register_cache("app", cache)
+    calls = {name: partial(compute_dataset, name) for name in DATASETS}
+    return cache, RangePrefetcher(cache, calls, max_workers=DB_CONFIG.get('PREFETCH_WORKERS', 1))
+
+def range_bounds(start, end):
+    return f"{start} 00:00:00", f"{end} 23:59:59"
+
+def load_dataset(name, start, end):
+    cache, prefetcher = shared_results()
+    s_str, e_str = range_bounds(start, end)
     try:
-        df_s = clean_dataframe(get_state_times(s_str, e_str))
-        df_e = clean_dataframe(get_energy_consumption(s_str, e_str))
-        df_a = clean_dataframe(get_machine_alarms(s_str, e_str))
-        # df_i = clean_dataframe(get_daily_idle_trend(s_str, e_str)) <-- Line removed
-        
-        # Return only the 3 necessary DataFrames for the app
-        return df_s, df_e, df_a
+        with prefetcher.foreground():
+            df = cache.get_or_compute((name, s_str, e_str), lambda: compute_dataset(name, s_str, e_str))
+        # The cached frame is shared: clean a copy
+        return clean_dataframe(df.copy())
     except Exception as e:
         st.error(f"SQL Error: {e}")
-        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+        return pd.DataFrame()
+
+def prefetch_adjacent(page, start, end):
+    """Warms the previous and next windows of the page's datasets (cancels this session's older prefetches)."""
+    if not DB_CONFIG.get('PREFETCH_ENABLED', True):
+        return
+    _, prefetcher = shared_results()
+    scope = st.session_state.setdefault("prefetch_scope", uuid.uuid4().hex)
+    prefetcher.schedule(scope, PAGE_DATASETS[page], *range_bounds(start, end))
+
+# One cache entry per dataset and range: a page only runs the queries it renders
+@st.cache_data(show_spinner=False)
+def load_states(start, end):
+    return load_dataset("wh", start, end)
+
+@st.cache_data(show_spinner=False)
+def load_energy(start, end):
+    return load_dataset("ec", start, end)
+
+@st.cache_data(show_spinner=False)
+def load_alarms(start, end):
+    return load_dataset("alarms", start, end)
+
+@st.cache_data(show_spinner=False)
+def load_overview(start, end):
+    """State hours and daily energy of the Overview, from the daily KPI table (daily_kpi.py)."""
+    df_k = load_dataset("kpi", start, end)
+    if len(df_k) < (end - start).days + 1:
+        # Some days are not aggregated yet: full queries
+        return load_states(start, end), load_energy(start, end)
+
+    df_s = pd.DataFrame({
+        'state': list(KPI_STATE_COLUMNS),
+        'total_hours': [float(df_k[column].sum()) for column in KPI_STATE_COLUMNS.values()],
+    })
+    df_e = df_k[['date', 'energy_kwh']].rename(columns={'energy_kwh': 'total_energy_kwh'})
+    return df_s, df_e
+
+@st.cache_data(show_spinner=False)
+def load_load_curve(start, end, id_var=260):
+    # Already downsampled server-side: constant-size payload whatever the range
+    return tracked(get_load_curve, *range_bounds(start, end), id_var, MAX_CHART_POINTS)
 
 # ----------------------------------
 # 5. BUSINESS LOGIC (get_kpis, infer_severity)
@@ -208,6 +307,7 @@ def render_home(df_s, df_e, df_a):
         if not df_e.empty and 'date' in df_e.columns:
             df_e['jour'] = df_e['date'].dt.date
             df_e_day = df_e.groupby('jour')['total_energy_kwh'].sum().reset_index()
+            df_e_day = downsample(df_e_day, 'jour', 'total_energy_kwh', max_points=MAX_CHART_POINTS)
             
             line = alt.Chart(df_e_day).mark_line(point=True, color='#FFC107').encode(
                 x=alt.X('jour:T', title='Date'),
@@ -306,7 +406,7 @@ def render_ops(df_s, s_date, e_date):
     else:
         st.info("No core state data found for this period.")
 
-def render_energy(df_e):
+def render_energy(df_e, s_date, e_date):
     st.title("⚡ Energy & Cost Analysis")
     if df_e.empty: st.warning("No energy data."); return
     
@@ -337,7 +437,8 @@ def render_energy(df_e):
     st.markdown("---")
     
     if 'date' in df_e.columns:
-        chart = alt.Chart(df_e).mark_area(
+        df_chart = downsample(df_e, 'date', 'total_energy_kwh', max_points=MAX_CHART_POINTS)
+        chart = alt.Chart(df_chart).mark_area(
             line={'color':'darkgreen'},
             color=alt.Gradient(
                 gradient='linear',
@@ -351,6 +452,19 @@ def render_energy(df_e):
         ).interactive()
         st.altair_chart(chart, use_container_width=True)
 
+    # --- Intraday load curve (variable 260) ---
+    st.subheader("📈 Load Curve")
+    df_load = load_load_curve(s_date, e_date)
+    if not df_load.empty:
+        load_chart = alt.Chart(df_load).mark_line(color='darkgreen').encode(
+            x=alt.X('date:T', title='Time'),
+            y=alt.Y('load_pct', title='Load (%)'),
+            tooltip=[alt.Tooltip('date', title='Time', format='%m/%d %H:%M:%S'), alt.Tooltip('load_pct', format='.1f')]
+        ).interactive()
+        st.altair_chart(load_chart, use_container_width=True)
+    else:
+        st.info("No load data for this period.")
+
 def render_alarms(df_a):
     st.title("🚨 Alarms Management")
     
@@ -423,6 +537,66 @@ def render_alarms(df_a):
     with t_info: show_table('INFO')
     with t_all: show_table(None)
 
+@st.cache_resource
+def live_monitor():
+    # One incremental view of today per server process: every screen shares the same delta fetches
+    return LiveMonitor(min_interval_sec=LIVE_REFRESH_SEC / 2)
+
+@st.fragment(run_every=LIVE_REFRESH_SEC)
+def render_live():
+    """Today, refreshed in place: only the rows newer than the last watermark are read."""
+    try:
+        snap, _ = live_monitor().refresh()
+    except Exception as e:
+        st.error(f"SQL Error: {e}")
+        return
+
+    st.title(f"🔴 Live - {snap['day']:%m/%d/%Y}")
+    last_data = f"{snap['last_data']:%H:%M:%S} UTC" if snap['last_data'] is not None else "-"
+    st.caption(f"Last data: {last_data} · refreshed every {LIVE_REFRESH_SEC} s")
+
+    df_s = snap['state_hours']
+    kpis = get_kpis(df_s, pd.DataFrame(), pd.DataFrame())
+    since = f"since {snap['state_since']:%H:%M}" if snap['state_since'] is not None else None
+
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Current State", snap['state'] or "-", since, delta_color="off")
+    c2.metric("Active Time", f"{kpis['active_h']:.1f} h")
+    c3.metric("Energy Today", f"{snap['energy_kwh']:.1f} kWh")
+    c4.metric("Open Alarms", len(snap['open_incidents']), f"{snap['closed_incidents']} closed today", delta_color="off")
+
+    st.markdown("---")
+
+    c_left, c_right = st.columns([2, 1])
+    with c_left:
+        st.subheader("📊 State Distribution (today)")
+        if not df_s.empty:
+            chart = alt.Chart(df_s).mark_bar().encode(
+                x=alt.X('total_hours', title='Hours'),
+                y=alt.Y('state', title='State', sort='-x'),
+                color=alt.Color('state', scale=alt.Scale(domain=STATE_DOMAIN, range=STATE_RANGE), legend=None),
+                tooltip=['state', alt.Tooltip('total_hours', format='.2f')]
+            )
+            st.altair_chart(chart, use_container_width=True)
+        else:
+            st.info("No data yet today.")
+
+    with c_right:
+        st.subheader("🚨 Open Alarms")
+        if not snap['open_incidents'].empty:
+            st.dataframe(
+                snap['open_incidents'],
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    "start": st.column_config.DatetimeColumn("Since", format="HH:mm:ss"),
+                    "alarm_code": st.column_config.TextColumn("Code"),
+                    "description": st.column_config.TextColumn("Message")
+                }
+            )
+        else:
+            st.success("No open alarm.")
+
 # ----------------------------------
 # 7. MAIN APP
 # ----------------------------------
@@ -430,31 +604,46 @@ st.sidebar.title("CNC Pro")
 DATA_MIN = date(2020, 1, 1)
 DATA_MAX = date(2022, 12, 31)
 
+live_mode = st.sidebar.toggle("🔴 Live (today)", value=False)
+
 st.sidebar.header("📅 Period")
 def_end = date(2022, 2, 23)
 def_start = def_end - timedelta(days=7)
 
 dates = st.sidebar.date_input("Select Range", (def_start, def_end), min_value=DATA_MIN, max_value=DATA_MAX)
 
-if isinstance(dates, tuple) and len(dates) == 2:
+if live_mode:
+    render_live()
+
+elif isinstance(dates, tuple) and len(dates) == 2:
     s, e = dates
     
-    with st.spinner('Loading data...'):
-        # Only the 3 necessary DataFrames are returned
-        df_s, df_e, df_a = load_data(s, e)
-    
     st.sidebar.markdown("---")
     page = st.sidebar.radio("Navigation", ["Overview", "Operations", "Energy", "Alarms"])
-    
-    if page == "Overview": 
-        render_home(df_s, df_e, df_a)
-    elif page == "Operations": 
-        # df_i is not passed here as the trend chart was removed
-        render_ops(df_s, s, e)
-    elif page == "Energy": 
-        render_energy(df_e)
-    elif page == "Alarms": 
-        render_alarms(df_a)
+
+    # CNC_PROFILE=1: one flame graph per rerun (loading + cleaning + charts)
+    with profile_request(f"page-{page}", str(s), str(e)):
+        # Each page only loads (and caches) the datasets it renders
+        if page == "Overview":
+            with st.spinner('Loading data...'):
+                df_s, df_e = load_overview(s, e)
+                df_a = load_alarms(s, e)
+            render_home(df_s, df_e, df_a)
+        elif page == "Operations":
+            with st.spinner('Loading data...'):
+                df_s = load_states(s, e)
+            render_ops(df_s, s, e)
+        elif page == "Energy":
+            with st.spinner('Loading data...'):
+                df_e = load_energy(s, e)
+            render_energy(df_e, s, e)
+        elif page == "Alarms":
+            with st.spinner('Loading data...'):
+                df_a = load_alarms(s, e)
+            render_alarms(df_a)
+
+    # Once the page is served: previous / next windows in the background
+    prefetch_adjacent(page, s, e)
 
 else:
     st.info("Please select a start and end date.")
\ No newline at end of file
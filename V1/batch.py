@@ -0,0 +1,154 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import pandas as pd
+
+from data_service import (
+    _prepare_date_timestamps,
+    get_state_times, get_state_times_multi,
+    get_energy_consumption, get_energy_consumption_multi,
+    get_machine_alarms, get_machine_alarms_multi,
+    get_stoppages, get_stoppage_summary,
+    iter_alarm_incidents, iter_stoppages,
+)
+from database_dao import raise_query_errors
+
+# ----------------------------------------------------------------------
+# Batch execution: many (metric, from, until) items in one call.
+# Items of the same metric whose ranges overlap (or touch) are merged into
+# one scan of their union; the resulting groups run in parallel.
+# ----------------------------------------------------------------------
+
+# metric -> (single-range service function, multi-range variant or None)
+METRICS = {
+    "wh": (get_state_times, get_state_times_multi),
+    "ec": (get_energy_consumption, get_energy_consumption_multi),
+    "alarms": (get_machine_alarms, get_machine_alarms_multi),
+    "stops": (get_stoppages, None),
+    "stops_summary": (get_stoppage_summary, None),
+}
+
+# Metrics answered together by one scan of a range: scan -> (function returning
+# one DataFrame per metric, metrics). Items of these metrics with the same range
+# form one group, whatever their metric.
+JOINT_SCANS = {
+    "stops": (partial(get_stoppages, with_summary=True), ("stops", "stops_summary")),
+}
+_JOINT_SCAN_OF = {metric: scan for scan, (_, metrics) in JOINT_SCANS.items() for metric in metrics}
+
+# metric -> generator of DataFrame chunks, for streaming exports (row-level data)
+STREAMS = {
+    "alarms": iter_alarm_incidents,   # one row per incident
+    "stops": iter_stoppages,
+}
+
+
+def plan_batch(items: list) -> tuple:
+    """
+    Validates the items and groups them into scans.
+    Returns (groups, errors): groups is a list of (metric, [item index, ...]),
+    errors maps the index of each invalid item to its message.
+    """
+    errors = {}
+    by_metric = defaultdict(list)
+    for idx, item in enumerate(items):
+        metric = item.get("metric")
+        if metric not in METRICS:
+            errors[idx] = f"Unknown metric '{metric}'. Use one of: {', '.join(METRICS)}."
+            continue
+        try:
+            ms_start, ms_end = _prepare_date_timestamps(item["from"], item["until"])
+        except (KeyError, TypeError, ValueError) as e:
+            errors[idx] = f"Invalid range: {e}"
+            continue
+        by_metric[_JOINT_SCAN_OF.get(metric, metric)].append((ms_start, ms_end, idx))
+
+    groups = []
+    for metric, entries in by_metric.items():
+        entries.sort()
+        if metric in JOINT_SCANS:
+            # One scan per distinct range, shared by the items of every metric of the scan
+            by_range = defaultdict(list)
+            for ms_start, ms_end, idx in entries:
+                by_range[(ms_start, ms_end)].append(idx)
+            groups.extend((metric, idxs) for idxs in by_range.values())
+            continue
+        if METRICS[metric][1] is None:
+            # No shared-scan variant: one scan per item
+            groups.extend((metric, [idx]) for _, _, idx in entries)
+            continue
+        current, current_end = [], None
+        for ms_start, ms_end, idx in entries:
+            if current and ms_start > current_end + 1:
+                groups.append((metric, current))
+                current = []
+            current_end = max(current_end, ms_end) if current else ms_end
+            current.append(idx)
+        groups.append((metric, current))
+    return groups, errors
+
+
+def _run_group(metric: str, items: list, indexes: list) -> dict:
+    single, multi = METRICS[metric]
+    # A query error fails the group (status "error") instead of an empty success
+    with raise_query_errors():
+        if metric in JOINT_SCANS:
+            scan, metrics = JOINT_SCANS[metric]
+            item = items[indexes[0]]
+            frames = dict(zip(metrics, scan(item["from"], item["until"])))
+            return {i: frames[items[i]["metric"]] for i in indexes}
+        if len(indexes) == 1:
+            item = items[indexes[0]]
+            return {indexes[0]: single(item["from"], item["until"])}
+        dfs = multi([(items[i]["from"], items[i]["until"]) for i in indexes])
+    return dict(zip(indexes, dfs))
+
+
+def run_batch(items: list, max_workers: int = 4, cache=None) -> list:
+    """
+    Answers every item and returns, in the input order, one dict per item:
+    {"item": ..., "status": "success" | "error", "df": DataFrame, "message": ...}.
+    With a ResultCache, cached items are served directly and the results of
+    unmerged items are stored.
+    """
+    results = [None] * len(items)
+
+    pending = []
+    for idx, item in enumerate(items):
+        found, df = cache.get((item.get("metric"), item.get("from"), item.get("until"))) if cache else (False, None)
+        if found:
+            results[idx] = {"item": item, "status": "success", "df": df}
+        else:
+            pending.append(idx)
+
+    pending_items = [items[i] for i in pending]
+    groups, errors = plan_batch(pending_items)
+    for local_idx, message in errors.items():
+        idx = pending[local_idx]
+        results[idx] = {"item": items[idx], "status": "error", "df": pd.DataFrame(), "message": message}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_run_group, metric, pending_items, local_idxs): local_idxs
+            for metric, local_idxs in groups
+        }
+        for future, local_idxs in futures.items():
+            try:
+                group_results = future.result()
+            except Exception as e:
+                print(f"Error executing batch group: {e}")
+                for local_idx in local_idxs:
+                    idx = pending[local_idx]
+                    results[idx] = {"item": items[idx], "status": "error", "df": pd.DataFrame(), "message": str(e)}
+                continue
+            for local_idx, df in group_results.items():
+                idx = pending[local_idx]
+                item = items[idx]
+                results[idx] = {"item": item, "status": "success", "df": df}
+                if cache and len(local_idxs) == 1:
+                    # Only single-range results: the cache is shared with GET /api/<datatype>,
+                    # whose answer may differ slightly from a range cut out of a merged scan
+                    cache.put((item["metric"], item["from"], item["until"]), df)
+
+    return results
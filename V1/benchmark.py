@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# ----------------------------------------------------------------------
+# Benchmark of the core service functions at 1 day / 1 month / 1 year.
+#
+#   python benchmark.py --seed-days 365 --start 2021-01-01     (seed once, DuckDB backend)
+#   python benchmark.py --start 2021-01-01 --runs 5
+#   python benchmark.py --start 2021-01-01 --compare benchmarks/<previous>.json
+#
+# --seed-days loads synthetic telemetry (synthetic_data.py) into the backend
+# of config.yaml, and only into an empty one:
+#   - duckdb     : Parquet days under PARQUET_ROOT (embedded, disposable)
+#   - postgresql : COPY into the log tables, only with --seed-target naming
+#                  DB_NAME (a scratch database, never the production one)
+# Every (function, scale) case runs in a fresh process, so its peak RSS is
+# its own and not the high-water mark of the previous cases.
+# ----------------------------------------------------------------------
+
+FUNCTIONS = ["get_state_times", "get_energy_consumption", "get_machine_alarms"]
+
+SCALES = {
+    "day": 1,
+    "month": 30,
+    "year": 365,
+}
+
+# pg_stat counters are flushed by the backends asynchronously (PG15: at most every second)
+STATS_FLUSH_SEC = 1.5
+
+ROWS_SCANNED_SQL = """
+SELECT COALESCE(SUM(seq_tup_read + COALESCE(idx_tup_fetch, 0)), 0) AS rows_scanned
+FROM pg_stat_user_tables
+"""
+
+
+def _rows_scanned() -> int:
+    from database_dao import DB_BACKEND, run_query_data
+
+    if DB_BACKEND != 'postgresql':
+        return None   # pg_stat only
+    df = run_query_data(ROWS_SCANNED_SQL, {})
+    return int(df['rows_scanned'].iloc[0]) if not df.empty else None
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux, in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_case(function: str, from_date: str, until_date: str, runs: int) -> dict:
+    """Runs one (function, range) case in the current process: 1 warm-up + `runs` timed calls."""
+    import data_service
+
+    service = getattr(data_service, function)
+    df = service(from_date, until_date)   # warm-up: connection pool, plan cache
+
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        df = service(from_date, until_date)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # One more call between two reads of pg_stat for the rows it scanned
+    time.sleep(STATS_FLUSH_SEC)
+    before = _rows_scanned()
+    service(from_date, until_date)
+    time.sleep(STATS_FLUSH_SEC)
+    after = _rows_scanned()
+
+    return {
+        "function": function,
+        "from": from_date,
+        "until": until_date,
+        "runs": runs,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+        "mean_ms": round(float(np.mean(latencies)), 1),
+        "rows_returned": len(df),
+        "rows_scanned": after - before if before is not None and after is not None else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def seed(start: str, n_days: int, seed: int = 0, target: str = None) -> dict:
+    """
+    Loads `n_days` of synthetic telemetry from `start` into the configured
+    backend. Raises ValueError unless the target is a scratch one and empty.
+    """
+    from database_dao import DB_BACKEND, DB_CONFIG, raise_query_errors, run_query_data
+    from ingest import TABLES
+    from synthetic_data import generate
+
+    start_day = datetime.strptime(start, "%Y-%m-%d").date()
+    if DB_BACKEND == 'duckdb':
+        root = DB_CONFIG.get('PARQUET_ROOT', 'parquet')
+        if any(os.listdir(os.path.join(root, table)) for table in TABLES.values()
+               if os.path.isdir(os.path.join(root, table))):
+            raise ValueError(f"PARQUET_ROOT '{root}' already holds log data: seed an empty folder.")
+        return generate(start_day, n_days, seed=seed, fmt="parquet", out=root)
+
+    if target is None or target != DB_CONFIG.get('DB_NAME'):
+        raise ValueError(f"Seeding PostgreSQL appends to the log tables: pass --seed-target "
+                         f"{DB_CONFIG.get('DB_NAME')} to confirm it is a scratch database.")
+    with raise_query_errors():
+        for table in TABLES.values():
+            if not run_query_data(f"SELECT 1 AS found FROM {table} LIMIT 1;", {}).empty:
+                raise ValueError(f"{table} is not empty: seed a fresh scratch database.")
+    return generate(start_day, n_days, seed=seed, fmt="db")
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(start: str, functions: list = None, scales: list = None, runs: int = 5) -> dict:
+    start_day = datetime.strptime(start, "%Y-%m-%d")
+    results = []
+    for scale in scales or list(SCALES):
+        until = (start_day + timedelta(days=SCALES[scale] - 1)).strftime("%Y-%m-%d")
+        for function in functions or FUNCTIONS:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                result = pool.submit(run_case, function, start, until, runs).result()
+            result["scale"] = scale
+            results.append(result)
+            print(f"{function:<24} {scale:<6} p50 {result['p50_ms']:>9.1f} ms  p95 {result['p95_ms']:>9.1f} ms  "
+                  f"scanned {result['rows_scanned']}  rss {result['peak_rss_mb']} MB")
+
+    return {
+        "commit": _git_commit(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict) -> None:
+    """Prints the p50 / p95 ratio of every case against a previous report."""
+    previous = {(r["function"], r["scale"]): r for r in baseline["results"]}
+    print(f"\nAgainst {baseline.get('commit')} ({baseline.get('created_at')}):")
+    for r in report["results"]:
+        old = previous.get((r["function"], r["scale"]))
+        if not old or not old["p50_ms"] or not old["p95_ms"]:
+            continue
+        print(f"{r['function']:<24} {r['scale']:<6} p50 x{r['p50_ms'] / old['p50_ms']:.2f}  p95 x{r['p95_ms'] / old['p95_ms']:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the data_service functions at day / month / year ranges.")
+    parser.add_argument("--start", default="2021-01-01", help="First day of every range (YYYY-MM-DD).")
+    parser.add_argument("--runs", type=int, default=5, help="Timed calls per case (after one warm-up).")
+    parser.add_argument("--functions", nargs="+", choices=FUNCTIONS, help="Functions to run (default: all).")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), help="Range sizes to run (default: all).")
+    parser.add_argument("--seed-days", type=int, default=0,
+                        help="First load N days of synthetic data from --start (empty backend only).")
+    parser.add_argument("--seed-target", help="PostgreSQL only: DB_NAME of the scratch database to seed.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic data.")
+    parser.add_argument("--output", help="JSON report path (default: benchmarks/<date>_<commit>.json).")
+    parser.add_argument("--compare", help="Previous JSON report to compare with.")
+    args = parser.parse_args()
+
+    if args.seed_days:
+        try:
+            seed(args.start, args.seed_days, seed=args.seed, target=args.seed_target)
+        except ValueError as e:
+            parser.error(str(e))
+
+    report = run_benchmark(args.start, args.functions, args.scales, args.runs)
+
+    output = args.output or os.path.join("benchmarks", f"{datetime.now():%Y%m%d_%H%M%S}_{report['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
@@ -0,0 +1,129 @@
+import argparse
+import json
+import sys
+
+from batch import METRICS, STREAMS, run_batch
+from responses import FORMATS, batch_response, build_response, dataframe_response, format_error, serialize_dataframe
+
+# ----------------------------------------------------------------------
+# Command-line access to the V1 data service (same envelope as the API).
+#
+#   python cli.py wh -f "2021-02-01" -u "2021-02-06"
+#   python cli.py alarms -f "2021-01-01" -u "2021-12-31" --format parquet
+#   python cli.py stops -f "2020-01-01" -u "2022-12-31" --stream -o -
+#   python cli.py batch -i items.json     (or -i - to read stdin)
+# with items.json = [{"metric": "wh", "from": "...", "until": "..."}, ...]
+# ("stops" and "stops_summary" items of the same range share one scan)
+# ----------------------------------------------------------------------
+
+
+def fetch_single(datatype: str, from_date: str, until_date: str):
+    """Returns the DataFrame of one request, or None if the query failed."""
+    service, _ = METRICS[datatype]
+    try:
+        return service(from_date, until_date)
+    except Exception as e:
+        print(f"Error executing query: {e}", file=sys.stderr)
+        return None
+
+
+def write_rows(df, fmt: str, output: str) -> None:
+    """Writes the rows in a non-JSON format to a file, or to stdout with '-o -'."""
+    payload = serialize_dataframe(df, fmt)
+    if output == "-":
+        sys.stdout.buffer.write(payload)
+        sys.stdout.buffer.flush()
+    else:
+        with open(output, "wb") as f:
+            f.write(payload)
+        print(f"{len(df)} rows written to {output} ({fmt}).", file=sys.stderr)
+
+
+def stream_rows(datatype: str, from_date: str, until_date: str, output: str) -> None:
+    """
+    Writes the rows as ndjson chunk by chunk, while the server-side cursor is
+    still fetching: memory stays flat and the first rows appear immediately.
+    """
+    out = sys.stdout.buffer if output == "-" else open(output, "wb")
+    count = 0
+    try:
+        for chunk in STREAMS[datatype](from_date, until_date):
+            out.write(serialize_dataframe(chunk, "ndjson"))
+            out.flush()
+            count += len(chunk)
+    except Exception as e:
+        print(f"Error streaming {datatype} after {count} rows: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    print(f"{count} rows streamed to {'stdout' if output == '-' else output}.", file=sys.stderr)
+
+
+def run_batch_file(path: str, max_workers: int) -> dict:
+    if path == "-":
+        items = json.load(sys.stdin)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            items = json.load(f)
+
+    return batch_response(run_batch(items, max_workers=max_workers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the CNC machine data (single request or batch).")
+
+    parser.add_argument("datatype", choices=list(METRICS) + ["batch"],
+                        help="'wh' (work hours), 'ec' (energy), 'alarms' (warnings), 'stops', "
+                             "'stops_summary' (stops per day) or 'batch'.")
+    parser.add_argument("-f", "--from-date", help="Start date (YYYY-MM-DD HH:MI:SS).")
+    parser.add_argument("-u", "--until-date", help="End date (YYYY-MM-DD HH:MI:SS).")
+    parser.add_argument("-i", "--items", help="Batch mode: JSON file with the list of items ('-' for stdin).")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="Batch mode: scans run in parallel.")
+    parser.add_argument("--format", choices=list(FORMATS), default="json",
+                        help="json (envelope), or rows only as ndjson, arrow (IPC stream) or parquet.")
+    parser.add_argument("--stream", action="store_true",
+                        help=f"Stream the rows as ndjson while they are fetched ({', '.join(STREAMS)}).")
+    parser.add_argument("-o", "--output", help="Output file ('-' for stdout). Default: api_response.<format>.")
+    args = parser.parse_args()
+    if args.stream:
+        args.format = "ndjson"
+    output = args.output or f"api_response.{FORMATS[args.format][1]}"
+
+    if args.stream:
+        if args.datatype not in STREAMS:
+            parser.error(f"--stream is available for: {', '.join(STREAMS)}")
+        if not args.from_date or not args.until_date:
+            parser.error("--from-date and --until-date are required")
+        stream_rows(args.datatype, args.from_date, args.until_date, output)
+        return
+
+    if args.datatype == "batch":
+        if not args.items:
+            parser.error("batch mode requires --items")
+        if args.format != "json":
+            parser.error("batch mode only supports --format json")
+        response = run_batch_file(args.items, args.workers)
+    else:
+        if not args.from_date or not args.until_date:
+            parser.error("--from-date and --until-date are required")
+        if format_error(args.format):
+            parser.error(format_error(args.format))
+        df = fetch_single(args.datatype, args.from_date, args.until_date)
+        if df is None:
+            response = build_response("error", args.from_date, args.until_date, [])
+        elif args.format != "json":
+            write_rows(df, args.format, output)
+            return
+        else:
+            response = dataframe_response(df, args.from_date, args.until_date)
+
+    # ensure_ascii=False keeps the accents of the alarm messages
+    print(json.dumps(response, indent=4, ensure_ascii=False, default=str))
+    if output != "-":
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(response, f, indent=4, ensure_ascii=False, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+from datetime import date, datetime, timedelta, timezone
+
+from data_service import KPI_STATE_COLUMNS, KPI_TABLE, get_energy_consumption_multi, get_state_times_multi
+from database_dao import execute_sql_command, get_engine, raise_query_errors, run_query_data
+from watermarks import DAILY_KPI, advance_watermark, get_watermark, lock_derived, setup_watermarks
+
+# ----------------------------------------------------------------------
+# Daily KPI table read by the Overview page of app.py: one row per UTC day
+# with the hours of each core state and the energy of the day, so that the
+# Overview of any range is a scan of a few hundred rows instead of the log.
+#
+#   python daily_kpi.py build                  (create the table, whole history)
+#   python daily_kpi.py refresh                (from the first incomplete day until today)
+#   python daily_kpi.py refresh --from 2021-03-01 --until 2021-03-31
+#
+# Run 'build' before starting ingest_daemon.py, which then adds the rows it
+# loads to their day in real time; 'refresh' may run alongside the daemon
+# (each chunk holds the table's advisory lock, see watermarks.py).
+# The days before the watermark are complete; get_daily_kpis serves only those.
+# ----------------------------------------------------------------------
+
+CHUNK_DAYS = 31   # days classified per scan of the log
+
+
+def setup_daily_kpi():
+    """Creates the KPI table (no-op if it already exists)."""
+    state_columns = ",\n            ".join(f"{column} DOUBLE PRECISION NOT NULL DEFAULT 0"
+                                         for column in KPI_STATE_COLUMNS.values())
+    execute_sql_command(f"""
+        CREATE TABLE IF NOT EXISTS {KPI_TABLE} (
+            day         DATE PRIMARY KEY,
+            {state_columns},
+            energy_kwh  DOUBLE PRECISION NOT NULL DEFAULT 0,
+            updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+
+
+def _day_start_s(day: date) -> int:
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+
+def _first_day() -> date:
+    """First day after the watermark, or day of the first row of the log."""
+    watermark = get_watermark(DAILY_KPI)
+    if watermark is not None:
+        return datetime.fromtimestamp(watermark, tz=timezone.utc).date()
+    df = run_query_data("SELECT MIN(CAST(date AS BIGINT)) AS first_ms FROM variable_log_float;", {})
+    if df.empty or df['first_ms'].isna().iloc[0]:
+        return None
+    return datetime.fromtimestamp(int(df['first_ms'].iloc[0]) / 1000, tz=timezone.utc).date()
+
+
+def _kpi_rows(days: list) -> list:
+    """(day, hours per state column, energy_kwh) of each day, from one scan of the chunk."""
+    ranges = [(f"{d} 00:00:00", f"{d} 23:59:59") for d in days]
+    states = get_state_times_multi(ranges)
+    energy = get_energy_consumption_multi(ranges)
+
+    rows = []
+    for day, df_s, df_e in zip(days, states, energy):
+        hours = dict(zip(df_s['state'], df_s['total_hours']))
+        kwh = float(df_e['total_energy_kwh'].sum()) if not df_e.empty else 0.0
+        rows.append((day, [float(hours.get(state, 0.0)) for state in KPI_STATE_COLUMNS], kwh))
+    return rows
+
+
+def _upsert_kpi_rows(cursor, rows: list) -> None:
+    """Writes the rows, overwriting their days."""
+    from psycopg2.extras import execute_values   # PostgreSQL only (the DuckDB backend never writes here)
+
+    columns = list(KPI_STATE_COLUMNS.values())
+    updates = ",\n            ".join(f"{c} = EXCLUDED.{c}" for c in columns + ["energy_kwh"])
+    execute_values(cursor, f"""
+    INSERT INTO {KPI_TABLE} (day, {', '.join(columns)}, energy_kwh) VALUES %s
+    ON CONFLICT (day) DO UPDATE SET
+        {updates},
+        updated_at = now();
+    """, [(day, *hours, kwh) for day, hours, kwh in rows])
+
+
+def _refresh_chunk(days: list) -> None:
+    """
+    Recomputes and writes the days in one transaction holding the table's lock,
+    so that no increment of the daemon lands between the scan and the write
+    (it would be overwritten). Advances the watermark past the complete days.
+    """
+    today = datetime.now(timezone.utc).date()
+    connection = get_engine().raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            lock_derived(cursor, DAILY_KPI)
+            with raise_query_errors():
+                # Never store the zeros of a failed query
+                rows = _kpi_rows(days)
+            _upsert_kpi_rows(cursor, rows)
+            # Today is still partial: the watermark stops at its midnight
+            complete_until = min(days[-1] + timedelta(days=1), today)
+            if complete_until > days[0]:
+                advance_watermark(cursor, DAILY_KPI, _day_start_s(complete_until), _day_start_s(days[0]))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+
+def refresh_daily_kpi(from_day: date = None, until_day: date = None) -> int:
+    """
+    Recomputes the KPI rows of [from_day, until_day] (upsert). Returns the number
+    of days written. A query error stops the refresh (the chunks before it are kept).
+    """
+    setup_watermarks()
+    with raise_query_errors():
+        from_day = from_day or _first_day()
+    until_day = until_day or datetime.now(timezone.utc).date()
+    if from_day is None:
+        print("No data.")
+        return 0
+
+    written = 0
+    day = from_day
+    while day <= until_day:
+        days = [day + timedelta(days=i) for i in range(min(CHUNK_DAYS, (until_day - day).days + 1))]
+        _refresh_chunk(days)
+        written += len(days)
+        print(f"{KPI_TABLE}: {days[0]} -> {days[-1]} written.")
+        day = days[-1] + timedelta(days=1)
+
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Daily KPI aggregates of the Overview page.")
+    parser.add_argument("action", choices=["build", "refresh"],
+                        help="build: create the table and fill the whole history; refresh: incremental.")
+    parser.add_argument("--from", dest="from_day", help="First day (YYYY-MM-DD).")
+    parser.add_argument("--until", dest="until_day", help="Last day (YYYY-MM-DD, default: today UTC).")
+    args = parser.parse_args()
+
+    if args.action == "build":
+        setup_daily_kpi()
+    try:
+        count = refresh_daily_kpi(
+            date.fromisoformat(args.from_day) if args.from_day else None,
+            date.fromisoformat(args.until_day) if args.until_day else None,
+        )
+    except Exception as e:
+        raise SystemExit(f"Refresh stopped: {e}")
+    print(f"{count} days of KPIs written.")
@@ -1,14 +1,69 @@
+import numpy as np
 import pandas as pd
 import pytz # <-- NÉCESSAIRE POUR LA GESTION DU FUSEAU HORAIRE
 
+from collections import Counter, defaultdict
 from datetime import datetime
-from database_dao import run_query_data
+from alarm_incidents import AlarmIncidentTracker
+from database_dao import DB_BACKEND, iter_query_data, run_query_data
+from rollups import PYRAMID_LEVELS, rollup_table
+from state_models import STATE_MODELS, get_model, rle_timeline, sensor_column
+from watermarks import DAILY_KPI, ROLLUPS, WATERMARK_TABLE
+from working_idle import LEO_WEIGHTS, WeightedEmaEngine
 
 # --- CONSTANTS ---
 # Standard time format for parsing date inputs
 DEFAULT_FMT = "%Y-%m-%d %H:%M:%S"
 FALLBACK_FMT = "%Y-%m-%d"
 
+SECONDS_PER_DAY = 86400
+
+# Alarm codes of variable 447 that are pure noise (door open, M01 stop, ...)
+ALARM_NOISE_PATTERN = "(PLC00054|PLC00010|PLC01005|PLC00499|PLC00051|PLC00050|PLC00474|PLC00475|2a8-0003|130-019c|PLC00052|PLC00761)"
+
+# Parts of the alarm SQL whose syntax depends on the backend (DB_BACKEND):
+# in DuckDB, '!~' is a full-match test and regexp_matches() returns a boolean,
+# so the noise filter and the extraction of the (code, text) pairs differ.
+ALARM_ENTRY_REGEX = r'\["([^"]+)","([^"]+)",([0-9]+),([0-9]+),([0-9]+)\]'
+ALARM_SQL_BY_BACKEND = {
+    "postgresql": {
+        "not_noise": "value !~ :noise_pattern",
+        "entries": f"""
+        SELECT r.ts, r.next_ts, (m)[1] AS alarm_code, (m)[2] AS alarm_text
+        FROM raw r
+        CROSS JOIN LATERAL regexp_matches(r.value, '{ALARM_ENTRY_REGEX}', 'g') AS m
+        WHERE r.next_ts IS NOT NULL""",
+    },
+    "duckdb": {
+        "not_noise": "NOT regexp_matches(value, :noise_pattern)",
+        "entries": f"""
+        SELECT
+            r.ts, r.next_ts,
+            unnest(regexp_extract_all(r.value, '{ALARM_ENTRY_REGEX}', 1)) AS alarm_code,
+            unnest(regexp_extract_all(r.value, '{ALARM_ENTRY_REGEX}', 2)) AS alarm_text
+        FROM raw r
+        WHERE r.next_ts IS NOT NULL""",
+    },
+}
+ALARM_SQL = ALARM_SQL_BY_BACKEND[DB_BACKEND]
+
+# String variables whose silences are treated as machine stops
+# (447 = alarm list, 557 = active NC program)
+STOPPAGE_VARIABLES = [447, 557]
+
+# States of the activity timeline during which the machine is off (distinct
+# count model, weighted EMA model); 'Low Activity' counts as active time in app.py
+IDLE_STATES = ('True Idle (Off)', 'IDLE')
+
+# Daily KPI table (built by daily_kpi.py): core state -> column of its hours
+KPI_TABLE = "daily_kpi"
+KPI_STATE_COLUMNS = {
+    'High Activity': 'high_activity_h',
+    'Intermediate Activity': 'intermediate_activity_h',
+    'Low Activity': 'low_activity_h',
+    'True Idle (Off)': 'idle_off_h',
+}
+
 # --- HELPER FUNCTION ---
 
 def _prepare_date_timestamps(from_date: str, until_date: str) -> tuple[int, int]:
@@ -132,7 +187,7 @@ def get_machine_alarms(from_date: str, until_date: str) -> pd.DataFrame:
     
     ms_start, ms_end = _prepare_date_timestamps(from_date, until_date)
 
-    sql_query = r"""
+    sql_query = f"""
     WITH raw AS (
         -- 1. Filter Raw String Log (Variable 447)
         SELECT
@@ -145,22 +200,11 @@ def get_machine_alarms(from_date: str, until_date: str) -> pd.DataFrame:
           AND CAST(date AS BIGINT) <= :ms_end
           
           -- ⚡ EARLY FILTER (Noise Suppression) ⚡
-          AND value !~ '(PLC00054|PLC00010|PLC01005|PLC00499|PLC00051|PLC00050|PLC00474|PLC00475|2a8-0003|130-019c|PLC00052|PLC00761)'
+          AND {ALARM_SQL['not_noise']}
     ),
     flat AS (
         -- 2. Extract Alarm Code and Text using Regex
-        SELECT
-            r.ts,
-            r.next_ts,
-            (m)[1] AS alarm_code,
-            (m)[2] AS alarm_text
-        FROM raw r
-        CROSS JOIN LATERAL regexp_matches(
-            r.value,
-            '\["([^"]+)","([^"]+)",([0-9]+),([0-9]+),([0-9]+)\]',
-            'g'
-        ) AS m
-        WHERE r.next_ts IS NOT NULL
+        {ALARM_SQL['entries']}
     ),
     segments AS (
         -- 3. Define Segments and Identify Previous End Time
@@ -205,7 +249,7 @@ def get_machine_alarms(from_date: str, until_date: str) -> pd.DataFrame:
     ORDER BY occurrence_count DESC;
     """
 
-    params = {"ms_start": ms_start, "ms_end": ms_end}
+    params = {"ms_start": ms_start, "ms_end": ms_end, "noise_pattern": ALARM_NOISE_PATTERN}
     return run_query_data(sql_query, params)
 
 # ----------------------------------------------------------------------
@@ -215,18 +259,42 @@ def get_energy_consumption(from_date: str, until_date: str) -> pd.DataFrame:
     using the Islands & Gaps method (to identify distinct runs).
     Data Team Formula: (Value% / 100) * 15kW * Hours.
     """
-    ms_start, ms_end = _prepare_date_timestamps(from_date, until_date)
+    df = _fetch_daily_energy([_prepare_date_timestamps(from_date, until_date)])
+    
+    if df.empty:
+        return pd.DataFrame(columns=['date', 'total_energy_kwh'])
+        
+    return df.drop(columns='range_idx')
 
-    sql_query = """
+
+def _fetch_daily_energy(bounds: list) -> pd.DataFrame:
+    """
+    Daily energy of each (ms_start, ms_end) range, in one scan of their union.
+    Every range only sees its own samples (the LEAD / run windows are
+    partitioned by range), so a range gets the same result alone or in a batch.
+    COLUMNS: range_idx, day, total_energy_kwh.
+    """
+    ranges = ",\n            ".join(
+        f"({i}, CAST(:ms_start_{i} AS BIGINT), CAST(:ms_end_{i} AS BIGINT))" for i in range(len(bounds))
+    )
+    sql_query = f"""
     WITH params AS (
         SELECT 15.0::float AS power_kw, 0.0::float AS on_threshold
     ),
+    ranges (range_idx, ms_start, ms_end) AS (
+        VALUES
+            {ranges}
+    ),
     s AS (
         -- 1. Filter raw data, clamp percentage, and convert date to timestamp
         SELECT
+            r.range_idx,
             to_timestamp(l.date/1000.0) AS ts,
             GREATEST(LEAST(l.value::float, 100), 0) AS pct
         FROM variable_log_float l
+        JOIN ranges r
+          ON CAST(l.date AS BIGINT) >= r.ms_start
+         AND CAST(l.date AS BIGINT) <= r.ms_end
         
         -- FIX CRITIQUE: Utilisation de l'ID 260 au lieu de la jointure par nom
         WHERE l.id_var = 260 
@@ -237,8 +305,9 @@ def get_energy_consumption(from_date: str, until_date: str) -> pd.DataFrame:
     o AS (
         -- 2. Identify the next timestamp and if the machine is 'on'
         SELECT
+            range_idx,
             ts,
-            LEAD(ts) OVER (ORDER BY ts) AS ts_next,
+            LEAD(ts) OVER (PARTITION BY range_idx ORDER BY ts) AS ts_next,
             pct,
             (pct > (SELECT on_threshold FROM params)) AS is_on
         FROM s
@@ -254,7 +323,7 @@ def get_energy_consumption(from_date: str, until_date: str) -> pd.DataFrame:
         SELECT
             *,
             CASE
-              WHEN is_on AND (LAG(is_on) OVER (ORDER BY ts) IS DISTINCT FROM TRUE) THEN 1
+              WHEN is_on AND (LAG(is_on) OVER (PARTITION BY range_idx ORDER BY ts) IS DISTINCT FROM TRUE) THEN 1
               ELSE 0
             END AS start_flag
         FROM iv
@@ -263,7 +332,7 @@ def get_energy_consumption(from_date: str, until_date: str) -> pd.DataFrame:
         -- 5. Group consecutive 'on' segments into a unique run_id
         SELECT
             *,
-            SUM(start_flag) OVER (ORDER BY ts
+            SUM(start_flag) OVER (PARTITION BY range_idx ORDER BY ts
               ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS run_id
         FROM mark
         WHERE is_on 
@@ -271,6 +340,7 @@ def get_energy_consumption(from_date: str, until_date: str) -> pd.DataFrame:
     split AS (
         -- 6. Split intervals crossing midnight for accurate daily attribution
         SELECT
+            range_idx,
             (gs)::timestamp AS day_start,
             GREATEST(ts, gs) AS seg_start,
             LEAST(ts_next, gs + interval '1 day') AS seg_end,
@@ -281,12 +351,13 @@ def get_energy_consumption(from_date: str, until_date: str) -> pd.DataFrame:
               date_trunc('day', ts),
               date_trunc('day', ts_next),
               interval '1 day'
-            ) AS gs ON TRUE
+            ) AS g(gs) ON TRUE
         WHERE ts_next > ts
     ),
     seg AS (
         -- 7. Calculate total hours and energy (kWh) per segment
         SELECT
+            range_idx,
             day_start::date AS day,
             run_id,
             EXTRACT(EPOCH FROM (seg_end - seg_start))/3600.0 AS hours,
@@ -294,19 +365,887 @@ def get_energy_consumption(from_date: str, until_date: str) -> pd.DataFrame:
               * EXTRACT(EPOCH FROM (seg_end - seg_start))/3600.0 AS energy_kwh
         FROM split
     )
-    -- FINAL OUTPUT: Total Energy per day (used by Streamlit)
+    -- FINAL OUTPUT: Total Energy per range and day (used by Streamlit)
     SELECT
+        range_idx,
         day,
         SUM(energy_kwh) AS total_energy_kwh
     FROM seg
-    GROUP BY day
-    ORDER BY day;
+    GROUP BY range_idx, day
+    ORDER BY range_idx, day;
     """
     
-    params = {"ms_start": ms_start, "ms_end": ms_end}
+    params = {"ms_start": min(b[0] for b in bounds), "ms_end": max(b[1] for b in bounds)}
+    for i, (ms_start, ms_end) in enumerate(bounds):
+        params[f"ms_start_{i}"], params[f"ms_end_{i}"] = ms_start, ms_end
+    return run_query_data(sql_query, params)
+
+# ----------------------------------------------------------------------
+# 🔗 ALARM / STATE CORRELATION (sort-merge interval join)
+# ----------------------------------------------------------------------
+
+def _iter_day_windows(ms_start: int, ms_end: int, days: int):
+    """
+    Splits [ms_start, ms_end] into consecutive windows aligned on UTC midnight,
+    so that long ranges (up to the full history) are processed chunk by chunk.
+    """
+    step = days * SECONDS_PER_DAY * 1000
+    window_start = ms_start
+    while window_start <= ms_end:
+        next_midnight = (window_start // (SECONDS_PER_DAY * 1000)) * SECONDS_PER_DAY * 1000 + step
+        window_end = min(next_midnight - 1, ms_end)
+        yield window_start, window_end
+        window_start = window_end + 1
+
+
+def _fetch_per_second_frame(ms_start: int, ms_end: int, sensor_ids: tuple = ()) -> pd.DataFrame:
+    """
+    One scan of variable_log_float producing the common input of the state
+    models: per second, the distinct variable count and the value of each
+    requested sensor (var_<id> columns). Indexed by epoch second.
+    """
+    sensor_cols = "".join(
+        f",\n        MAX(value) FILTER (WHERE id_var = {int(v)}) AS {sensor_column(v)}"
+        for v in sensor_ids
+    )
+    sql_query = f"""
+    SELECT
+        floor(CAST(date AS BIGINT) / 1000)::bigint AS sec,
+        COUNT(DISTINCT id_var) AS distinct_vars_count{sensor_cols}
+    FROM
+        public.variable_log_float
+    WHERE
+        CAST(date AS BIGINT) >= :ms_start
+        AND CAST(date AS BIGINT) <= :ms_end
+    GROUP BY
+        sec
+    ORDER BY
+        sec;
+    """
+    df = run_query_data(sql_query, {"ms_start": ms_start, "ms_end": ms_end})
+    if df.empty:
+        return pd.DataFrame(columns=['distinct_vars_count'] + [sensor_column(v) for v in sensor_ids],
+                            index=pd.Index([], name='sec', dtype='int64'))
+    return df.set_index('sec')
+
+
+def _fetch_state_timeline(ms_start: int, ms_end: int) -> pd.DataFrame:
+    """
+    Returns the classified activity timeline as RLE segments (start_s, end_s, state),
+    using the same distinct-count model as get_state_times.
+    """
+    return get_model("distinct_count").classify(_fetch_per_second_frame(ms_start, ms_end))
+
+
+def _fetch_alarm_incidents(ms_start: int, ms_end: int) -> pd.DataFrame:
+    """
+    Returns one row per alarm incident (start_s, end_s, alarm_code, alarm_text),
+    sorted by start, using the same Islands & Gaps logic as get_machine_alarms.
+    """
+    sql_query = f"""
+    WITH raw AS (
+        SELECT
+            floor(CAST(date AS BIGINT) / 1000)::bigint AS ts,
+            value,
+            LEAD(floor(CAST(date AS BIGINT) / 1000)::bigint) OVER (ORDER BY date) AS next_ts
+        FROM variable_log_string
+        WHERE id_var = 447
+          AND CAST(date AS BIGINT) >= :ms_start
+          AND CAST(date AS BIGINT) <= :ms_end
+          AND {ALARM_SQL['not_noise']}
+    ),
+    flat AS ({ALARM_SQL['entries']}
+    ),
+    marked AS (
+        SELECT *,
+               CASE
+                   WHEN LAG(next_ts) OVER (PARTITION BY alarm_code, alarm_text ORDER BY ts) IS NULL
+                     OR LAG(next_ts) OVER (PARTITION BY alarm_code, alarm_text ORDER BY ts) < ts THEN 1
+                   ELSE 0
+               END AS new_group
+        FROM flat
+    ),
+    islands AS (
+        SELECT *, SUM(new_group) OVER (PARTITION BY alarm_code, alarm_text ORDER BY ts) AS grp
+        FROM marked
+    )
+    SELECT
+        MIN(ts) AS start_s,
+        MAX(next_ts) AS end_s,
+        alarm_code,
+        alarm_text
+    FROM islands
+    GROUP BY alarm_code, alarm_text, grp
+    ORDER BY start_s;
+    """
+    params = {"ms_start": ms_start, "ms_end": ms_end, "noise_pattern": ALARM_NOISE_PATTERN}
     df = run_query_data(sql_query, params)
-    
     if df.empty:
-        return pd.DataFrame(columns=['date', 'total_energy_kwh'])
-        
-    return df
\ No newline at end of file
+        return pd.DataFrame(columns=['start_s', 'end_s', 'alarm_code', 'alarm_text'])
+    return df
+
+
+def _merge_idle_with_incidents(timeline: pd.DataFrame, incidents: pd.DataFrame,
+                               idle_states: tuple, totals: dict) -> None:
+    """
+    Sort-merge join of the idle segments with the alarm incidents (both sorted
+    by start). Adds the overlapping seconds, split per UTC day, into
+    totals[(day, alarm_code, alarm_text)].
+
+    Idle segments never overlap each other, so the first segment that can
+    still intersect an incident only moves forward: one linear pass.
+    """
+    idle = timeline[timeline['state'].isin(idle_states)]
+    seg_starts = idle['start_s'].to_numpy(dtype=np.int64)
+    seg_ends = idle['end_s'].to_numpy(dtype=np.int64)
+    n_segs = len(seg_starts)
+
+    i = 0
+    for start, end, code, text in incidents[['start_s', 'end_s', 'alarm_code', 'alarm_text']].itertuples(index=False):
+        # Skip the idle segments that end before this incident (and all later ones) begins
+        while i < n_segs and seg_ends[i] <= start:
+            i += 1
+        j = i
+        while j < n_segs and seg_starts[j] < end:
+            lo = max(seg_starts[j], start)
+            hi = min(seg_ends[j], end)
+            # Split the overlap at UTC midnight
+            while lo < hi:
+                day_end = (lo // SECONDS_PER_DAY + 1) * SECONDS_PER_DAY
+                piece_end = min(hi, day_end)
+                totals[(lo // SECONDS_PER_DAY, code, text)] += piece_end - lo
+                lo = piece_end
+            j += 1
+
+
+def get_alarm_state_correlation(from_date: str, until_date: str,
+                                idle_states: tuple = IDLE_STATES,
+                                chunk_days: int = 31) -> pd.DataFrame:
+    """
+    Attributes idle time to alarm messages: for each day and alarm code, the
+    minutes during which the machine was idle while the alarm was active.
+    The incidents are fetched once for the whole range (one row each); the
+    state timeline is classified in chunks of `chunk_days` days, holes between
+    chunks included, so it works up to the full history without loading it at
+    once and gives the same result for any chunk size.
+    'Low Activity' is active time on the dashboard: pass it in `idle_states` to count it.
+    COLUMNS: day, alarm_code, alarm_text, idle_minutes.
+    """
+    ms_start, ms_end = _prepare_date_timestamps(from_date, until_date)
+
+    totals = defaultdict(int)
+    incidents = _fetch_alarm_incidents(ms_start, ms_end)
+    if not incidents.empty:
+        model = get_model("distinct_count")
+        for timelines in _iter_window_timelines(ms_start, ms_end, {model.name: model}, chunk_days):
+            timeline = timelines[model.name]
+            if timeline.empty:
+                continue
+            # Incidents overlapping the window (still sorted by start)
+            overlap = incidents[(incidents['end_s'] > timeline['start_s'].iloc[0])
+                                & (incidents['start_s'] < timeline['end_s'].iloc[-1])]
+            _merge_idle_with_incidents(timeline, overlap, idle_states, totals)
+
+    if not totals:
+        return pd.DataFrame(columns=['day', 'alarm_code', 'alarm_text', 'idle_minutes'])
+
+    df = pd.DataFrame(
+        [(day, code, text, seconds / 60.0) for (day, code, text), seconds in totals.items()],
+        columns=['day', 'alarm_code', 'alarm_text', 'idle_minutes'],
+    )
+    df['day'] = pd.to_datetime(df['day'] * SECONDS_PER_DAY, unit='s').dt.date
+    return df.sort_values(['day', 'idle_minutes'], ascending=[True, False]).reset_index(drop=True)
+
+
+# ----------------------------------------------------------------------
+# 🛑 STOPPAGE DETECTION (gaps between log entries of 447 / 557)
+# ----------------------------------------------------------------------
+
+class StoppageDetector:
+    """
+    Incremental stop detector: feed it chunks of (id_var, date, value) ordered by
+    id_var then date, and every silence longer than `min_gap_sec` between two log
+    entries of the same variable becomes a stop. The message logged just before
+    the silence is kept as its cause. Per-day summaries are accumulated on the
+    fly, so stops and summaries come from the same single scan.
+    """
+
+    def __init__(self, min_gap_sec: int = 300, cause_length: int = 150, top_causes: int = 3):
+        self.min_gap_ms = min_gap_sec * 1000
+        self.cause_length = cause_length
+        self.top_causes = top_causes
+        self._last = {}     # id_var -> (date_ms, value) of the last entry seen
+        self._stops = []
+        self._daily = defaultdict(lambda: {"count": 0, "total_ms": 0, "causes": Counter()})
+
+    def feed(self, chunk: pd.DataFrame) -> None:
+        for id_var, grp in chunk.groupby('id_var', sort=False):
+            dates = grp['date'].to_numpy(dtype=np.int64)
+            values = grp['value'].to_numpy(dtype=object)
+
+            prev_dates = np.empty_like(dates)
+            prev_values = np.empty(len(values), dtype=object)
+            prev_dates[1:] = dates[:-1]
+            prev_values[1:] = values[:-1]
+            # Carry the last entry of the previous chunk over the chunk boundary
+            prev_dates[0], prev_values[0] = self._last.get(id_var, (dates[0], None))
+
+            gaps = dates - prev_dates
+            for k in np.flatnonzero(gaps > self.min_gap_ms):
+                cause = str(prev_values[k])[:self.cause_length]
+                self._stops.append((int(id_var), int(prev_dates[k]), int(dates[k]), int(gaps[k]), cause))
+
+                # Like the SQL scripts, a stop belongs to the day it ends
+                daily = self._daily[(int(dates[k]) // (SECONDS_PER_DAY * 1000), int(id_var))]
+                daily["count"] += 1
+                daily["total_ms"] += int(gaps[k])
+                daily["causes"][cause] += 1
+
+            self._last[id_var] = (dates[-1], values[-1])
+
+    def stops(self) -> pd.DataFrame:
+        return self._stops_frame(self._stops).sort_values(['start', 'id_var']).reset_index(drop=True)
+
+    def drain_stops(self) -> pd.DataFrame:
+        """Stops found since the previous drain (streaming exports); the summary is kept."""
+        df = self._stops_frame(self._stops)
+        self._stops = []
+        return df
+
+    @staticmethod
+    def _stops_frame(stops: list) -> pd.DataFrame:
+        df = pd.DataFrame(stops, columns=['id_var', 'start', 'end', 'duration_min', 'cause'])
+        df['start'] = pd.to_datetime(df['start'], unit='ms')
+        df['end'] = pd.to_datetime(df['end'], unit='ms')
+        df['duration_min'] = df['duration_min'] / 60000.0
+        return df
+
+    def summary(self) -> pd.DataFrame:
+        rows = [
+            (day, id_var, acc["count"], acc["total_ms"] / 60000.0,
+             acc["total_ms"] / 60000.0 / acc["count"],
+             [cause for cause, _ in acc["causes"].most_common(self.top_causes)])
+            for (day, id_var), acc in self._daily.items()
+        ]
+        df = pd.DataFrame(rows, columns=['day', 'id_var', 'stop_count', 'total_minutes', 'avg_minutes', 'top_causes'])
+        df['day'] = pd.to_datetime(df['day'] * SECONDS_PER_DAY, unit='s').dt.date
+        return df.sort_values(['day', 'id_var']).reset_index(drop=True)
+
+
+def _iter_stoppage_chunks(from_date: str, until_date: str, detector: StoppageDetector):
+    """
+    Streams the 447/557 log entries of the range (ordered like the (id_var, date)
+    index) through a StoppageDetector, yielding after each chunk.
+    """
+    ms_start, ms_end = _prepare_date_timestamps(from_date, until_date)
+
+    sql_query = """
+    SELECT
+        id_var,
+        CAST(date AS BIGINT) AS date,
+        value
+    FROM variable_log_string
+    WHERE id_var = ANY(:id_vars)
+      AND CAST(date AS BIGINT) >= :ms_start
+      AND CAST(date AS BIGINT) <= :ms_end
+      AND value IS NOT NULL
+      AND value <> '[]'
+    ORDER BY id_var, date;
+    """
+    params = {"id_vars": STOPPAGE_VARIABLES, "ms_start": ms_start, "ms_end": ms_end}
+
+    for chunk in iter_query_data(sql_query, params):
+        detector.feed(chunk)
+        yield
+
+
+def _scan_stoppages(from_date: str, until_date: str, min_gap_sec: int) -> StoppageDetector:
+    detector = StoppageDetector(min_gap_sec)
+    for _ in _iter_stoppage_chunks(from_date, until_date, detector):
+        pass
+    return detector
+
+
+def get_stoppages(from_date: str, until_date: str, min_gap_sec: int = 300,
+                  with_summary: bool = False):
+    """
+    Returns every significant stop (silence longer than `min_gap_sec` seconds
+    between two log entries of variable 447 or 557) with its cause.
+    With `with_summary`, returns (stops, summary): both come from the same
+    single scan (summary columns: see get_stoppage_summary).
+    COLUMNS: id_var, start, end, duration_min, cause.
+    """
+    detector = _scan_stoppages(from_date, until_date, min_gap_sec)
+    if with_summary:
+        return detector.stops(), detector.summary()
+    return detector.stops()
+
+
+def get_stoppage_summary(from_date: str, until_date: str, min_gap_sec: int = 300) -> pd.DataFrame:
+    """
+    Per-day stop statistics, accumulated by the StoppageDetector of
+    get_stoppages. To get the stops as well, use
+    get_stoppages(..., with_summary=True): one scan for both.
+    COLUMNS: day, id_var, stop_count, total_minutes, avg_minutes, top_causes.
+    """
+    return _scan_stoppages(from_date, until_date, min_gap_sec).summary()
+
+
+# ----------------------------------------------------------------------
+# ⚙️ WORKING / IDLE (Léo's weighted-score EMA model, streamed)
+# ----------------------------------------------------------------------
+
+def _iter_working_idle_segments(from_date: str, until_date: str):
+    """
+    Streams the sensors of Léo's model through a WeightedEmaEngine and yields
+    the fused (start_s, end_s, state) segments as they are closed.
+    """
+    ms_start, ms_end = _prepare_date_timestamps(from_date, until_date)
+
+    sql_query = """
+    SELECT
+        floor(CAST(date AS BIGINT) / 1000)::bigint AS sec,
+        id_var,
+        value
+    FROM public.variable_log_float
+    WHERE id_var = ANY(:id_vars)
+      AND CAST(date AS BIGINT) >= :ms_start
+      AND CAST(date AS BIGINT) <= :ms_end
+      AND value = value -- Filter out NaN
+    ORDER BY date;
+    """
+    params = {"id_vars": list(LEO_WEIGHTS), "ms_start": ms_start, "ms_end": ms_end}
+
+    engine = WeightedEmaEngine()
+    for chunk in iter_query_data(sql_query, params):
+        yield from engine.feed(chunk)
+    yield from engine.finish()
+
+
+def get_working_idle_timeline(from_date: str, until_date: str) -> pd.DataFrame:
+    """
+    Returns the WORKING / IDLE segments of Léo's weighted-score EMA model.
+    COLUMNS: start, end, state.
+    """
+    df = pd.DataFrame(list(_iter_working_idle_segments(from_date, until_date)),
+                      columns=['start', 'end', 'state'])
+    df['start'] = pd.to_datetime(df['start'], unit='s')
+    df['end'] = pd.to_datetime(df['end'], unit='s')
+    return df
+
+
+def get_working_idle_times(from_date: str, until_date: str) -> pd.DataFrame:
+    """
+    Total hours spent WORKING / IDLE according to Léo's model. The segments are
+    summed as they are produced, so memory stays flat for any range.
+    COLUMNS: state, total_hours (same shape as get_state_times).
+    """
+    totals = defaultdict(int)
+    for start, end, state in _iter_working_idle_segments(from_date, until_date):
+        totals[state] += end - start
+
+    if not totals:
+        return pd.DataFrame(columns=['state', 'total_hours'])
+
+    return pd.DataFrame(
+        [(state, seconds / 3600.0) for state, seconds in totals.items()],
+        columns=['state', 'total_hours'],
+    )
+
+
+# ----------------------------------------------------------------------
+# 🧪 STATE MODELS (registry in state_models.py)
+# ----------------------------------------------------------------------
+
+def _iter_window_timelines(ms_start: int, ms_end: int, state_models: dict, chunk_days: int):
+    """
+    Classifies [ms_start, ms_end] by windows of `chunk_days` days: the
+    per-second frame of each window is fetched ONCE (with the union of the
+    sensors the models need) and every model of `state_models` (name -> model)
+    classifies it. Yields {name: RLE timeline} per window. The hole between two
+    windows is prepended to the next timeline: the model's gap_state, or its
+    last state lasting until the signal comes back when gap_state is None.
+    Stateful models (EMA) restart at each window.
+    """
+    sensor_ids = tuple(sorted({v for m in state_models.values() for v in m.required_variables}))
+    last_sec = None       # last logged second of the previous windows
+    last_segment = {}     # name -> (end_s, state) of the model's last segment
+    for win_start, win_end in _iter_day_windows(ms_start, ms_end, chunk_days):
+        frame = _fetch_per_second_frame(win_start, win_end, sensor_ids)
+        if frame.empty:
+            continue
+        first_sec = int(frame.index[0])
+        timelines = {}
+        for name, state_model in state_models.items():
+            timeline = state_model.classify(frame)
+            gap = None
+            if last_sec is not None and first_sec - last_sec > 1:
+                if state_model.gap_state is not None:
+                    gap = (last_sec + 1, first_sec, state_model.gap_state)
+                elif name in last_segment:
+                    gap = (last_segment[name][0], first_sec, last_segment[name][1])
+            if gap is not None:
+                timeline = pd.concat([pd.DataFrame([gap], columns=['start_s', 'end_s', 'state']), timeline],
+                                     ignore_index=True)
+            if not timeline.empty:
+                last_segment[name] = (int(timeline['end_s'].iloc[-1]), timeline['state'].iloc[-1])
+            timelines[name] = timeline
+        last_sec = int(frame.index[-1])
+        yield timelines
+
+
+def get_state_timeline(from_date: str, until_date: str, model: str = "distinct_count",
+                       chunk_days: int = 31) -> pd.DataFrame:
+    """
+    Returns the RLE state timeline of one registered model. The per-second
+    frame is fetched and classified by windows of `chunk_days` days; a hole
+    between two windows gets the model's gap_state, and the segments that
+    touch across a boundary are merged. Stateful models (EMA) restart at each window.
+    COLUMNS: start, end, state.
+    """
+    ms_start, ms_end = _prepare_date_timestamps(from_date, until_date)
+    state_model = get_model(model)
+
+    starts, ends, states = [], [], []
+    for timelines in _iter_window_timelines(ms_start, ms_end, {model: state_model}, chunk_days):
+        starts.append(timelines[model]['start_s'].to_numpy(dtype=np.int64))
+        ends.append(timelines[model]['end_s'].to_numpy(dtype=np.int64))
+        states.append(timelines[model]['state'].to_numpy(dtype=object))
+
+    if starts:
+        timeline = rle_timeline(np.concatenate(starts), np.concatenate(ends), np.concatenate(states))
+    else:
+        timeline = rle_timeline(np.array([]), np.array([]), np.array([]))
+    df = timeline.rename(columns={'start_s': 'start', 'end_s': 'end'})
+    df['start'] = pd.to_datetime(df['start'], unit='s')
+    df['end'] = pd.to_datetime(df['end'], unit='s')
+    return df
+
+
+def evaluate_state_models(from_date: str, until_date: str, models: list = None,
+                          chunk_days: int = 7) -> pd.DataFrame:
+    """
+    Side-by-side evaluation of several state models. The per-second frame of
+    each window of `chunk_days` days is fetched ONCE (with the union of the
+    sensors the models need) and every model classifies that same frame, so
+    comparing N models costs a single scan of the range. Holes between windows
+    are counted like in get_state_timeline, so the totals match its timelines.
+    Stateful models (EMA) restart at each window.
+    COLUMNS: model, state, total_hours, share_pct.
+    """
+    names = models or list(STATE_MODELS)
+    state_models = {name: get_model(name) for name in names}
+
+    ms_start, ms_end = _prepare_date_timestamps(from_date, until_date)
+    totals = defaultdict(int)
+    for timelines in _iter_window_timelines(ms_start, ms_end, state_models, chunk_days):
+        for name, timeline in timelines.items():
+            durations = (timeline['end_s'] - timeline['start_s']).groupby(timeline['state']).sum()
+            for state, seconds in durations.items():
+                totals[(name, state)] += int(seconds)
+
+    if not totals:
+        return pd.DataFrame(columns=['model', 'state', 'total_hours', 'share_pct'])
+
+    df = pd.DataFrame(
+        [(name, state, seconds / 3600.0) for (name, state), seconds in totals.items()],
+        columns=['model', 'state', 'total_hours'],
+    )
+    df['share_pct'] = df['total_hours'] / df.groupby('model')['total_hours'].transform('sum') * 100
+    return df.sort_values(['model', 'total_hours'], ascending=[True, False]).reset_index(drop=True)
+
+
+# ----------------------------------------------------------------------
+# 🔍 LEVEL-OF-DETAIL SERIES (pyramid maintained by rollups.py)
+# ----------------------------------------------------------------------
+
+def _pick_pyramid_level(range_s: int, min_points: int) -> tuple:
+    """
+    Coarsest pyramid level that still gives at least `min_points` buckets over
+    the range; the finest level when even that is not enough.
+    """
+    for level, size in reversed(PYRAMID_LEVELS):
+        if range_s // size >= min_points:
+            return level, size
+    return PYRAMID_LEVELS[0]
+
+
+def get_series(id_var: int, from_date: str, until_date: str, min_points: int = 500) -> pd.DataFrame:
+    """
+    Returns the series of one float variable at the resolution suited to the
+    range: a year comes from the hourly level, a few minutes from the
+    per-second level, so the number of points stays chart-friendly.
+    COLUMNS: date, min_value, max_value, avg_value, n_samples, level.
+    """
+    ms_start, ms_end = _prepare_date_timestamps(from_date, until_date)
+    level, size = _pick_pyramid_level((ms_end - ms_start) // 1000, min_points)
+    return _fetch_series(id_var, ms_start, ms_end, level, size)
+
+
+def _fetch_series(id_var: int, ms_start: int, ms_end: int, level: str, size: int) -> pd.DataFrame:
+    """Buckets of one pyramid level starting in [ms_start, ms_end] (first one aligned down)."""
+    sql_query = f"""
+    SELECT
+        bucket,
+        min_value,
+        max_value,
+        sum_value / NULLIF(n_samples, 0) AS avg_value,
+        n_samples
+    FROM {rollup_table(level)}
+    WHERE id_var = :id_var
+      AND bucket >= :s_start
+      AND bucket <= :s_end
+    ORDER BY bucket;
+    """
+    params = {"id_var": id_var, "s_start": (ms_start // 1000 // size) * size, "s_end": ms_end // 1000}
+    df = run_query_data(sql_query, params)
+
+    if df.empty:
+        return pd.DataFrame(columns=['date', 'min_value', 'max_value', 'avg_value', 'n_samples', 'level'])
+
+    df['date'] = pd.to_datetime(df.pop('bucket'), unit='s')
+    df['level'] = level
+    return df[['date', 'min_value', 'max_value', 'avg_value', 'n_samples', 'level']]
+
+
+def _pyramid_watermark() -> int:
+    """
+    Epoch second before which the pyramid is complete (rollups watermark),
+    or None when it is not built (DuckDB, or rollups.py never ran).
+    """
+    # The pyramid only exists in PostgreSQL (rollups.py)
+    if DB_BACKEND == 'duckdb':
+        return None
+    built = run_query_data("SELECT to_regclass(:table) IS NOT NULL AND to_regclass(:watermarks) IS NOT NULL AS built;",
+                           {"table": rollup_table(PYRAMID_LEVELS[-1][0]), "watermarks": WATERMARK_TABLE})
+    if built.empty or not bool(built['built'].iloc[0]):
+        return None
+    df = run_query_data(f"SELECT value FROM {WATERMARK_TABLE} WHERE name = :name;", {"name": ROLLUPS})
+    return int(df['value'].iloc[0]) if not df.empty else None
+
+
+# ----------------------------------------------------------------------
+# 📉 DOWNSAMPLING (constant-size chart payloads)
+# ----------------------------------------------------------------------
+
+def _bucket_index_matrix(n: int, n_buckets: int) -> np.ndarray:
+    """
+    (n_buckets x width) matrix of row indices splitting range(n) into
+    contiguous buckets. Short buckets are padded with their own first index,
+    which never changes an argmin / argmax.
+    """
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    sizes = np.diff(edges)
+    offsets = np.arange(sizes.max())
+    idx = edges[:-1, None] + offsets[None, :]
+    return np.where(offsets[None, :] < sizes[:, None], idx, edges[:-1, None])
+
+
+def _lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: keeps the first and last points and, in
+    every bucket in between, the point forming the largest triangle with the
+    point kept in the previous bucket and the average of the next bucket.
+    """
+    n = len(x)
+    inner = _bucket_index_matrix(n - 2, n_out - 2) + 1
+    sizes = (inner != inner[:, :1]).sum(axis=1) + 1
+
+    # Average point of each bucket (padding excluded)
+    valid = np.arange(inner.shape[1])[None, :] < sizes[:, None]
+    avg_x = np.where(valid, x[inner], 0).sum(axis=1) / sizes
+    avg_y = np.where(valid, y[inner], 0).sum(axis=1) / sizes
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    prev = 0
+    for b in range(n_out - 2):
+        cand = inner[b]
+        # Twice the triangle area (prev point, candidate, next bucket average)
+        area = np.abs(
+            (x[prev] - next_x[b]) * (y[cand] - y[prev])
+            - (x[prev] - x[cand]) * (next_y[b] - y[prev])
+        )
+        prev = cand[np.argmax(area)]
+        selected[b + 1] = prev
+    return selected
+
+
+def _minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Min and max of each bucket (one bucket per pixel column), ends included."""
+    buckets = _bucket_index_matrix(len(y), max(n_out // 2 - 1, 1))
+    rows = np.arange(len(buckets))
+    lows = buckets[rows, np.argmin(y[buckets], axis=1)]
+    highs = buckets[rows, np.argmax(y[buckets], axis=1)]
+    return np.unique(np.concatenate([lows, highs, [0, len(y) - 1]]))
+
+
+def downsample(df: pd.DataFrame, x: str, y: str, max_points: int = 1500, mode: str = "lttb") -> pd.DataFrame:
+    """
+    Reduces a series to at most `max_points` rows before it is sent to a chart.
+    mode='lttb'   : Largest-Triangle-Three-Buckets (keeps the visual shape)
+    mode='minmax' : min and max per bucket (keeps every peak)
+    Rows with a missing y are dropped; smaller series are returned unchanged.
+    """
+    if mode not in ("lttb", "minmax"):
+        raise ValueError(f"Unknown downsampling mode '{mode}'. Use 'lttb' or 'minmax'.")
+
+    df = df.dropna(subset=[y])
+    if len(df) <= max_points or max_points < 3:
+        return df
+
+    x_values = df[x]
+    if not pd.api.types.is_numeric_dtype(x_values):
+        # Dates / timestamps: compare them as nanoseconds
+        x_values = pd.to_datetime(x_values).astype('int64')
+    x_arr = np.asarray(x_values, dtype=float)
+    y_arr = df[y].to_numpy(dtype=float)
+
+    if mode == "lttb":
+        idx = _lttb_indices(x_arr, y_arr, max_points)
+    else:
+        idx = _minmax_indices(y_arr, max_points)
+    return df.iloc[idx]
+
+
+def get_load_curve(from_date: str, until_date: str, id_var: int = 260,
+                   max_points: int = 1500, mode: str = "lttb") -> pd.DataFrame:
+    """
+    Intraday load curve (percentage, clamped to 0..100) of variable 260 (or
+    630), downsampled to at most `max_points` points whatever the range.
+    The part of the range the pyramid covers (before its watermark) is read
+    from it, the rest (recent rows, or all of it without a pyramid) from the raw log.
+    COLUMNS: date, load_pct.
+    """
+    ms_start, ms_end = _prepare_date_timestamps(from_date, until_date)
+
+    parts = []
+    raw_start = ms_start
+    watermark_s = _pyramid_watermark()
+    if watermark_s is not None and watermark_s * 1000 > ms_start:
+        # Level picked for the whole range, so that both parts have a similar density
+        level, size = _pick_pyramid_level((ms_end - ms_start) // 1000, max_points)
+        series = _fetch_series(id_var, ms_start, min(ms_end, watermark_s * 1000 - 1), level, size)
+        if not series.empty:
+            series['load_pct'] = series['avg_value'].astype(float).clip(0, 100)
+            parts.append(series[['date', 'load_pct']])
+        raw_start = watermark_s * 1000
+
+    if raw_start <= ms_end:
+        sql_query = """
+        SELECT
+            CAST(date AS BIGINT) AS date_ms,
+            GREATEST(LEAST(value::float, 100), 0) AS load_pct
+        FROM variable_log_float
+        WHERE id_var = :id_var
+          AND CAST(date AS BIGINT) >= :ms_start
+          AND CAST(date AS BIGINT) <= :ms_end
+          AND value = value -- Filter out NaN
+        ORDER BY date;
+        """
+        raw = run_query_data(sql_query, {"id_var": id_var, "ms_start": raw_start, "ms_end": ms_end})
+        if not raw.empty:
+            raw['date'] = pd.to_datetime(raw.pop('date_ms'), unit='ms')
+            parts.append(raw[['date', 'load_pct']])
+
+    if not parts:
+        return pd.DataFrame(columns=['date', 'load_pct'])
+    df = pd.concat(parts, ignore_index=True)
+
+    return downsample(df, 'date', 'load_pct', max_points=max_points, mode=mode)
+
+
+# ----------------------------------------------------------------------
+# 📅 DAILY KPIs (precomputed by daily_kpi.py)
+# ----------------------------------------------------------------------
+
+def get_daily_kpis(from_date: str, until_date: str) -> pd.DataFrame:
+    """
+    Rows of the daily KPI table for the days of the range. Only the complete
+    days (before the daily_kpi watermark) are served: today's row, which the
+    ingest daemon keeps adding to, and days not built yet are simply missing
+    (the caller falls back to the live queries).
+    COLUMNS: day, one column of hours per core state, energy_kwh.
+    """
+    # The KPI table only exists in PostgreSQL, once built (daily_kpi.py)
+    empty = pd.DataFrame(columns=['day', *KPI_STATE_COLUMNS.values(), 'energy_kwh'])
+    if DB_BACKEND == 'duckdb':
+        return empty
+    built = run_query_data("SELECT to_regclass(:table) IS NOT NULL AND to_regclass(:watermarks) IS NOT NULL AS built;",
+                           {"table": KPI_TABLE, "watermarks": WATERMARK_TABLE})
+    if built.empty or not bool(built['built'].iloc[0]):
+        return empty
+
+    ms_start, ms_end = _prepare_date_timestamps(from_date, until_date)
+    sql_query = f"""
+    SELECT day, {', '.join(KPI_STATE_COLUMNS.values())}, energy_kwh
+    FROM {KPI_TABLE}
+    WHERE day >= CAST(:day_start AS DATE)
+      AND day <= CAST(:day_end AS DATE)
+      AND day < (SELECT CAST(to_timestamp(value) AT TIME ZONE 'UTC' AS DATE)
+                 FROM {WATERMARK_TABLE} WHERE name = :watermark)
+    ORDER BY day;
+    """
+    params = {
+        "watermark": DAILY_KPI,
+        "day_start": datetime.fromtimestamp(ms_start / 1000, tz=pytz.utc).date().isoformat(),
+        "day_end": datetime.fromtimestamp(ms_end / 1000, tz=pytz.utc).date().isoformat(),
+    }
+    return run_query_data(sql_query, params)
+
+
+# ----------------------------------------------------------------------
+# ⏱️ LIVE DELTAS (rows newer than a watermark, see live.py)
+# ----------------------------------------------------------------------
+
+LOG_TABLES = {"float": "variable_log_float", "string": "variable_log_string"}
+
+
+def get_log_delta(kind: str, id_var: int, since_ms: int, until_ms: int) -> pd.DataFrame:
+    """
+    Raw rows of one variable with since_ms < date <= until_ms, in order.
+    NaN floats are dropped. COLUMNS: date (epoch ms), value.
+    """
+    not_nan = "AND value = value -- Filter out NaN" if kind == "float" else ""
+    sql_query = f"""
+    SELECT CAST(date AS BIGINT) AS date, value
+    FROM {LOG_TABLES[kind]}
+    WHERE id_var = :id_var
+      AND CAST(date AS BIGINT) > :since_ms
+      AND CAST(date AS BIGINT) <= :until_ms
+      {not_nan}
+    ORDER BY date;
+    """
+    df = run_query_data(sql_query, {"id_var": id_var, "since_ms": since_ms, "until_ms": until_ms})
+    if df.empty:
+        return pd.DataFrame(columns=['date', 'value'])
+    return df
+
+
+def get_per_second_delta(since_s: int, until_ms: int) -> pd.DataFrame:
+    """Distinct variable count of every second from since_s (epoch s) on. Indexed by epoch second."""
+    return _fetch_per_second_frame(since_s * 1000, until_ms)
+
+
+# ----------------------------------------------------------------------
+# 📦 MULTI-RANGE VARIANTS (one scan of the union of overlapping ranges)
+# ----------------------------------------------------------------------
+
+def _range_bounds(ranges: list) -> tuple:
+    """Bounds in ms of each (from, until) range, and of their union."""
+    bounds = [_prepare_date_timestamps(f, u) for f, u in ranges]
+    return bounds, min(b[0] for b in bounds), max(b[1] for b in bounds)
+
+
+def get_state_times_multi(ranges: list) -> list:
+    """
+    get_state_times for several (from, until) ranges: the union is classified
+    once and the timeline is clipped to each range.
+    """
+    bounds, ms_start, ms_end = _range_bounds(ranges)
+    timeline = _fetch_state_timeline(ms_start, ms_end)
+
+    results = []
+    for start, end in bounds:
+        lo = timeline['start_s'].clip(lower=start // 1000)
+        hi = timeline['end_s'].clip(upper=end // 1000 + 1)
+        seconds = (hi - lo).clip(lower=0).groupby(timeline['state']).sum()
+        hours = seconds[seconds > 0] / 3600.0
+        results.append(pd.DataFrame({'state': hours.index, 'total_hours': hours.to_numpy(dtype=float)}))
+    return results
+
+
+def get_machine_alarms_multi(ranges: list) -> list:
+    """
+    get_machine_alarms for several (from, until) ranges: incidents of the union
+    are built once, each range keeps the incidents starting inside it.
+    """
+    bounds, ms_start, ms_end = _range_bounds(ranges)
+    incidents = _fetch_alarm_incidents(ms_start, ms_end)
+
+    results = []
+    for start, end in bounds:
+        inside = incidents[(incidents['start_s'] >= start // 1000) & (incidents['start_s'] <= end // 1000)]
+        df = (
+            inside.groupby(['alarm_code', 'alarm_text'])['start_s']
+            .agg(occurrence_count='size', last_seen='max')
+            .reset_index()
+            .sort_values('occurrence_count', ascending=False)
+        )
+        df['last_seen'] = pd.to_datetime(df['last_seen'], unit='s', utc=True)
+        results.append(df.reset_index(drop=True))
+    return results
+
+
+def get_energy_consumption_multi(ranges: list) -> list:
+    """
+    get_energy_consumption for several (from, until) ranges, in one scan of
+    their union (see _fetch_daily_energy: same result as one call per range).
+    """
+    bounds, _, _ = _range_bounds(ranges)
+    daily = _fetch_daily_energy(bounds)
+
+    results = []
+    for i in range(len(bounds)):
+        if daily.empty:
+            results.append(pd.DataFrame(columns=['date', 'total_energy_kwh']))
+            continue
+        df = daily[daily['range_idx'] == i].drop(columns='range_idx').reset_index(drop=True)
+        results.append(df if not df.empty else pd.DataFrame(columns=['date', 'total_energy_kwh']))
+    return results
+
+
+# ----------------------------------------------------------------------
+# 🚿 STREAMING EXPORTS (DataFrame chunks, flat memory for any range)
+# ----------------------------------------------------------------------
+
+def iter_stoppages(from_date: str, until_date: str, min_gap_sec: int = 300):
+    """
+    Yields the stops of get_stoppages chunk by chunk while the cursor is
+    still fetching (ordered by id_var, then time).
+    """
+    detector = StoppageDetector(min_gap_sec)
+    for _ in _iter_stoppage_chunks(from_date, until_date, detector):
+        df = detector.drain_stops()
+        if not df.empty:
+            yield df
+
+
+def iter_alarm_incidents(from_date: str, until_date: str, chunksize: int = 50000):
+    """
+    Yields one row per alarm incident (start, end, alarm_code, alarm_text,
+    duration_sec), built incrementally from the raw 447 entries, so the
+    full history can be exported without materialising it.
+    """
+    ms_start, ms_end = _prepare_date_timestamps(from_date, until_date)
+
+    sql_query = """
+    SELECT CAST(date AS BIGINT) AS date, value
+    FROM variable_log_string
+    WHERE id_var = 447
+      AND CAST(date AS BIGINT) >= :ms_start
+      AND CAST(date AS BIGINT) <= :ms_end
+    ORDER BY date;
+    """
+    params = {"ms_start": ms_start, "ms_end": ms_end}
+
+    def to_frame(closed: list) -> pd.DataFrame:
+        df = pd.DataFrame([e[1:] for e in closed], columns=['alarm_code', 'alarm_text', 'start', 'end'])
+        df['duration_sec'] = (df['end'] - df['start']) / 1000.0
+        df['start'] = pd.to_datetime(df['start'], unit='ms')
+        df['end'] = pd.to_datetime(df['end'], unit='ms')
+        return df[['start', 'end', 'alarm_code', 'alarm_text', 'duration_sec']]
+
+    tracker = AlarmIncidentTracker(ALARM_NOISE_PATTERN)
+    for chunk in iter_query_data(sql_query, params, chunksize=chunksize):
+        closed = []
+        for date_ms, value in zip(chunk['date'].to_numpy(dtype=np.int64), chunk['value']):
+            closed.extend(e for e in tracker.feed(int(date_ms), value) if e[0] == "close")
+        if closed:
+            yield to_frame(closed)
+
+    closed = tracker.close_all()
+    if closed:
+        yield to_frame(closed)
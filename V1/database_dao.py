@@ -1,7 +1,17 @@
+import logging
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
 import yaml
 import pandas as pd
 from sqlalchemy import create_engine, text
 
+from metrics import POOL_CHECKOUT_WAIT, register_pool
+from query_stats import QUERY_LOGGER, QUERY_STATS
+
 # Reading the config.yaml file
 try:
     with open("config.yaml", "r") as file:
@@ -10,49 +20,239 @@ except FileNotFoundError:
     print("config.yaml not found. Database connection will fail.")
     DB_CONFIG = {}
 
-def get_engine():
-    """Creates a SQLAlchemy connection to the PostgreSQL database."""
+# 'postgresql' (default) or 'duckdb' (Parquet snapshots under PARQUET_ROOT, see duckdb_backend.py)
+DB_BACKEND = DB_CONFIG.get('DB_BACKEND', 'postgresql')
+
+# Calls slower than SLOW_QUERY_MS get an EXPLAIN (ANALYZE, BUFFERS) with probability EXPLAIN_SAMPLE_RATE
+SLOW_QUERY_MS = DB_CONFIG.get('SLOW_QUERY_MS', 1000)
+EXPLAIN_SAMPLE_RATE = DB_CONFIG.get('EXPLAIN_SAMPLE_RATE', 0.0)
+
+# One JSON line per query call (see query_stats.py)
+if DB_CONFIG.get('QUERY_LOG_FILE'):
+    _handler = logging.FileHandler(DB_CONFIG['QUERY_LOG_FILE'])
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    QUERY_LOGGER.addHandler(_handler)
+    QUERY_LOGGER.setLevel(logging.INFO)
+
+_ENGINE = None
+_ENGINE_LOCK = threading.Lock()
+
+# Per-thread switch of raise_query_errors()
+_STRICT = threading.local()
+
+@contextmanager
+def raise_query_errors():
+    """
+    Within the block (current thread only), run_query_data and execute_sql_command
+    re-raise query errors instead of returning an empty DataFrame / False.
+    Used where a failure must not pass for an empty result: API responses and
+    the result caches.
+    """
+    previous = getattr(_STRICT, "enabled", False)
+    _STRICT.enabled = True
     try:
-        # Construct the database URL using credentials from config.yaml
-        db_url = f"postgresql+psycopg2://{DB_CONFIG.get('DB_USER')}:{DB_CONFIG.get('DB_PASSWORD')}@" \
-                 f"{DB_CONFIG.get('DB_HOST')}:{DB_CONFIG.get('DB_PORT')}/{DB_CONFIG.get('DB_NAME')}"
-        
-        # Create the engine object
-        engine = create_engine(db_url)
-        return engine
-    except Exception as e:
-        print(f"Database connection failed - {e}")
-        # Re-raise the exception to be handled by the calling function
-        raise
+        yield
+    finally:
+        _STRICT.enabled = previous
+
+def _strict() -> bool:
+    return getattr(_STRICT, "enabled", False)
 
-def run_query_data(sql_query: str, params: dict) -> pd.DataFrame:
+def get_engine():
+    """
+    Returns the shared SQLAlchemy engine of the process.
+    It is created once with a connection pool, so long-running processes
+    (Streamlit, API server) reuse warm connections instead of reconnecting.
+    """
+    global _ENGINE
+    if _ENGINE is not None:
+        return _ENGINE
+
+    with _ENGINE_LOCK:
+        if _ENGINE is not None:
+            return _ENGINE
+        try:
+            # Construct the database URL using credentials from config.yaml
+            db_url = f"postgresql+psycopg2://{DB_CONFIG.get('DB_USER')}:{DB_CONFIG.get('DB_PASSWORD')}@" \
+                     f"{DB_CONFIG.get('DB_HOST')}:{DB_CONFIG.get('DB_PORT')}/{DB_CONFIG.get('DB_NAME')}"
+
+            # Create the engine object (pool sizes can be tuned in config.yaml)
+            _ENGINE = create_engine(
+                db_url,
+                pool_size=DB_CONFIG.get('DB_POOL_SIZE', 5),
+                max_overflow=DB_CONFIG.get('DB_MAX_OVERFLOW', 10),
+                pool_pre_ping=True,
+            )
+            pool = _ENGINE.pool
+            register_pool(lambda: {"size": pool.size(), "checked_out": pool.checkedout(), "overflow": max(pool.overflow(), 0)})
+            return _ENGINE
+        except Exception as e:
+            print(f"Database connection failed - {e}")
+            # Re-raise the exception to be handled by the calling function
+            raise
+
+def _connect(engine):
+    """Checks a connection out of the pool, timing the wait (pool exhausted, pre-ping)."""
+    with POOL_CHECKOUT_WAIT.time():
+        return engine.connect()
+
+def _query_name(depth: int = 2) -> str:
+    """Name under which a query is instrumented: the function that called the DAO."""
+    return sys._getframe(depth).f_code.co_name
+
+def _sample_slow_query(name: str, sql_query: str, params: dict, wall_ms: float) -> None:
+    """
+    For a sampled share of the slow calls (SLOW_QUERY_MS, EXPLAIN_SAMPLE_RATE in
+    config.yaml), re-runs the query under EXPLAIN (ANALYZE, BUFFERS) in a
+    background thread and keeps the plan. Off by default (rate 0).
+    """
+    if DB_BACKEND != 'postgresql' or wall_ms < SLOW_QUERY_MS or random.random() >= EXPLAIN_SAMPLE_RATE:
+        return
+
+    def explain():
+        try:
+            with _connect(get_engine()) as connection:
+                rows = connection.execute(text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql_query), params).fetchall()
+            QUERY_STATS.record_plan(name, wall_ms, rows[0][0])
+        except Exception as e:
+            print(f"EXPLAIN failed for {name}: {e}")
+
+    threading.Thread(target=explain, name=f"explain-{name}", daemon=True).start()
+
+def run_query_data(sql_query: str, params: dict, query_name: str = None) -> pd.DataFrame:
     """
     Executes a SELECT query with parameters and returns a DataFrame.
+    Every call is recorded in QUERY_STATS under `query_name` (default: the
+    calling function), with its execute / fetch / DataFrame build times.
     """
+    name = query_name or _query_name()
+    t_start = time.perf_counter()
+    t_execute = t_fetch = t_start
+    df = None
     try:
+        if DB_BACKEND == 'duckdb':
+            import duckdb_backend
+            # DuckDB materialises the result directly as a DataFrame (all counted as execute)
+            df = duckdb_backend.run_query(DB_CONFIG, sql_query, params)
+            t_execute = t_fetch = time.perf_counter()
+            return df
+
         engine = get_engine()
-        with engine.connect() as connection:
+        with _connect(engine) as connection:
             # Use text() to secure the raw query against SQL injection
-            # read_sql_query handles the execution and DataFrame creation
-            df = pd.read_sql_query(text(sql_query), connection, params=params)
+            result = connection.execute(text(sql_query), params)
+            t_execute = time.perf_counter()
+            rows = result.fetchall()
+            t_fetch = time.perf_counter()
+            # Same conversion as pd.read_sql_query (Decimal -> float)
+            df = pd.DataFrame.from_records(rows, columns=list(result.keys()), coerce_float=True)
         return df
 
     except Exception as e:
         # Return an empty DataFrame on error to prevent the main application from crashing
         print(f"SQLAlchemy Error (SELECT): {e}")
+        if _strict():
+            raise
         return pd.DataFrame()
 
-def execute_sql_command(sql_command: str):
+    finally:
+        t_end = time.perf_counter()
+        wall_ms = (t_end - t_start) * 1000
+        QUERY_STATS.record(
+            name, "select", wall_ms,
+            execute_ms=(t_execute - t_start) * 1000,
+            fetch_ms=(t_fetch - t_execute) * 1000,
+            build_ms=(t_end - t_fetch) * 1000 if df is not None else 0.0,
+            rows=len(df) if df is not None else 0,
+            nbytes=int(df.memory_usage(index=False).sum()) if df is not None else 0,
+            error=df is None,
+        )
+        if df is not None:
+            _sample_slow_query(name, sql_query, params, wall_ms)
+
+def execute_sql_command(sql_command: str, query_name: str = None):
     """
     Executes an SQL command (INSERT, UPDATE, DELETE) that does not return data.
     """
+    name = query_name or _query_name()
+    t_start = time.perf_counter()
+    ok = False
     try:
+        if DB_BACKEND == 'duckdb':
+            import duckdb_backend
+            duckdb_backend.execute_command(DB_CONFIG, sql_command)
+            ok = True
+            return True
+
         engine = get_engine()
-        with engine.connect() as connection:
+        with _connect(engine) as connection:
             # Execute the command and commit the transaction to the database
             connection.execute(text(sql_command))
             connection.commit()
+        ok = True
         return True
     except Exception as e:
         print(f" ERROR: SQL command failed - {e}")
-        return False
\ No newline at end of file
+        if _strict():
+            raise
+        return False
+    finally:
+        wall_ms = (time.perf_counter() - t_start) * 1000
+        QUERY_STATS.record(name, "command", wall_ms, execute_ms=wall_ms, error=not ok)
+
+def iter_query_data(sql_query: str, params: dict, chunksize: int = 50000, query_name: str = None):
+    """
+    Executes a SELECT query with a server-side cursor and yields DataFrame chunks,
+    so that long ranges can be processed without loading every row in memory.
+    Recorded in QUERY_STATS when the stream ends: fetch_ms is the time spent
+    waiting for chunks, wall_ms also includes the time of the consumer.
+    Unlike run_query_data, a query error is raised to the consumer (after the
+    chunks already yielded), so a truncated stream never looks complete.
+    """
+    name = query_name or _query_name()
+    t_start = time.perf_counter()
+    fetch_s = 0.0
+    rows = nbytes = 0
+    ok = False
+    try:
+        if DB_BACKEND == 'duckdb':
+            import duckdb_backend
+            chunks = duckdb_backend.iter_query(DB_CONFIG, sql_query, params, chunksize)
+            connection = None
+        else:
+            engine = get_engine()
+            connection = _connect(engine)
+            # stream_results=True keeps the rows on the server until they are fetched
+            chunks = pd.read_sql_query(text(sql_query), connection.execution_options(stream_results=True),
+                                       params=params, chunksize=chunksize)
+        try:
+            while True:
+                t_wait = time.perf_counter()
+                chunk = next(chunks, None)
+                fetch_s += time.perf_counter() - t_wait
+                if chunk is None:
+                    break
+                rows += len(chunk)
+                nbytes += int(chunk.memory_usage(index=False).sum())
+                yield chunk
+        finally:
+            chunks.close()
+            if connection is not None:
+                connection.close()
+        ok = True
+
+    except GeneratorExit:
+        # The consumer stopped early (client gone, break): not an error
+        ok = True
+        raise
+
+    except Exception as e:
+        # Re-raised: a stream cut short must not look like a complete result
+        print(f"SQLAlchemy Error (STREAM): {e}")
+        raise
+
+    finally:
+        QUERY_STATS.record(
+            name, "stream", (time.perf_counter() - t_start) * 1000,
+            fetch_ms=fetch_s * 1000, rows=rows, nbytes=nbytes, error=not ok,
+        )
\ No newline at end of file
@@ -0,0 +1,97 @@
+import os
+import re
+import threading
+
+import duckdb
+
+# ----------------------------------------------------------------------
+# Embedded DuckDB backend of database_dao (DB_BACKEND: duckdb in config.yaml).
+# The log tables are views over day-partitioned Parquet snapshots:
+#   <PARQUET_ROOT>/variable_log_float/day=YYYY-MM-DD/*.parquet
+#   <PARQUET_ROOT>/variable_log_string/day=YYYY-MM-DD/*.parquet
+# (layout written by synthetic_data.py and the Parquet exporter), so the
+# service functions run unchanged on a laptop or in CI, without PostgreSQL.
+# Files are sorted by date: the min/max statistics of their row groups let
+# DuckDB skip everything outside the requested range.
+# ----------------------------------------------------------------------
+
+LOG_TABLES = ["variable_log_float", "variable_log_string"]
+
+_CONNECTION = None
+_CONNECTION_LOCK = threading.Lock()
+_LOCAL = threading.local()   # per-thread cursor
+
+
+def _configure(connection) -> None:
+    # Same conventions as the PostgreSQL side: UTC timestamps, tables under public
+    connection.execute("SET TimeZone = 'UTC'")
+    connection.execute("SET search_path = 'public,main'")
+
+
+def _database(config: dict):
+    """Opens the process-wide database once and creates the log table views."""
+    global _CONNECTION
+    if _CONNECTION is not None:
+        return _CONNECTION
+
+    with _CONNECTION_LOCK:
+        if _CONNECTION is None:
+            connection = duckdb.connect(config.get('DUCKDB_PATH', ':memory:'))
+            connection.execute("CREATE SCHEMA IF NOT EXISTS public")
+            _configure(connection)
+            root = config.get('PARQUET_ROOT', 'parquet')
+            for table in LOG_TABLES:
+                pattern = os.path.join(root, table, "*", "*.parquet")
+                connection.execute(f"""
+                    CREATE OR REPLACE VIEW public.{table} AS
+                    SELECT date, id_var, value
+                    FROM read_parquet('{pattern}', hive_partitioning = true)
+                """)
+            _CONNECTION = connection
+    return _CONNECTION
+
+
+def _new_cursor(config: dict):
+    cursor = _database(config).cursor()
+    _configure(cursor)
+    return cursor
+
+
+def get_connection(config: dict):
+    """
+    Returns the DuckDB connection of the calling thread: a cursor on the shared
+    database, as a DuckDB connection must not be used by two threads at once.
+    """
+    cursor = getattr(_LOCAL, "cursor", None)
+    if cursor is None:
+        cursor = _new_cursor(config)
+        _LOCAL.cursor = cursor
+    return cursor
+
+
+def to_duckdb_params(sql_query: str, params: dict) -> str:
+    """Rewrites the SQLAlchemy :name placeholders of the given params into DuckDB $name ones."""
+    if not params:
+        return sql_query
+    names = "|".join(re.escape(name) for name in sorted(params, key=len, reverse=True))
+    return re.sub(rf"(?<![:\w]):({names})\b", r"$\1", sql_query)
+
+
+def run_query(config: dict, sql_query: str, params: dict):
+    cursor = get_connection(config)
+    return cursor.execute(to_duckdb_params(sql_query, params), params or {}).df()
+
+
+def iter_query(config: dict, sql_query: str, params: dict, chunksize: int):
+    # Own cursor: other queries of the thread must not cancel a pending stream
+    cursor = _new_cursor(config)
+    try:
+        reader = cursor.execute(to_duckdb_params(sql_query, params), params or {}).fetch_record_batch(chunksize)
+        for batch in reader:
+            yield batch.to_pandas()
+    finally:
+        cursor.close()
+
+
+def execute_command(config: dict, sql_command: str) -> None:
+    get_connection(config).execute(sql_command)
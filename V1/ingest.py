@@ -0,0 +1,193 @@
+import argparse
+import csv
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from database_dao import get_engine
+from metrics import record_ingest
+
+# ----------------------------------------------------------------------
+# Bulk loader for exported logs (data/*.csv, data/*.xlsx) into
+# variable_log_float / variable_log_string, through COPY.
+#
+#   python ingest.py string "../data/Data - variable_log_string.csv"
+#   python ingest.py float  export_float.xlsx --workers 4 --batch-size 100000
+#
+# Files are read as a stream; rows are grouped in batches and every batch is
+# COPY'd (and committed) by one of the workers on its own pooled connection.
+# ----------------------------------------------------------------------
+
+TABLES = {
+    "float": "variable_log_float",
+    "string": "variable_log_string",
+}
+
+TIMESTAMP_FMT = "%Y-%m-%d %H:%M:%S"
+
+
+def to_epoch_ms(timestamp: str) -> int:
+    """'YYYY-MM-DD HH:MM:SS[.fff]' (UTC, like the rest of the project) -> epoch ms."""
+    timestamp = timestamp.strip()
+    fmt = TIMESTAMP_FMT + ".%f" if "." in timestamp else TIMESTAMP_FMT
+    dt = datetime.strptime(timestamp, fmt).replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def _parse_log_row(fields: list, kind: str):
+    """[timestamp, id_var, value] -> (date_ms, id_var, value), or None for the header."""
+    if not fields or fields[0].strip().lower() in ("timestamp", "date"):
+        return None
+    timestamp, id_var, value = fields[0], fields[1], fields[2] if len(fields) > 2 else ""
+    if kind == "float":
+        value = float(value) if str(value).strip() != "" else None
+    return to_epoch_ms(str(timestamp)), int(id_var), value
+
+
+def iter_csv_rows(path: str, kind: str):
+    """
+    Streams (date_ms, id_var, value) from a CSV export. Two shapes are read:
+    - plain 'timestamp,id_var,value' files
+    - the spreadsheet export of data/, where every line is ONE quoted field
+      holding the real CSV line, followed by ';;;'
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        nested = f.readline().rstrip("\r\n").endswith(";;;")
+        f.seek(0)
+        if nested:
+            # Nested export: unwrap the inner CSV line of every outer record
+            lines = (outer[0] for outer in csv.reader(f, delimiter=";") if outer)
+            reader = (next(csv.reader([line])) for line in lines)
+        else:
+            reader = csv.reader(f)
+
+        for fields in reader:
+            row = _parse_log_row(fields, kind)
+            if row is not None:
+                yield row
+
+
+def iter_xlsx_rows(path: str, kind: str):
+    """
+    Streams (date_ms, id_var, value) from an .xlsx log export (read-only mode,
+    one row at a time). Rows stored as a single CSV text cell are unwrapped.
+    """
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise SystemExit("Reading .xlsx files requires openpyxl (pip install openpyxl).")
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = None
+        for cells in rows:
+            cells = [c for c in cells if c is not None]
+            if not cells:
+                continue
+            if len(cells) == 1 and isinstance(cells[0], str):
+                cells = next(csv.reader([cells[0]]))
+            if header is None:
+                header = [str(c).strip().lower() for c in cells]
+                if header[:3] not in (["timestamp", "id_var", "value"], ["date", "id_var", "value"]):
+                    raise ValueError(
+                        f"{path} is not a log export (expected columns timestamp, id_var, value; got {header})."
+                    )
+                continue
+            if isinstance(cells[0], datetime):
+                cells[0] = cells[0].strftime(TIMESTAMP_FMT)
+            row = _parse_log_row([str(c) if not isinstance(c, (int, float)) else c for c in cells], kind)
+            if row is not None:
+                yield row
+    finally:
+        workbook.close()
+
+
+def iter_file_rows(path: str, kind: str):
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        return iter_xlsx_rows(path, kind)
+    return iter_csv_rows(path, kind)
+
+
+def _batches(rows, batch_size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def copy_rows(cursor, table: str, rows: list) -> None:
+    """COPYs (date_ms, id_var, value) rows through an open cursor (the caller commits)."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} (date, id_var, value) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def copy_batch(table: str, batch: list) -> int:
+    """COPYs one batch in its own transaction, on a pooled connection."""
+    connection = get_engine().raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            copy_rows(cursor, table, batch)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    record_ingest(table, len(batch), max(row[0] for row in batch))
+    return len(batch)
+
+
+def load_file(path: str, kind: str, batch_size: int = 50000, workers: int = 4, dry_run: bool = False) -> int:
+    """
+    Loads one export into its log table. At most `workers` batches are in
+    flight (plus one being parsed), so memory stays bounded for any file size.
+    """
+    table = TABLES[kind]
+    start = time.monotonic()
+    loaded = 0
+
+    if dry_run:
+        loaded = sum(1 for _ in iter_file_rows(path, kind))
+        print(f"[dry-run] {loaded} rows parsed from {path} in {time.monotonic() - start:.1f}s.")
+        return loaded
+
+    slots = threading.Semaphore(workers)
+    futures = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch in _batches(iter_file_rows(path, kind), batch_size):
+            slots.acquire()
+            future = executor.submit(copy_batch, table, batch)
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+        for future in futures:
+            loaded += future.result()
+
+    elapsed = time.monotonic() - start
+    rate = loaded / elapsed * 60 if elapsed > 0 else 0
+    print(f"{loaded} rows loaded into {table} in {elapsed:.1f}s ({rate:,.0f} rows/min).")
+    return loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-load exported log files into the log tables (COPY).")
+    parser.add_argument("kind", choices=list(TABLES), help="'float' -> variable_log_float, 'string' -> variable_log_string.")
+    parser.add_argument("files", nargs="+", help="CSV or XLSX exports (timestamp, id_var, value).")
+    parser.add_argument("--batch-size", type=int, default=50000, help="Rows per COPY batch.")
+    parser.add_argument("--workers", type=int, default=4, help="Batches loaded in parallel.")
+    parser.add_argument("--dry-run", action="store_true", help="Parse the files without loading them.")
+    args = parser.parse_args()
+
+    for file_path in args.files:
+        try:
+            load_file(file_path, args.kind, args.batch_size, args.workers, args.dry_run)
+        except ValueError as e:
+            print(f"Skipped: {e}")
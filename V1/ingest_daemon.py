@@ -0,0 +1,470 @@
+import argparse
+import copy
+import csv
+import os
+import socketserver
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from alarm_incidents import AlarmIncidentTracker
+from daily_kpi import setup_daily_kpi
+from data_service import ALARM_NOISE_PATTERN, KPI_STATE_COLUMNS, KPI_TABLE, SECONDS_PER_DAY
+from database_dao import execute_sql_command, get_engine, run_query_data
+from ingest import TABLES, _parse_log_row, copy_rows
+from live import ALARM_VARIABLE, ENERGY_VARIABLE, EnergyAccumulator
+from metrics import record_ingest
+from rollups import PYRAMID_LEVELS, rollup_table, setup_pyramid
+from state_models import OnlineDistinctCount
+from watermarks import DAILY_KPI, DERIVED, ROLLUPS, get_watermark, lock_derived, setup_watermarks
+
+# ----------------------------------------------------------------------
+# Real-time ingestion: follows the CNC feed and loads it in micro-batches.
+# Feed lines are CSV:  kind,timestamp,id_var,value   (kind = float | string)
+#
+#   python ingest_daemon.py file feed.csv            (tail -f, survives rotation / truncation)
+#   python ingest_daemon.py socket --port 9009       (TCP, one line per row, any number of senders)
+#
+# A batch is flushed when it holds --batch-size rows or its oldest row has
+# waited --max-wait seconds. Each batch is ONE transaction:
+#   - COPY into variable_log_float / variable_log_string   (ingest.copy_rows)
+#   - per-second counts: every level of the rollup pyramid (rollups.py), merged
+#   - alarm_events: incidents of 447 opened / closed by the batch
+#   - daily_kpi: state seconds and kWh added to their day (daily_kpi.py)
+# The running classifier / energy / alarm state only moves forward when the
+# transaction commits; a failed batch is retried with the next one.
+# A batch the database rejects for its data (bad value, constraint violation)
+# MAX_RETRIES times in a row is split in halves until the rejected rows are
+# isolated: those go to the dead-letter file (--dead-letter, feed format, can
+# be replayed with 'file --from-start' once fixed), the others are loaded.
+# Any other error (connection lost, timeout, ...) keeps the rows at the head
+# of the buffer, retried until they load.
+# Rows older than the last classified second (or, for the energy, than the
+# last load sample) still reach the log and the pyramid but not the KPIs
+# ('python daily_kpi.py refresh --from <day>' redoes them).
+#
+# Order: build the history first ('python rollups.py build', then
+# 'python daily_kpi.py build'), then start the daemon, which only adds to
+# those tables. Their 'refresh' may run alongside it: each batch takes the
+# advisory locks of the derived tables (watermarks.py), so a refresh and a
+# batch wait for each other instead of overwriting each other's rows.
+# ----------------------------------------------------------------------
+
+ALARM_EVENTS_TABLE = "alarm_events"
+RETRY_SEC = 5
+MAX_RETRIES = 3   # failures of a batch before it is split to isolate the rows the database rejects
+# SQLSTATE classes of the errors caused by the rows themselves:
+# 22 data exception (psycopg2.DataError), 23 integrity constraint violation (psycopg2.IntegrityError)
+DATA_ERROR_CLASSES = ("22", "23")
+
+
+def setup_alarm_events():
+    """Creates the alarm incident table (no-op if it already exists)."""
+    execute_sql_command(f"""
+        CREATE TABLE IF NOT EXISTS {ALARM_EVENTS_TABLE} (
+            alarm_code  TEXT   NOT NULL,
+            alarm_text  TEXT   NOT NULL,
+            start_ms    BIGINT NOT NULL,
+            end_ms      BIGINT,            -- NULL while the incident is open
+            PRIMARY KEY (alarm_code, alarm_text, start_ms)
+        );
+    """)
+    execute_sql_command(
+        f"CREATE INDEX IF NOT EXISTS idx_{ALARM_EVENTS_TABLE}_open ON {ALARM_EVENTS_TABLE} (start_ms) WHERE end_ms IS NULL;"
+    )
+
+
+def is_data_error(error: Exception) -> bool:
+    """True if the database rejected the rows themselves; anything else is worth a retry."""
+    return (getattr(error, "pgcode", None) or "")[:2] in DATA_ERROR_CLASSES
+
+
+def parse_feed_line(line: str):
+    """'kind,timestamp,id_var,value' -> (kind, (date_ms, id_var, value)), or None for a header / blank line."""
+    fields = next(csv.reader([line]), [])
+    if not fields or fields[0].strip() not in TABLES:
+        return None
+    row = _parse_log_row(fields[1:], fields[0].strip())
+    return (fields[0].strip(), row) if row is not None else None
+
+
+def format_feed_line(kind: str, row: tuple) -> list:
+    """(kind, (date_ms, id_var, value)) -> the fields of its feed line (inverse of parse_feed_line)."""
+    date_ms, id_var, value = row
+    timestamp = datetime.fromtimestamp(date_ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    return [kind, timestamp, id_var, "" if value is None else value]
+
+
+class RollingAggregates:
+    """
+    Online state derived from the feed, and the SQL that applies one batch
+    of it: pyramid merges, alarm incidents and daily KPI increments.
+    """
+
+    def __init__(self):
+        self.classifier = OnlineDistinctCount()
+        self.energy = EnergyAccumulator()
+        self.alarms = AlarmIncidentTracker(ALARM_NOISE_PATTERN)
+        self.carry_sec = None     # last second seen, held back until the feed moves past it
+        self.carry_vars = set()
+
+    def restore_open_incidents(self) -> None:
+        """Reopens the incidents left open by the previous run."""
+        df = run_query_data(
+            f"SELECT alarm_code, alarm_text, start_ms FROM {ALARM_EVENTS_TABLE} WHERE end_ms IS NULL;", {},
+            query_name="ingest_daemon_restore",
+        )
+        for code, text, start_ms in df.itertuples(index=False):
+            self.alarms.open_incidents[(code, text)] = int(start_ms)
+
+    # --- per-second counts: rollup pyramid ---------------------------------
+
+    def apply_pyramid(self, cursor, float_rows: list) -> None:
+        from psycopg2.extras import execute_values   # PostgreSQL only, like the whole daemon
+        df = pd.DataFrame(float_rows, columns=['date', 'id_var', 'value']).dropna(subset=['value'])
+        if df.empty:
+            return
+        df['value'] = df['value'].astype(float)
+        df['sec'] = df['date'] // 1000
+        for level, size in PYRAMID_LEVELS:
+            agg = (
+                df.assign(bucket=(df['sec'] // size) * size)
+                .groupby(['id_var', 'bucket'])['value']
+                .agg(['min', 'max', 'sum', 'count'])
+                .reset_index()
+            )
+            table = rollup_table(level)
+            execute_values(cursor, f"""
+                INSERT INTO {table} (id_var, bucket, min_value, max_value, sum_value, n_samples)
+                VALUES %s
+                ON CONFLICT (id_var, bucket) DO UPDATE SET
+                    min_value = LEAST({table}.min_value, EXCLUDED.min_value),
+                    max_value = GREATEST({table}.max_value, EXCLUDED.max_value),
+                    sum_value = {table}.sum_value + EXCLUDED.sum_value,
+                    n_samples = {table}.n_samples + EXCLUDED.n_samples;
+            """, [(int(i), int(b), float(lo), float(hi), float(s), int(n)) for i, b, lo, hi, s, n in agg.itertuples(index=False)],
+                page_size=1000)
+
+    # --- alarm incidents ---------------------------------------------------
+
+    def apply_alarms(self, cursor, string_rows: list) -> None:
+        from psycopg2.extras import execute_values
+        opened, closed = [], []
+        for date_ms, id_var, value in string_rows:
+            if id_var != ALARM_VARIABLE:
+                continue
+            for event in self.alarms.feed(date_ms, value):
+                if event[0] == "open":
+                    opened.append(event[1:])
+                else:
+                    closed.append(event[1:])
+
+        if opened:
+            execute_values(cursor, f"""
+                INSERT INTO {ALARM_EVENTS_TABLE} (alarm_code, alarm_text, start_ms) VALUES %s
+                ON CONFLICT DO NOTHING;
+            """, opened)
+        if closed:
+            # Incidents opened before the daemon started are inserted closed
+            execute_values(cursor, f"""
+                INSERT INTO {ALARM_EVENTS_TABLE} (alarm_code, alarm_text, start_ms, end_ms) VALUES %s
+                ON CONFLICT (alarm_code, alarm_text, start_ms) DO UPDATE SET end_ms = EXCLUDED.end_ms;
+            """, closed)
+
+    # --- daily KPIs --------------------------------------------------------
+
+    def _state_seconds_by_day(self, float_rows: list, final: bool) -> dict:
+        """Classifies the complete seconds of the batch; returns {day: {state: seconds}}."""
+        per_sec = defaultdict(set)
+        if self.carry_sec is not None:
+            per_sec[self.carry_sec] = set(self.carry_vars)
+        last_classified = self.classifier.last_sec
+        for date_ms, id_var, _ in float_rows:
+            sec = date_ms // 1000
+            if last_classified is None or sec > last_classified:
+                per_sec[sec].add(id_var)
+
+        secs = sorted(per_sec)
+        self.carry_sec, self.carry_vars = None, set()
+        if secs and not final:
+            # The last second may continue in the next batch
+            self.carry_sec = secs.pop()
+            self.carry_vars = per_sec[self.carry_sec]
+
+        seconds = defaultdict(lambda: defaultdict(int))
+        for start, end, state in self.classifier.feed(secs, [len(per_sec[s]) for s in secs]):
+            while start < end:
+                cut = min(end, (start // SECONDS_PER_DAY + 1) * SECONDS_PER_DAY)
+                seconds[date(1970, 1, 1) + timedelta(days=start // SECONDS_PER_DAY)][state] += cut - start
+                start = cut
+        return seconds
+
+    def apply_kpis(self, cursor, float_rows: list, final: bool = False) -> None:
+        from psycopg2.extras import execute_values
+        seconds = self._state_seconds_by_day(float_rows, final)
+        load = [(d, v) for d, i, v in float_rows if i == ENERGY_VARIABLE and v is not None and v == v]
+        energy = self.energy.feed(np.array([d for d, _ in load], dtype=np.int64),
+                                  np.array([v for _, v in load], dtype=float))
+
+        days = sorted(set(seconds) | set(energy))
+        if not days:
+            return
+        columns = list(KPI_STATE_COLUMNS.values())
+        values = [
+            (day, *[seconds[day].get(state, 0) / 3600.0 for state in KPI_STATE_COLUMNS], energy.get(day, 0.0))
+            for day in days
+        ]
+        increments = ",\n                ".join(f"{c} = {KPI_TABLE}.{c} + EXCLUDED.{c}" for c in columns + ["energy_kwh"])
+        execute_values(cursor, f"""
+            INSERT INTO {KPI_TABLE} (day, {', '.join(columns)}, energy_kwh) VALUES %s
+            ON CONFLICT (day) DO UPDATE SET
+                {increments},
+                updated_at = now();
+        """, values)
+
+
+class IngestDaemon:
+    def __init__(self, batch_size: int = 5000, max_wait_sec: float = 2.0, max_buffer: int = 200000,
+                 dead_letter_path: str = "ingest_dead_letter.csv"):
+        self.batch_size = batch_size
+        self.max_wait_sec = max_wait_sec
+        self.max_buffer = max_buffer
+        self.dead_letter_path = dead_letter_path
+        self.aggregates = RollingAggregates()
+        self.skipped = 0
+        self.dead_lettered = 0
+        self._failures = 0           # consecutive failures of the batch at the head of the buffer
+        self._rows = []              # (kind, row) waiting for the next flush
+        self._first_at = None        # arrival time of the oldest waiting row
+        self._stop = False
+        self._cond = threading.Condition()
+        self._flusher = threading.Thread(target=self._flush_loop, name="ingest-flush", daemon=True)
+
+    def start(self) -> "IngestDaemon":
+        setup_pyramid()
+        setup_daily_kpi()
+        setup_alarm_events()
+        setup_watermarks()
+        missing = [name for name in DERIVED if get_watermark(name) is None]
+        if missing:
+            print(f"Warning: {', '.join(missing)} not built yet, the daemon only adds the rows it loads "
+                  f"(run 'python rollups.py build' / 'python daily_kpi.py build' first).")
+        self.aggregates.restore_open_incidents()
+        self._flusher.start()
+        return self
+
+    # --- input -------------------------------------------------------------
+
+    def add_line(self, line: str) -> None:
+        try:
+            parsed = parse_feed_line(line)
+        except ValueError as e:
+            self.skipped += 1
+            print(f"Skipped line ({e}): {line.strip()[:200]}")
+            return
+        if parsed is None:
+            return
+        with self._cond:
+            # Backpressure: the source waits while the database is behind
+            while len(self._rows) >= self.max_buffer and not self._stop:
+                self._cond.wait()
+            self._rows.append(parsed)
+            if self._first_at is None:
+                self._first_at = time.monotonic()
+            if len(self._rows) >= self.batch_size:
+                self._cond.notify_all()
+
+    # --- micro-batches -----------------------------------------------------
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stop and len(self._rows) < self.batch_size and (
+                        self._first_at is None or time.monotonic() - self._first_at < self.max_wait_sec):
+                    timeout = self.max_wait_sec if self._first_at is None else \
+                        self.max_wait_sec - (time.monotonic() - self._first_at)
+                    self._cond.wait(max(timeout, 0.01))
+                batch, self._rows, self._first_at = self._rows, [], None
+                stopping = self._stop
+
+            if batch or stopping:   # the last flush also classifies the held-back second
+                try:
+                    self.write_batch(batch, final=stopping)
+                    self._failures = 0
+                except Exception as e:
+                    self._failures += 1
+                    left = batch
+                    if (self._failures >= MAX_RETRIES or stopping) and is_data_error(e):
+                        # The database keeps rejecting rows of the batch (or this is the last
+                        # flush): isolate them
+                        print(f"Batch of {len(batch)} rows failed {self._failures} times, splitting it: {e}")
+                        left = self._isolate(batch, stopping, e)
+                        if not left:
+                            self._failures = 0
+                    if left:
+                        print(f"Batch of {len(left)} rows failed, retried in {RETRY_SEC}s: {e}")
+                        with self._cond:
+                            self._rows = left + self._rows
+                            self._first_at = time.monotonic()
+                        if stopping:
+                            print(f"Stopped with {len(self._rows)} rows not loaded.")
+                            return
+                        time.sleep(RETRY_SEC)
+            with self._cond:
+                self._cond.notify_all()   # room in the buffer again
+                if stopping and not self._rows:
+                    return
+
+    def _isolate(self, batch: list, final: bool, error: Exception) -> list:
+        """
+        Writes the batch in halves, recursively, down to the rows the database
+        rejects on their own for a data error, which go to the dead-letter file.
+        Returns the rows not handled because of another error, from the first
+        one that failed that way (to be retried, in order).
+        """
+        if not is_data_error(error):
+            return batch
+        if len(batch) == 1:
+            self._dead_letter(batch, error)
+            return []
+        middle = len(batch) // 2
+        halves = [batch[:middle], batch[middle:]]
+        for i, half in enumerate(halves):
+            last = final and i == len(halves) - 1
+            try:
+                self.write_batch(half, final=last)
+            except Exception as e:
+                left = self._isolate(half, last, e)
+                if left:
+                    return left + [row for later in halves[i + 1:] for row in later]
+        return []
+
+    def _dead_letter(self, batch: list, error: Exception) -> None:
+        with open(self.dead_letter_path, "a", newline="") as f:
+            writer = csv.writer(f)
+            for kind, row in batch:
+                writer.writerow(format_feed_line(kind, row))
+        self.dead_lettered += len(batch)
+        print(f"{len(batch)} rows rejected by the database written to {self.dead_letter_path}: {error}")
+
+    def write_batch(self, batch: list, final: bool = False) -> None:
+        """Loads one micro-batch and its derived tables in a single transaction."""
+        rows = {kind: sorted((row for k, row in batch if k == kind), key=lambda r: r[0]) for kind in TABLES}
+        state = copy.deepcopy(self.aggregates)
+        start = time.monotonic()
+
+        connection = get_engine().raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                lock_derived(cursor, ROLLUPS, DAILY_KPI)
+                for kind, kind_rows in rows.items():
+                    if kind_rows:
+                        copy_rows(cursor, TABLES[kind], kind_rows)
+                state.apply_pyramid(cursor, rows["float"])
+                state.apply_alarms(cursor, rows["string"])
+                state.apply_kpis(cursor, rows["float"], final=final)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+        # Committed: the derived state moves forward
+        self.aggregates = state
+        for kind, kind_rows in rows.items():
+            if kind_rows:
+                record_ingest(TABLES[kind], len(kind_rows), kind_rows[-1][0])
+        if batch:
+            print(f"{len(batch)} rows ingested in {time.monotonic() - start:.2f}s "
+                  f"(float {len(rows['float'])}, string {len(rows['string'])}).")
+
+    def stop(self) -> None:
+        """Flushes what is buffered (last second included) and stops the flusher."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._flusher.join()
+
+
+# --- sources ----------------------------------------------------------------
+
+def follow_file(path: str, daemon: IngestDaemon, from_start: bool = False, poll_sec: float = 0.2) -> None:
+    """tail -f: feeds every complete line appended to `path`; reopens it when rotated or truncated."""
+    f, inode = None, None
+    pending = ""
+    while True:
+        if f is None:
+            try:
+                f = open(path, "r", encoding="utf-8", newline="")
+            except FileNotFoundError:
+                from_start = True   # created later: everything in it is new
+                time.sleep(poll_sec)
+                continue
+            inode = os.fstat(f.fileno()).st_ino
+            if not from_start:
+                f.seek(0, os.SEEK_END)
+            from_start = True   # a rotated file is read from its start
+
+        chunk = f.readline()
+        if chunk:
+            pending += chunk
+            if pending.endswith("\n"):
+                daemon.add_line(pending)
+                pending = ""
+            continue
+
+        time.sleep(poll_sec)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if stat.st_ino != inode or stat.st_size < f.tell():
+            f.close()
+            f, pending = None, ""
+
+
+def serve_socket(host: str, port: int, daemon: IngestDaemon) -> None:
+    """Newline-delimited feed over TCP, one thread per sender."""
+    class FeedHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for raw in self.rfile:
+                daemon.add_line(raw.decode("utf-8", errors="replace"))
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer((host, port), FeedHandler) as server:
+        print(f"Listening for the feed on {host}:{port}")
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Real-time ingestion of the CNC feed in micro-batches.")
+    sub = parser.add_subparsers(dest="source", required=True)
+    file_parser = sub.add_parser("file", help="Follow a growing file (tail -f).")
+    file_parser.add_argument("path", help="Feed file, one 'kind,timestamp,id_var,value' row per line.")
+    file_parser.add_argument("--from-start", action="store_true", help="Read the lines already in the file first.")
+    socket_parser = sub.add_parser("socket", help="Listen for the feed on a TCP socket.")
+    socket_parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on.")
+    socket_parser.add_argument("--port", type=int, default=9009, help="Port to listen on.")
+    for p in (file_parser, socket_parser):
+        p.add_argument("--batch-size", type=int, default=5000, help="Rows that trigger a flush.")
+        p.add_argument("--max-wait", type=float, default=2.0, help="Seconds a row may wait before a flush.")
+        p.add_argument("--max-buffer", type=int, default=200000, help="Rows buffered before the source is paused.")
+        p.add_argument("--dead-letter", default="ingest_dead_letter.csv",
+                       help="File receiving the rows the database rejects (feed format).")
+    args = parser.parse_args()
+
+    ingest_daemon = IngestDaemon(args.batch_size, args.max_wait, args.max_buffer, args.dead_letter).start()
+    try:
+        if args.source == "file":
+            follow_file(args.path, ingest_daemon, args.from_start)
+        else:
+            serve_socket(args.host, args.port, ingest_daemon)
+    except KeyboardInterrupt:
+        print("Stopping: flushing the buffered rows...")
+    finally:
+        ingest_daemon.stop()
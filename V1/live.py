@@ -0,0 +1,251 @@
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from alarm_incidents import AlarmIncidentTracker
+from data_service import ALARM_NOISE_PATTERN, SECONDS_PER_DAY, get_log_delta, get_per_second_delta
+from state_models import OnlineDistinctCount
+
+# ----------------------------------------------------------------------
+# Live mode: the current UTC day, updated incrementally.
+# Every refresh only asks for the rows newer than the watermark of each
+# input and folds them into running totals:
+#   - state hours : per-second distinct counts -> OnlineDistinctCount
+#   - energy      : variable 260 samples -> kWh (same formula as get_energy_consumption)
+#   - alarms      : variable 447 payloads -> AlarmIncidentTracker (open / closed incidents)
+# Rows arriving late for seconds already folded are not counted again.
+#
+# Refreshes return events (dicts), newest last:
+#   {"type": "state", "state": ..., "since_s": ...}
+#   {"type": "alarm_open", "alarm_code": ..., "alarm_text": ..., "start_ms": ...}
+#   {"type": "alarm_close", "alarm_code": ..., "alarm_text": ..., "start_ms": ..., "end_ms": ...}
+#   {"type": "energy", "kwh": ..., "at_ms": ...}
+# ----------------------------------------------------------------------
+
+ENERGY_VARIABLE = 260
+ALARM_VARIABLE = 447
+POWER_KW = 15.0
+
+# Silence after which the machine is shown as off (the gap itself is only
+# booked when the signal comes back, like in the historical model)
+SILENCE_SEC = 60
+
+
+class EnergyAccumulator:
+    """
+    kWh of the load samples fed in order: each 'on' interval counts (pct / 100) * POWER_KW * hours.
+    Samples not newer than the last one fed (late senders) are dropped.
+    """
+
+    def __init__(self, power_kw: float = POWER_KW):
+        self.power_kw = power_kw
+        self.kwh = 0.0
+        self._last = None   # (date_ms, pct) of the last sample
+
+    def feed(self, dates_ms: np.ndarray, values: np.ndarray) -> dict:
+        """Adds the new samples. Returns the kWh they added per UTC day (intervals split at midnight)."""
+        if len(dates_ms) == 0:
+            return {}
+        order = np.argsort(dates_ms, kind='stable')
+        pct = np.clip(values.astype(float)[order], 0, 100)
+        ts = dates_ms.astype(np.int64)[order]
+        if self._last is not None:
+            # An older sample would open a negative interval, then an overlong one
+            late = ts <= self._last[0]
+            ts, pct = ts[~late], pct[~late]
+            if len(ts) == 0:
+                return {}
+            ts = np.concatenate([[self._last[0]], ts])
+            pct = np.concatenate([[self._last[1]], pct])
+        self._last = (int(ts[-1]), float(pct[-1]))
+
+        on = (pct[:-1] > 0) & (np.diff(ts) > 0)
+        t0, t1, kw = ts[:-1][on], ts[1:][on], pct[:-1][on] / 100.0 * self.power_kw
+
+        day_ms = SECONDS_PER_DAY * 1000
+        added = defaultdict(float)
+        same_day = t0 // day_ms == (t1 - 1) // day_ms
+        for day, kwh in zip(t0[same_day] // day_ms, kw[same_day] * (t1 - t0)[same_day] / 3_600_000.0):
+            added[int(day)] += float(kwh)
+        for start, end, power in zip(t0[~same_day], t1[~same_day], kw[~same_day]):
+            while start < end:
+                cut = min(end, (start // day_ms + 1) * day_ms)
+                added[int(start // day_ms)] += float(power * (cut - start) / 3_600_000.0)
+                start = cut
+
+        added = {date(1970, 1, 1) + timedelta(days=day): kwh for day, kwh in added.items()}
+        self.kwh += sum(added.values())
+        return added
+
+
+class LiveDay:
+    """Running state of one UTC day, refreshed from the rows newer than its watermarks."""
+
+    def __init__(self, day: date):
+        self.day = day
+        self.day_start_ms = int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() * 1000)
+        self.day_end_ms = self.day_start_ms + SECONDS_PER_DAY * 1000 - 1
+
+        self.classifier = OnlineDistinctCount()
+        self.state_seconds = defaultdict(int)
+        self.state = None
+        self.state_since_s = None
+        self.energy = EnergyAccumulator()
+        self.alarms = AlarmIncidentTracker(ALARM_NOISE_PATTERN)
+        self.closed_incidents = 0
+
+        # Watermarks: next second to classify, last `date` read of 260 and 447
+        self.next_sec = self.day_start_ms // 1000
+        self.energy_ms = self.day_start_ms - 1
+        self.alarm_ms = self.day_start_ms - 1
+        self.refreshed_at = None
+
+    def _set_state(self, state: str, since_s: int, events: list) -> None:
+        if state != self.state:
+            self.state, self.state_since_s = state, since_s
+            events.append({"type": "state", "state": state, "since_s": since_s})
+
+    def refresh(self, now_ms: int = None) -> list:
+        """Reads the new rows and updates the totals. Returns the events they produced."""
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        until_ms = min(now_ms, self.day_end_ms)
+        day_over = now_ms > self.day_end_ms
+        events = []
+
+        # 1. States: the last second may still be receiving rows, it waits for
+        #    the next refresh (unless the day is over)
+        frame = get_per_second_delta(self.next_sec, until_ms)
+        secs = frame.index.to_numpy(dtype=np.int64)
+        counts = frame['distinct_vars_count'].to_numpy()
+        if not day_over and len(secs):
+            keep = secs < secs[-1]
+            secs, counts = secs[keep], counts[keep]
+        if len(secs):
+            self.next_sec = int(secs[-1]) + 1
+        for start, end, state in self.classifier.feed(secs, counts):
+            self.state_seconds[state] += end - start
+            self._set_state(state, start, events)
+        last_sec = self.classifier.last_sec
+        if not day_over and last_sec is not None and until_ms // 1000 - last_sec > SILENCE_SEC:
+            self._set_state('True Idle (Off)', last_sec + 1, events)
+
+        # 2. Energy
+        rows = get_log_delta("float", ENERGY_VARIABLE, self.energy_ms, until_ms)
+        if not rows.empty:
+            kwh_before = self.energy.kwh
+            self.energy.feed(rows['date'].to_numpy(dtype=np.int64), rows['value'].to_numpy())
+            self.energy_ms = int(rows['date'].iloc[-1])
+            if self.energy.kwh != kwh_before:
+                events.append({"type": "energy", "kwh": round(self.energy.kwh, 3), "at_ms": self.energy_ms})
+
+        # 3. Alarm incidents
+        rows = get_log_delta("string", ALARM_VARIABLE, self.alarm_ms, until_ms)
+        for date_ms, value in zip(rows['date'].to_numpy(dtype=np.int64), rows['value']):
+            for event in self.alarms.feed(int(date_ms), value):
+                if event[0] == "open":
+                    events.append({"type": "alarm_open", "alarm_code": event[1], "alarm_text": event[2],
+                                   "start_ms": event[3]})
+                else:
+                    self.closed_incidents += 1
+                    events.append({"type": "alarm_close", "alarm_code": event[1], "alarm_text": event[2],
+                                   "start_ms": event[3], "end_ms": event[4]})
+        if not rows.empty:
+            self.alarm_ms = int(rows['date'].iloc[-1])
+
+        self.refreshed_at = now_ms
+        return events
+
+    def snapshot(self) -> dict:
+        """Totals of the day so far, in the shapes used by the dashboard."""
+        hours = pd.DataFrame({
+            'state': list(self.state_seconds),
+            'total_hours': [s / 3600.0 for s in self.state_seconds.values()],
+        })
+        incidents = pd.DataFrame(
+            [(code, text, start_ms) for (code, text), start_ms in self.alarms.open_incidents.items()],
+            columns=['alarm_code', 'description', 'start_ms'],
+        )
+        incidents['start'] = pd.to_datetime(incidents.pop('start_ms'), unit='ms')
+        last_sec = self.classifier.last_sec
+        return {
+            "day": self.day,
+            "state": self.state,
+            "state_since": pd.to_datetime(self.state_since_s, unit='s') if self.state_since_s is not None else None,
+            "state_hours": hours,
+            "energy_kwh": self.energy.kwh,
+            "open_incidents": incidents.sort_values('start', ascending=False),
+            "closed_incidents": self.closed_incidents,
+            "last_data": pd.to_datetime(last_sec, unit='s') if last_sec is not None else None,
+        }
+
+
+class LiveMonitor:
+    """
+    One LiveDay per process, shared by every screen: refresh() runs at most
+    one delta fetch every `min_interval_sec` and rolls over at UTC midnight
+    (the previous day is folded to its end first).
+    """
+
+    def __init__(self, min_interval_sec: float = 5):
+        self.min_interval_sec = min_interval_sec
+        self.live = None
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self) -> tuple:
+        """(snapshot of the current day, events of this refresh)."""
+        with self._lock:
+            events = []
+            today = datetime.now(timezone.utc).date()
+            if self.live is not None and self.live.day != today:
+                events = self.live.refresh()
+                self.live = None
+            if self.live is None:
+                self.live = LiveDay(today)
+                self._last_refresh = 0.0
+
+            if time.monotonic() - self._last_refresh >= self.min_interval_sec:
+                events += self.live.refresh()
+                self._last_refresh = time.monotonic()
+            return self.live.snapshot(), events
+
+
+class EventLog:
+    """
+    Bounded log of live events with resumable ids '<stream>-<seq>' (SSE
+    Last-Event-ID). The stream part changes with every process, so an id
+    from a previous run is never mistaken for a current one.
+    Not thread-safe: meant to be used from one event loop.
+    """
+
+    def __init__(self, max_events: int = 1000):
+        self.stream = f"{int(time.time() * 1000):x}"
+        self.last_seq = 0
+        self._events = deque(maxlen=max_events)   # (seq, event)
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.stream}-{seq}"
+
+    def append(self, events: list) -> None:
+        for event in events:
+            self.last_seq += 1
+            self._events.append((self.last_seq, event))
+
+    def since(self, event_id: str) -> tuple:
+        """
+        ([(seq, event), ...] after `event_id`, resumed). resumed is False when
+        the id is missing, from another stream or older than the buffer: the
+        caller then has to resynchronize from a snapshot.
+        """
+        stream, _, seq = (event_id or "").partition("-")
+        if stream != self.stream or not seq.isdigit():
+            return [], False
+        seq = int(seq)
+        oldest = self._events[0][0] if self._events else self.last_seq + 1
+        if seq < oldest - 1 or seq > self.last_seq:
+            return [], False
+        return [(s, e) for s, e in self._events if s > seq], True
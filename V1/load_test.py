@@ -0,0 +1,246 @@
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+
+# ----------------------------------------------------------------------
+# Load test: N virtual users replaying dashboard sessions concurrently.
+# A session picks a date range, then browses pages with a think time in
+# between; every page issues the same backend calls as app.py.
+#
+#   python load_test.py --users 10 --duration 120 --mode service --shared-cache
+#   python load_test.py --users 25 --duration 300 --mode api --base-url http://127.0.0.1:8080
+#
+# 'service' calls data_service in-process (one thread per user, like the
+# Streamlit server); --shared-cache emulates st.cache_data, which is shared
+# by every session of the server. 'api' sends the requests to api_server.
+# Reports throughput, latency percentiles per call and DB connection usage.
+# A call is an error when it raises (query error, HTTP error) or the API
+# envelope says 'error'; empty results ('no_data') are counted apart.
+# ----------------------------------------------------------------------
+
+# Backend calls of each page of app.py (each page only loads the datasets it renders;
+# the Overview reads the daily KPI table)
+PAGE_CALLS = {
+    "Overview": ["kpi", "alarms"],
+    "Operations": ["wh"],
+    "Energy": ["ec", "load_curve"],
+    "Alarms": ["alarms"],
+}
+
+# Calls also served by api_server (mode api skips the others)
+API_CALLS = ("wh", "ec", "alarms")
+
+# Range sizes picked by the users (days, weight)
+RANGE_CHOICES = [(1, 0.25), (7, 0.60), (30, 0.15)]
+
+DATA_START = date(2021, 1, 1)
+DATA_END = date(2022, 12, 31)
+
+
+def _service_calls() -> dict:
+    from data_service import (get_daily_kpis, get_energy_consumption, get_load_curve, get_machine_alarms,
+                              get_state_times)
+
+    return {
+        "kpi": get_daily_kpis,
+        "wh": get_state_times,
+        "ec": get_energy_consumption,
+        "alarms": get_machine_alarms,
+        "load_curve": get_load_curve,
+    }
+
+
+class LoadTest:
+    def __init__(self, mode: str = "service", base_url: str = None, users: int = 5, duration_sec: float = 60,
+                 think_time_sec: float = 2.0, shared_cache: bool = False, seed: int = 0,
+                 data_start: date = DATA_START, data_end: date = DATA_END):
+        self.mode = mode
+        self.base_url = (base_url or "http://127.0.0.1:8080").rstrip("/")
+        self.users = users
+        self.duration_sec = duration_sec
+        self.think_time_sec = think_time_sec
+        self.seed = seed
+        self.data_start = data_start
+        self.data_end = data_end
+        self.calls = _service_calls() if mode == "service" else None
+        self.cache = None
+        if shared_cache:
+            from result_cache import ResultCache
+            self.cache = ResultCache(max_entries=1024, ttl_sec=3600)
+
+        self.latencies = defaultdict(list)   # call name -> [seconds]
+        self.errors = defaultdict(int)
+        self.empty = defaultdict(int)        # successful calls without rows
+        self.sessions = 0
+        self.connection_samples = []         # (checked out in the pool, backends in pg_stat_activity)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    # --- one backend call -------------------------------------------------
+
+    def _service_call(self, name: str, from_date: str, until_date: str):
+        from database_dao import raise_query_errors
+
+        # Query errors are raised (and never cached), not returned as empty frames
+        with raise_query_errors():
+            return self.calls[name](from_date, until_date)
+
+    def _call(self, name: str, from_date: str, until_date: str) -> bool:
+        """Runs one call; True if it returned rows. Raises on any error."""
+        if self.mode == "service":
+            if self.cache is not None:
+                df = self.cache.get_or_compute((name, from_date, until_date),
+                                               lambda: self._service_call(name, from_date, until_date))
+            else:
+                df = self._service_call(name, from_date, until_date)
+            return not df.empty
+
+        query = urllib.parse.urlencode({"from": from_date, "until": until_date})
+        # HTTP 4xx / 5xx raise HTTPError
+        with urllib.request.urlopen(f"{self.base_url}/api/{name}?{query}", timeout=300) as response:
+            status = response.headers.get("X-Status")
+            body = response.read()
+        if status is None:
+            status = json.loads(body).get("status")
+        if status not in ("success", "no_data"):
+            raise RuntimeError(f"response status '{status}'")
+        return status == "success"
+
+    def _timed_call(self, name: str, from_date: str, until_date: str) -> None:
+        start = time.perf_counter()
+        ok, has_rows = True, False
+        try:
+            has_rows = self._call(name, from_date, until_date)
+        except Exception as e:
+            ok = False
+            print(f"{name} failed: {e}")
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies[name].append(elapsed)
+            if not ok:
+                self.errors[name] += 1
+            elif not has_rows:
+                self.empty[name] += 1
+
+    # --- virtual users ----------------------------------------------------
+
+    def _random_range(self, rng: random.Random) -> tuple:
+        days = rng.choices([d for d, _ in RANGE_CHOICES], weights=[w for _, w in RANGE_CHOICES])[0]
+        span = (self.data_end - self.data_start).days - days
+        start = self.data_start + timedelta(days=rng.randint(0, max(span, 0)))
+        return f"{start} 00:00:00", f"{start + timedelta(days=days - 1)} 23:59:59"
+
+    def _user(self, user_id: int) -> None:
+        rng = random.Random(self.seed * 1000 + user_id)
+        pages = list(PAGE_CALLS)
+        while not self._stop.is_set():
+            # One session: a range, then 2 to 6 page views
+            from_date, until_date = self._random_range(rng)
+            for page in ["Overview"] + rng.choices(pages, k=rng.randint(1, 5)):
+                if self._stop.is_set():
+                    return
+                for name in PAGE_CALLS[page]:
+                    if self.mode == "api" and name not in API_CALLS:
+                        continue   # not served by the API
+                    self._timed_call(name, from_date, until_date)
+                self._stop.wait(rng.expovariate(1 / self.think_time_sec) if self.think_time_sec else 0)
+            with self._lock:
+                self.sessions += 1
+
+    # --- connection usage -------------------------------------------------
+
+    def _sample_connections(self) -> None:
+        from database_dao import DB_BACKEND, get_engine, run_query_data
+
+        while not self._stop.wait(0.5):
+            checked_out = backends = None
+            if self.mode == "service" and DB_BACKEND == "postgresql":
+                checked_out = get_engine().pool.checkedout()
+            if DB_BACKEND == "postgresql":
+                df = run_query_data(
+                    "SELECT COUNT(*) AS n FROM pg_stat_activity WHERE datname = current_database();", {},
+                    query_name="load_test_sampler",
+                )
+                backends = int(df['n'].iloc[0]) if not df.empty else None
+            self.connection_samples.append((checked_out, backends))
+
+    # --- run & report -----------------------------------------------------
+
+    def run(self) -> dict:
+        threads = [threading.Thread(target=self._user, args=(i,), name=f"vu-{i}") for i in range(self.users)]
+        sampler = threading.Thread(target=self._sample_connections, name="connections", daemon=True)
+        start = time.perf_counter()
+        sampler.start()
+        for thread in threads:
+            thread.start()
+        self._stop.wait(self.duration_sec)
+        self._stop.set()
+        for thread in threads:
+            thread.join()
+        return self.report(time.perf_counter() - start)
+
+    def report(self, elapsed_sec: float) -> dict:
+        def summary(values: list) -> dict:
+            ms = np.array(values) * 1000
+            return {
+                "count": len(values),
+                "p50_ms": round(float(np.percentile(ms, 50)), 1),
+                "p95_ms": round(float(np.percentile(ms, 95)), 1),
+                "p99_ms": round(float(np.percentile(ms, 99)), 1),
+                "max_ms": round(float(ms.max()), 1),
+            }
+
+        all_values = [v for values in self.latencies.values() for v in values]
+        pool = [c for c, _ in self.connection_samples if c is not None]
+        backends = [b for _, b in self.connection_samples if b is not None]
+        return {
+            "mode": self.mode,
+            "users": self.users,
+            "duration_sec": round(elapsed_sec, 1),
+            "sessions": self.sessions,
+            "requests": len(all_values),
+            "errors": sum(self.errors.values()),
+            "error_rate": round(sum(self.errors.values()) / len(all_values), 4) if all_values else 0,
+            "empty": sum(self.empty.values()),
+            "throughput_rps": round(len(all_values) / elapsed_sec, 2) if elapsed_sec else 0,
+            "latency": summary(all_values) if all_values else {},
+            "per_call": {name: dict(summary(values), errors=self.errors[name], empty=self.empty[name])
+                         for name, values in self.latencies.items()},
+            "connections": {
+                "pool_checked_out_max": max(pool) if pool else None,
+                "pool_checked_out_mean": round(float(np.mean(pool)), 2) if pool else None,
+                "db_backends_max": max(backends) if backends else None,
+            },
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent dashboard sessions against data_service or the API.")
+    parser.add_argument("--mode", choices=["service", "api"], default="service", help="Target of the calls.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8080", help="API server (mode api).")
+    parser.add_argument("--users", type=int, default=5, help="Concurrent virtual users.")
+    parser.add_argument("--duration", type=float, default=60, help="Test duration in seconds.")
+    parser.add_argument("--think-time", type=float, default=2.0, help="Mean pause between two pages (s).")
+    parser.add_argument("--shared-cache", action="store_true", help="Share results between users (st.cache_data).")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed of the sessions.")
+    parser.add_argument("--from", dest="data_start", default=str(DATA_START), help="First day of the data.")
+    parser.add_argument("--until", dest="data_end", default=str(DATA_END), help="Last day of the data.")
+    parser.add_argument("--output", help="Also write the report to this JSON file.")
+    args = parser.parse_args()
+
+    test = LoadTest(args.mode, args.base_url, args.users, args.duration, args.think_time, args.shared_cache,
+                    args.seed, date.fromisoformat(args.data_start), date.fromisoformat(args.data_end))
+    result = test.run()
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
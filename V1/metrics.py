@@ -0,0 +1,262 @@
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from query_stats import QUERY_STATS
+
+# ----------------------------------------------------------------------
+# Prometheus text-format metrics of the backend (no client library needed).
+#   - API server : GET /metrics
+#   - Streamlit  : start_textfile_collector(path), a file refreshed every few
+#                  seconds for the node_exporter textfile collector
+# Service calls, caches, pool checkouts and ingest are recorded here; the
+# per-query figures come from query_stats.QUERY_STATS at scrape time.
+# ----------------------------------------------------------------------
+
+PREFIX = "cnc"
+LATENCY_BUCKETS_SEC = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, math.inf]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = f"{PREFIX}_{name}"
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, *label_values) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            return self.header() + [f"{self.name}{_labels(self.label_names, k)} {_number(v)}" for k, v in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *label_values) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+    def set_max(self, value: float, *label_values) -> None:
+        """Sets the gauge unless it already holds a larger value (watermarks)."""
+        with self._lock:
+            self._values[label_values] = max(value, self._values.get(label_values, value))
+
+    def items(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: list = None):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets or LATENCY_BUCKETS_SEC
+
+    def observe(self, value: float, *label_values) -> None:
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            entry["buckets"][bisect.bisect_left(self.buckets, value)] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def render(self) -> list:
+        with self._lock:
+            items = [(k, dict(v, buckets=list(v["buckets"]))) for k, v in self._values.items()]
+        lines = self.header()
+        for label_values, entry in items:
+            lines.extend(render_histogram_series(self.name, self.label_names, label_values, self.buckets,
+                                                 entry["buckets"], entry["sum"], entry["count"]))
+        return lines
+
+
+def render_histogram_series(name: str, label_names: tuple, label_values: tuple, bounds: list,
+                            counts: list, total: float, count: int) -> list:
+    """Lines of one histogram series (per-bucket counts are made cumulative)."""
+    lines = []
+    cumulative = 0
+    for bound, bucket_count in zip(bounds, counts):
+        cumulative += bucket_count
+        labels = _labels(label_names + ("le",), label_values + (_number(bound),))
+        lines.append(f"{name}_bucket{labels} {cumulative}")
+    labels = _labels(label_names, label_values)
+    lines.append(f"{name}_sum{labels} {_number(float(total))}")
+    lines.append(f"{name}_count{labels} {count}")
+    return lines
+
+
+# --- Metrics recorded by the backend ---------------------------------
+
+SERVICE_REQUESTS = Counter("service_requests_total", "Calls of the data_service functions.", ("function", "status"))
+SERVICE_LATENCY = Histogram("service_latency_seconds", "Latency of the data_service functions.", ("function",))
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.",
+    buckets=[0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30, math.inf],
+)
+INGEST_ROWS = Counter("ingest_rows_total", "Rows loaded into the log tables.", ("table",))
+INGEST_WATERMARK = Gauge("ingest_watermark_seconds", "Epoch of the latest log row loaded.", ("table",))
+PREFETCH_TASKS = Counter("prefetch_tasks_total", "Background prefetches of adjacent ranges.", ("outcome",))
+
+REGISTRY = [SERVICE_REQUESTS, SERVICE_LATENCY, POOL_CHECKOUT_WAIT, INGEST_ROWS, INGEST_WATERMARK, PREFETCH_TASKS]
+
+# name -> ResultCache, exported through ResultCache.stats()
+_CACHES = {}
+# Zero-argument callables returning {"size", "checked_out", "overflow"} of the connection pool
+_POOL_SOURCES = []
+
+
+@contextmanager
+def track_service(function: str):
+    """Counts and times one service call: with track_service("get_state_times"): ..."""
+    start = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "success"
+    finally:
+        SERVICE_REQUESTS.inc(1, function, status)
+        SERVICE_LATENCY.observe(time.perf_counter() - start, function)
+
+
+def register_cache(name: str, cache) -> None:
+    _CACHES[name] = cache
+
+
+def register_pool(source) -> None:
+    _POOL_SOURCES.append(source)
+
+
+def record_ingest(table: str, rows: int, last_date_ms: int) -> None:
+    INGEST_ROWS.inc(rows, table)
+    if last_date_ms is not None:
+        INGEST_WATERMARK.set_max(last_date_ms / 1000, table)
+
+
+def _render_caches() -> list:
+    lines = []
+    for metric, key, kind, help_text in [
+        ("cache_hits_total", "hits", "counter", "Result cache hits."),
+        ("cache_misses_total", "misses", "counter", "Result cache misses."),
+        ("cache_evictions_total", "evictions", "counter", "Result cache evictions (LRU or expired)."),
+        ("cache_entries", "entries", "gauge", "Entries in the result cache."),
+    ]:
+        lines += [f"# HELP {PREFIX}_{metric} {help_text}", f"# TYPE {PREFIX}_{metric} {kind}"]
+        for name, cache in _CACHES.items():
+            lines.append(f"{PREFIX}_{metric}{_labels(('cache',), (name,))} {cache.stats()[key]}")
+    return lines
+
+
+def _render_pools() -> list:
+    lines = []
+    for key, help_text in [("size", "Configured pool size."), ("checked_out", "Connections in use."),
+                           ("overflow", "Connections opened beyond the pool size.")]:
+        lines += [f"# HELP {PREFIX}_db_pool_{key} {help_text}", f"# TYPE {PREFIX}_db_pool_{key} gauge"]
+        for source in _POOL_SOURCES:
+            lines.append(f"{PREFIX}_db_pool_{key} {source()[key]}")
+    return lines
+
+
+def _render_queries() -> list:
+    """Per-query figures of QUERY_STATS (histogram in ms there, seconds here)."""
+    snapshot = QUERY_STATS.snapshot()
+    name = f"{PREFIX}_query_duration_seconds"
+    lines = [f"# HELP {name} Wall time of the DAO queries, per calling function.", f"# TYPE {name} histogram"]
+    bounds = [b / 1000 for b in QUERY_STATS.buckets_ms]
+    for query, entry in snapshot.items():
+        lines += render_histogram_series(name, ("query",), (query,), bounds, entry["buckets"],
+                                         entry["wall_ms_sum"] / 1000, entry["calls"])
+
+    for metric, key, help_text, kinds in [
+        ("query_rows_total", "rows_sum", "Rows returned by the DAO queries.", ("select",)),
+        ("rows_streamed_total", "rows_sum", "Rows streamed through server-side cursors.", ("stream",)),
+        ("query_bytes_total", "bytes_sum", "Approximate bytes of the DataFrames built.", ("select", "stream")),
+        ("query_errors_total", "errors", "Failed DAO queries.", ("select", "stream", "command")),
+    ]:
+        lines += [f"# HELP {PREFIX}_{metric} {help_text}", f"# TYPE {PREFIX}_{metric} counter"]
+        for query, entry in snapshot.items():
+            if entry["kind"] in kinds:
+                lines.append(f"{PREFIX}_{metric}{_labels(('query',), (query,))} {entry[key]}")
+    return lines
+
+
+def _render_ingest_lag() -> list:
+    name = f"{PREFIX}_ingest_lag_seconds"
+    lines = [f"# HELP {name} Now minus the ingest watermark.", f"# TYPE {name} gauge"]
+    now = time.time()
+    for (table,), watermark in INGEST_WATERMARK.items().items():
+        lines.append(f"{name}{_labels(('table',), (table,))} {_number(now - watermark)}")
+    return lines
+
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    lines += _render_caches() + _render_pools() + _render_queries() + _render_ingest_lag()
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str) -> None:
+    # Atomic replace: the collector never reads a half-written file
+    with open(path + ".tmp", "w") as f:
+        f.write(render())
+    os.replace(path + ".tmp", path)
+
+
+def start_textfile_collector(path: str, interval_sec: float = 15) -> threading.Thread:
+    """Rewrites `path` every `interval_sec` seconds from a daemon thread (Streamlit process)."""
+    def loop():
+        while True:
+            try:
+                write_textfile(path)
+            except OSError as e:
+                print(f"Metrics textfile not written: {e}")
+            time.sleep(interval_sec)
+
+    thread = threading.Thread(target=loop, name="metrics-textfile", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+from datetime import date, datetime, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from database_dao import DB_CONFIG, iter_query_data, raise_query_errors, run_query_data
+from ingest import TABLES
+
+# ----------------------------------------------------------------------
+# Incremental export of the raw log tables to day-partitioned Parquet:
+#   <root>/variable_log_float/day=YYYY-MM-DD/part-0.parquet
+#   <root>/variable_log_string/day=YYYY-MM-DD/part-0.parquet
+#   <root>/manifest.json            (days already exported, per table)
+#
+#   python parquet_export.py                     (every complete day not exported yet)
+#   python parquet_export.py --from 2021-03-01 --until 2021-03-31 --force
+#
+# Same layout as the DuckDB backend (DB_BACKEND: duckdb, PARQUET_ROOT), so
+# the whole-history analyses can run on the files instead of the production DB.
+# Rows are sorted by date: id_var is dictionary-encoded, date delta-encoded,
+# everything compressed with zstd.
+# ----------------------------------------------------------------------
+
+MANIFEST_FILE = "manifest.json"
+MS_PER_DAY = 86400 * 1000
+
+SCHEMAS = {
+    "float": pa.schema([("date", pa.int64()), ("id_var", pa.int32()), ("value", pa.float64())]),
+    "string": pa.schema([("date", pa.int64()), ("id_var", pa.int32()), ("value", pa.string())]),
+}
+
+# Columns stored with a dictionary (the 447 / 557 strings repeat a lot)
+DICTIONARY_COLUMNS = {
+    "float": ["id_var"],
+    "string": ["id_var", "value"],
+}
+
+
+def load_manifest(root: str) -> dict:
+    path = os.path.join(root, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"tables": {table: {} for table in TABLES.values()}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(root: str, manifest: dict) -> None:
+    # Written next to the final file then renamed, so a crash never leaves half a manifest
+    path = os.path.join(root, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def _day_bounds(day: date) -> tuple:
+    start = int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() * 1000)
+    return start, start + MS_PER_DAY - 1
+
+
+def _first_day(table: str) -> date:
+    df = run_query_data(f"SELECT MIN(CAST(date AS BIGINT)) AS first_ms FROM {table};", {})
+    if df.empty or df['first_ms'].isna().iloc[0]:
+        return None
+    return datetime.fromtimestamp(int(df['first_ms'].iloc[0]) / 1000, tz=timezone.utc).date()
+
+
+def export_day(root: str, kind: str, day: date) -> dict:
+    """
+    Streams one day of a log table into its partition. Returns the manifest
+    entry of the day; raises on a query error (nothing written nor deleted).
+    """
+    table = TABLES[kind]
+    ms_start, ms_end = _day_bounds(day)
+    sql_query = f"""
+    SELECT CAST(date AS BIGINT) AS date, id_var, value
+    FROM {table}
+    WHERE CAST(date AS BIGINT) >= :ms_start
+      AND CAST(date AS BIGINT) <= :ms_end
+    ORDER BY date, id_var;
+    """
+
+    folder = os.path.join(root, table, f"day={day.isoformat()}")
+    path = os.path.join(folder, "part-0.parquet")
+    tmp_path = path + ".tmp"
+    writer = None
+    rows = 0
+    try:
+        for chunk in iter_query_data(sql_query, {"ms_start": ms_start, "ms_end": ms_end}):
+            if writer is None:
+                os.makedirs(folder, exist_ok=True)
+                writer = pq.ParquetWriter(
+                    tmp_path,
+                    SCHEMAS[kind],
+                    compression="zstd",
+                    use_dictionary=DICTIONARY_COLUMNS[kind],
+                    column_encoding={"date": "DELTA_BINARY_PACKED"},
+                )
+            writer.write_table(pa.Table.from_pandas(chunk, schema=SCHEMAS[kind], preserve_index=False))
+            rows += len(chunk)
+    except BaseException:
+        # Query (iter_query_data raises) or write failed: the partition stays as it was
+        if writer is not None:
+            writer.close()
+            os.remove(tmp_path)
+        raise
+    if writer is not None:
+        writer.close()
+
+    # Only reached once the query has completed: an empty result really is an empty day
+    if rows:
+        os.replace(tmp_path, path)
+    elif os.path.exists(path):
+        # The day is empty now (rows deleted since the last export)
+        os.remove(path)
+
+    return {
+        "rows": rows,
+        "bytes": os.path.getsize(path) if rows else 0,
+        "exported_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def export_range(root: str, kinds: list = None, from_day: date = None, until_day: date = None,
+                 force: bool = False) -> dict:
+    """
+    Exports every day of [from_day, until_day] not in the manifest yet (all of
+    them with `force`). Defaults: from the day after the last exported one (or
+    the first day of the table), until yesterday (UTC) so that only complete
+    days are frozen. The manifest is saved after every day.
+    A query error stops the export: the days before it stay recorded, the
+    failed one is retried by the next run.
+    Returns the number of rows exported per table.
+    """
+    with raise_query_errors():
+        return _export_range(root, kinds, from_day, until_day, force)
+
+
+def _export_range(root: str, kinds: list, from_day: date, until_day: date, force: bool) -> dict:
+    os.makedirs(root, exist_ok=True)
+    manifest = load_manifest(root)
+    until_day = until_day or datetime.now(timezone.utc).date() - timedelta(days=1)
+    exported = {}
+
+    for kind in kinds or list(TABLES):
+        table = TABLES[kind]
+        days_done = manifest["tables"].setdefault(table, {})
+        start = from_day
+        if start is None:
+            start = (date.fromisoformat(max(days_done)) + timedelta(days=1)) if days_done else _first_day(table)
+        if start is None:
+            print(f"{table}: no data.")
+            continue
+
+        exported[table] = 0
+        day = start
+        while day <= until_day:
+            if force or day.isoformat() not in days_done:
+                entry = export_day(root, kind, day)
+                days_done[day.isoformat()] = entry
+                save_manifest(root, manifest)
+                exported[table] += entry["rows"]
+                print(f"{table} {day}: {entry['rows']} rows, {entry['bytes'] / 1e6:.1f} MB")
+            day += timedelta(days=1)
+
+    return exported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental export of the log tables to day-partitioned Parquet.")
+    parser.add_argument("--root", default=DB_CONFIG.get('PARQUET_ROOT', 'parquet'), help="Output folder.")
+    parser.add_argument("--tables", nargs="+", choices=list(TABLES), help="Tables to export (default: both).")
+    parser.add_argument("--from", dest="from_day", help="First day (YYYY-MM-DD).")
+    parser.add_argument("--until", dest="until_day", help="Last day (YYYY-MM-DD, default: yesterday).")
+    parser.add_argument("--force", action="store_true", help="Re-export days already in the manifest.")
+    args = parser.parse_args()
+
+    try:
+        result = export_range(
+            args.root,
+            args.tables,
+            date.fromisoformat(args.from_day) if args.from_day else None,
+            date.fromisoformat(args.until_day) if args.until_day else None,
+            args.force,
+        )
+    except Exception as e:
+        raise SystemExit(f"Export stopped: {e}")
+    for table_name, count in result.items():
+        print(f"{table_name}: {count} rows exported.")
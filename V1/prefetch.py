@@ -0,0 +1,164 @@
+import itertools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from data_service import DEFAULT_FMT, FALLBACK_FMT
+from metrics import PREFETCH_TASKS
+
+# ----------------------------------------------------------------------
+# Background prefetch of the adjacent date ranges.
+# After a range is served, the previous and the next windows of the same
+# length are computed into the shared ResultCache, so that stepping the
+# range backward / forward (usually by a week) is a cache hit.
+#   - low priority: a prefetch only starts when no foreground request is
+#     running (foreground() marks them), on a small dedicated pool
+#   - cancelled per scope (Streamlit session, API client): picking another
+#     range gives the scope a new generation, queued tasks are dropped and
+#     the ones not started yet skip their query
+#   - bounded: a scope is dropped when its tasks are done, and at most
+#     max_scopes are tracked (least recently scheduled cancelled first)
+# ----------------------------------------------------------------------
+
+
+def adjacent_ranges(from_date: str, until_date: str) -> list:
+    """
+    [(from, until) of the previous window, (from, until) of the next one],
+    same length and same format ('YYYY-MM-DD HH:MM:SS' or 'YYYY-MM-DD') as the input.
+    """
+    try:
+        start, end = datetime.strptime(from_date, DEFAULT_FMT), datetime.strptime(until_date, DEFAULT_FMT)
+        fmt, step = DEFAULT_FMT, timedelta(seconds=1)
+    except ValueError:
+        start, end = datetime.strptime(from_date, FALLBACK_FMT), datetime.strptime(until_date, FALLBACK_FMT)
+        fmt, step = FALLBACK_FMT, timedelta(days=1)
+
+    length = end - start + step
+    return [
+        ((start - length).strftime(fmt), (start - step).strftime(fmt)),
+        ((end + step).strftime(fmt), (end + length).strftime(fmt)),
+    ]
+
+
+class RangePrefetcher:
+    """
+    Warms `cache` with the results of `calls` (name -> service(from, until))
+    for the ranges adjacent to the one just served. Cache keys are
+    (name, from, until), like the foreground lookups.
+    A scope is forgotten once its tasks are done; at most `max_scopes` scopes
+    (client-supplied in the API) are tracked, the least recent are cancelled.
+    """
+
+    def __init__(self, cache, calls: dict, max_workers: int = 1, max_scopes: int = 256):
+        self.cache = cache
+        self.calls = calls
+        self.max_scopes = max_scopes
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._generations = OrderedDict()   # scope -> generation of its pending schedule(), least recent first
+        self._futures = {}       # scope -> futures of its pending schedule()
+        self._requests = {}      # scope -> (names, from, until) of its pending schedule()
+        self._counter = itertools.count(1)   # generations are unique across scopes
+        self._lock = threading.Lock()
+        self._busy = 0           # foreground requests running
+        self._idle = threading.Condition()
+
+    @contextmanager
+    def foreground(self):
+        """Marks a user-facing request: prefetches wait until none is running."""
+        with self._idle:
+            self._busy += 1
+        try:
+            yield
+        finally:
+            with self._idle:
+                self._busy -= 1
+                self._idle.notify_all()
+
+    def cancel(self, scope) -> None:
+        """Drops the pending prefetches of a scope."""
+        with self._lock:
+            futures = self._forget(scope)
+        for future in futures:
+            if future.cancel():
+                PREFETCH_TASKS.inc(1, "cancelled")
+
+    def schedule(self, scope, names: list, from_date: str, until_date: str) -> int:
+        """
+        Replaces the pending prefetches of `scope` by those of the ranges
+        adjacent to [from_date, until_date]. Returns the number of tasks queued
+        (0 when the scope asks again for the same range, e.g. a Streamlit rerun).
+        """
+        request = (tuple(names), from_date, until_date)
+        with self._lock:
+            if self._requests.get(scope) == request:
+                return 0
+        self.cancel(scope)
+        try:
+            ranges = adjacent_ranges(from_date, until_date)
+        except ValueError:
+            return 0
+
+        with self._lock:
+            generation = next(self._counter)
+            futures = [
+                self._executor.submit(self._run, scope, generation, name, f, u)
+                for f, u in ranges
+                for name in names
+                if name in self.calls
+            ]
+            self._generations[scope] = generation
+            self._futures[scope] = futures
+            self._requests[scope] = request
+            evicted = list(self._generations)[:max(len(self._generations) - self.max_scopes, 0)]
+        for old_scope in evicted:
+            self.cancel(old_scope)
+        # Outside the lock: a callback runs at once if its task is already done
+        for future in futures:
+            future.add_done_callback(lambda _, scope=scope, generation=generation: self._task_done(scope, generation))
+        if not futures:
+            self._task_done(scope, generation)
+        return len(futures)
+
+    def tracked_scopes(self) -> int:
+        with self._lock:
+            return len(self._generations)
+
+    def _forget(self, scope) -> list:
+        # Caller holds the lock; returns the futures of the scope
+        self._generations.pop(scope, None)
+        self._requests.pop(scope, None)
+        return self._futures.pop(scope, [])
+
+    def _task_done(self, scope, generation: int) -> None:
+        with self._lock:
+            if self._generations.get(scope) == generation and all(f.done() for f in self._futures.get(scope, [])):
+                self._forget(scope)
+
+    def _current(self, scope, generation: int) -> bool:
+        with self._lock:
+            return self._generations.get(scope) == generation
+
+    def _run(self, scope, generation: int, name: str, from_date: str, until_date: str) -> None:
+        # Low priority: let the foreground requests have the connections first
+        with self._idle:
+            while self._busy and self._current(scope, generation):
+                self._idle.wait(0.1)
+        if not self._current(scope, generation):
+            PREFETCH_TASKS.inc(1, "cancelled")
+            return
+
+        key = (name, from_date, until_date)
+        if self.cache.contains(key):
+            PREFETCH_TASKS.inc(1, "cached")
+            return
+        try:
+            self.cache.get_or_compute(key, lambda: self.calls[name](from_date, until_date))
+            PREFETCH_TASKS.inc(1, "warmed")
+        except Exception as e:
+            PREFETCH_TASKS.inc(1, "error")
+            print(f"Prefetch of {name} {from_date} -> {until_date} failed: {e}")
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
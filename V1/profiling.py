@@ -0,0 +1,148 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+# ----------------------------------------------------------------------
+# Opt-in per-request profiling (sampling, pure Python).
+# While a request runs, a background thread samples the stack of the
+# request's thread every few milliseconds; the samples are written as
+#   <PROFILE_DIR>/<time>_<tag>_<from>_<until>.collapsed        (flamegraph.pl, speedscope)
+#   <PROFILE_DIR>/<time>_<tag>_<from>_<until>.speedscope.json  (https://www.speedscope.app)
+# Time blocked in the database shows up under the driver's execute/fetch
+# frames, next to read_sql / DataFrame building, clean_dataframe,
+# infer_severity or the Altair serialization.
+#
+# Enabled for every request with CNC_PROFILE=1, or per API call with ?profile=1.
+# ----------------------------------------------------------------------
+
+PROFILING_ENABLED = os.environ.get("CNC_PROFILE", "") == "1"
+PROFILE_DIR = os.environ.get("CNC_PROFILE_DIR", "profiles")
+SAMPLE_INTERVAL_SEC = 0.005
+
+
+def _frame_name(frame) -> tuple:
+    code = frame.f_code
+    return code.co_name, os.path.basename(code.co_filename), frame.f_lineno
+
+
+class StackSampler:
+    """Samples the stack of one thread (the caller's by default) until stopped."""
+
+    def __init__(self, thread_id: int = None, interval_sec: float = SAMPLE_INTERVAL_SEC):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval_sec = interval_sec
+        self.samples = Counter()   # stack (root -> leaf tuple of frames) -> sample count
+        self._stop = threading.Event()
+        self._thread = None
+        self.started_at = self.stopped_at = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_sec):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def start(self) -> "StackSampler":
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.stopped_at = time.perf_counter()
+
+
+def collapsed_lines(samples: Counter) -> list:
+    """'root;child;leaf count' lines (Brendan Gregg's collapsed-stack format)."""
+    return [
+        ";".join(f"{name} ({filename}:{line})" for name, filename, line in stack) + f" {count}"
+        for stack, count in samples.most_common()
+    ]
+
+
+def speedscope_document(samples: Counter, name: str, interval_sec: float) -> dict:
+    """Sampled profile in the speedscope file format (weights in milliseconds)."""
+    frames, index = [], {}
+    stacks, weights = [], []
+    for stack, count in samples.items():
+        ids = []
+        for frame in stack:
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+            ids.append(index[frame])
+        stacks.append(ids)
+        weights.append(count * interval_sec * 1000)
+
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "cnc-dashboard profiling.py",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": stacks,
+            "weights": weights,
+        }],
+    }
+
+
+def _file_stem(tag: str, from_date: str, until_date: str) -> str:
+    parts = [datetime.now().strftime("%Y%m%d_%H%M%S_%f"), tag, from_date or "", until_date or ""]
+    return "_".join(re.sub(r"[^A-Za-z0-9._-]+", "-", str(p)).strip("-") for p in parts if p)
+
+
+def write_profile(sampler: StackSampler, tag: str, from_date: str = None, until_date: str = None,
+                  directory: str = None) -> str:
+    """Writes the .collapsed and .speedscope.json files of a sampler; returns their common stem path."""
+    directory = directory or PROFILE_DIR
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, _file_stem(tag, from_date, until_date))
+    name = f"{tag} {from_date or ''} -> {until_date or ''}".strip()
+
+    with open(stem + ".collapsed", "w", encoding="utf-8") as f:
+        f.write("\n".join(collapsed_lines(sampler.samples)) + "\n")
+    with open(stem + ".speedscope.json", "w", encoding="utf-8") as f:
+        json.dump(speedscope_document(sampler.samples, name, sampler.interval_sec), f)
+    return stem
+
+
+@contextmanager
+def profile_request(tag: str, from_date: str = None, until_date: str = None, enabled: bool = None):
+    """
+    Profiles the block when `enabled` (default: CNC_PROFILE=1) and writes its
+    files tagged with the function / page and the range. Yields a dict whose
+    'path' is set to the file stem once written (None when not profiling).
+    """
+    result = {"path": None}
+    if not (PROFILING_ENABLED if enabled is None else enabled):
+        yield result
+        return
+
+    sampler = StackSampler().start()
+    try:
+        yield result
+    finally:
+        sampler.stop()
+        try:
+            result["path"] = write_profile(sampler, tag, from_date, until_date)
+            print(f"Profile written: {result['path']}.collapsed ({sum(sampler.samples.values())} samples, "
+                  f"{sampler.stopped_at - sampler.started_at:.2f}s)")
+        except OSError as e:
+            print(f"Profile not written: {e}")
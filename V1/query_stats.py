@@ -0,0 +1,105 @@
+import bisect
+import json
+import logging
+import threading
+import time
+
+# ----------------------------------------------------------------------
+# In-process statistics of the queries run by database_dao, per query name
+# (the service function that issued it): call count, latency histogram,
+# time split (execute / fetch / DataFrame build), rows and approximate bytes.
+# Every call is also logged as one JSON line on the 'database_dao.queries'
+# logger, and the last sampled EXPLAIN plan of slow queries is kept.
+# ----------------------------------------------------------------------
+
+# Upper bounds (ms) of the latency histogram buckets; the last one is +inf
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float("inf")]
+
+QUERY_LOGGER = logging.getLogger("database_dao.queries")
+
+
+class QueryStats:
+    """Thread-safe aggregates of the query calls, keyed by query name."""
+
+    def __init__(self, buckets_ms: list = None):
+        self.buckets_ms = buckets_ms or LATENCY_BUCKETS_MS
+        self._stats = {}
+        self._plans = {}   # query name -> last sampled EXPLAIN plan
+        self._lock = threading.Lock()
+
+    def record(self, name: str, kind: str, wall_ms: float, execute_ms: float = 0.0, fetch_ms: float = 0.0,
+               build_ms: float = 0.0, rows: int = 0, nbytes: int = 0, error: bool = False) -> None:
+        with self._lock:
+            entry = self._stats.get(name)
+            if entry is None:
+                entry = self._stats[name] = {
+                    "kind": kind,
+                    "calls": 0,
+                    "errors": 0,
+                    "wall_ms_sum": 0.0,
+                    "execute_ms_sum": 0.0,
+                    "fetch_ms_sum": 0.0,
+                    "build_ms_sum": 0.0,
+                    "rows_sum": 0,
+                    "bytes_sum": 0,
+                    "buckets": [0] * len(self.buckets_ms),
+                }
+            entry["calls"] += 1
+            entry["errors"] += int(error)
+            entry["wall_ms_sum"] += wall_ms
+            entry["execute_ms_sum"] += execute_ms
+            entry["fetch_ms_sum"] += fetch_ms
+            entry["build_ms_sum"] += build_ms
+            entry["rows_sum"] += rows
+            entry["bytes_sum"] += nbytes
+            entry["buckets"][bisect.bisect_left(self.buckets_ms, wall_ms)] += 1
+
+        QUERY_LOGGER.info(json.dumps({
+            "event": "query",
+            "name": name,
+            "kind": kind,
+            "wall_ms": round(wall_ms, 2),
+            "execute_ms": round(execute_ms, 2),
+            "fetch_ms": round(fetch_ms, 2),
+            "build_ms": round(build_ms, 2),
+            "rows": rows,
+            "bytes": nbytes,
+            "error": error,
+        }))
+
+    def record_plan(self, name: str, wall_ms: float, plan) -> None:
+        with self._lock:
+            self._plans[name] = {"captured_at": time.time(), "wall_ms": wall_ms, "plan": plan}
+        QUERY_LOGGER.warning(json.dumps({"event": "slow_query_plan", "name": name, "wall_ms": round(wall_ms, 2),
+                                         "plan": plan}, default=str))
+
+    def snapshot(self) -> dict:
+        """Copy of the aggregates: {name: {calls, errors, *_ms_sum, rows_sum, bytes_sum, buckets}}."""
+        with self._lock:
+            return {name: dict(entry, buckets=list(entry["buckets"])) for name, entry in self._stats.items()}
+
+    def plans(self) -> dict:
+        with self._lock:
+            return dict(self._plans)
+
+    def percentile(self, name: str, q: float) -> float:
+        """Upper bound (ms) of the histogram bucket holding the q-th percentile of a query."""
+        with self._lock:
+            entry = self._stats.get(name)
+            if entry is None or entry["calls"] == 0:
+                return None
+            target = q / 100 * entry["calls"]
+            seen = 0
+            for bound, count in zip(self.buckets_ms, entry["buckets"]):
+                seen += count
+                if seen >= target:
+                    return bound
+            return self.buckets_ms[-1]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._plans.clear()
+
+
+QUERY_STATS = QueryStats()
@@ -0,0 +1,115 @@
+import io
+
+import pandas as pd
+
+# ----------------------------------------------------------------------
+# Response envelope shared by the CLI and the API server
+# ----------------------------------------------------------------------
+
+# Output formats -> (content type, file extension)
+# json wraps the rows in the envelope; the other formats carry the rows only
+FORMATS = {
+    "json": ("application/json", "json"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def dataframe_to_records(df: pd.DataFrame) -> list:
+    """Same cleanup and rounding as the original CLI, then one dict per row."""
+    # Cleanup specific to single machine context
+    cols_to_drop = ['machine_id', 'machine_name', 'device_id', 'equipment_id']
+    df = df.drop(columns=[c for c in cols_to_drop if c in df.columns], errors='ignore')
+
+    # Formatting numbers
+    for col, decimals in (('total_hours', 4), ('duration_sec', 2), ('total_duration_sec', 2)):
+        if col in df.columns:
+            df[col] = df[col].round(decimals)
+
+    # Convert date/timestamp objects to string
+    for col in df.select_dtypes(include=['datetime', 'datetimetz']).columns:
+        df[col] = df[col].astype(str)
+
+    # NaN is not valid JSON
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict(orient='records')
+
+
+def build_response(status: str, from_date: str, until_date: str, data_list: list) -> dict:
+    """JSON response envelope: status, machine_context, period, count, data."""
+    return {
+        "status": status,
+        "machine_context": "single_machine",
+        "period": {
+            "from": from_date,
+            "until": until_date
+        },
+        "count": len(data_list),
+        "data": data_list
+    }
+
+
+def dataframe_response(df: pd.DataFrame, from_date: str, until_date: str) -> dict:
+    """Envelope of a successful service call ('no_data' when the frame is empty)."""
+    data_list = dataframe_to_records(df) if not df.empty else []
+    return build_response("success" if data_list else "no_data", from_date, until_date, data_list)
+
+
+def batch_response(results: list) -> dict:
+    """One envelope per item, in the order of the request."""
+    envelopes = []
+    for result in results:
+        item = result["item"]
+        if result["status"] == "success":
+            envelope = dataframe_response(result["df"], item.get("from"), item.get("until"))
+        else:
+            envelope = build_response("error", item.get("from"), item.get("until"), [])
+            envelope["message"] = result.get("message")
+        envelope["metric"] = item.get("metric")
+        envelopes.append(envelope)
+
+    status = "success" if all(r["status"] == "success" for r in results) else "partial"
+    return {"status": status, "count": len(envelopes), "results": envelopes}
+
+
+def format_error(fmt: str):
+    """Why `fmt` cannot be served here (unknown, pyarrow missing), or None. Checked before running the query."""
+    if fmt not in FORMATS:
+        return f"Unknown format '{fmt}'. Use one of: {', '.join(FORMATS)}."
+    if fmt in ("arrow", "parquet"):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return f"Format '{fmt}' requires pyarrow (pip install pyarrow)."
+    return None
+
+
+def serialize_dataframe(df: pd.DataFrame, fmt: str) -> bytes:
+    """
+    Rows-only serialisation for large results, straight from the DataFrame
+    (no per-row Python dicts): ndjson through pandas' writer, arrow (IPC
+    stream) and parquet through pyarrow.
+    """
+    if fmt == "ndjson":
+        if df.empty:
+            return b""
+        return df.to_json(orient='records', lines=True, date_format='iso', force_ascii=False).encode("utf-8")
+
+    if fmt not in ("arrow", "parquet"):
+        raise ValueError(f"Unknown format '{fmt}'. Use one of: {', '.join(FORMATS)}.")
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError(f"Format '{fmt}' requires pyarrow (pip install pyarrow).")
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = io.BytesIO()
+    if fmt == "arrow":
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, sink, compression="zstd")
+    return sink.getvalue()
@@ -0,0 +1,137 @@
+import sys
+from database_dao import execute_sql_command, get_engine
+from watermarks import ROLLUPS, advance_watermark, get_watermark, lock_derived, setup_watermarks
+
+# ----------------------------------------------------------------------
+# Level-of-detail pyramid of variable_log_float.
+# One table per resolution, (id_var, bucket) -> min / max / sum / count.
+# The sum is stored instead of the average so that coarser levels are exact
+# aggregates of the finer ones (avg = sum_value / n_samples).
+# Build the history ('build') before starting ingest_daemon.py, which then
+# adds its micro-batches; 'refresh' may run alongside the daemon.
+# ----------------------------------------------------------------------
+
+# (level name, bucket size in seconds), finest first
+PYRAMID_LEVELS = [
+    ("1s", 1),
+    ("10s", 10),
+    ("1min", 60),
+    ("10min", 600),   # same buckets as 01_load_bucket_10min_var630
+    ("1h", 3600),
+]
+
+
+def rollup_table(level: str) -> str:
+    return f"log_float_rollup_{level}"
+
+
+def setup_pyramid():
+    """Creates the rollup tables (no-op if they already exist)."""
+    print("--- 🛠️ Creating the level-of-detail pyramid tables ---")
+    for level, _ in PYRAMID_LEVELS:
+        create_sql = f"""
+        CREATE TABLE IF NOT EXISTS {rollup_table(level)} (
+            id_var      INTEGER NOT NULL,
+            bucket      BIGINT  NOT NULL,  -- bucket start, epoch seconds (UTC)
+            min_value   DOUBLE PRECISION,
+            max_value   DOUBLE PRECISION,
+            sum_value   DOUBLE PRECISION,
+            n_samples   BIGINT,
+            PRIMARY KEY (id_var, bucket)
+        );
+        """
+        print(f"Creating {rollup_table(level)}...")
+        execute_sql_command(create_sql)
+
+
+def refresh_pyramid(since_s: int = None):
+    """
+    Recomputes every level from `since_s` (default: the refresh watermark,
+    see watermarks.py) onwards. The finest level is read from the raw log,
+    each coarser level from the level just below it.
+    Runs as one transaction holding the pyramid's advisory lock: the ingest
+    daemon's increments wait for it instead of being overwritten.
+    """
+    setup_watermarks()
+    if since_s is None:
+        since_s = get_watermark(ROLLUPS) or 0
+    # Align on the coarsest bucket so that no partial bucket is left behind
+    coarsest_size = PYRAMID_LEVELS[-1][1]
+    since_s = (since_s // coarsest_size) * coarsest_size
+
+    print(f"--- 🔄 Refreshing the pyramid from epoch {since_s} ---")
+    upsert = """
+        ON CONFLICT (id_var, bucket) DO UPDATE SET
+            min_value = EXCLUDED.min_value,
+            max_value = EXCLUDED.max_value,
+            sum_value = EXCLUDED.sum_value,
+            n_samples = EXCLUDED.n_samples;
+    """
+
+    finest_level, finest_size = PYRAMID_LEVELS[0]
+    statements = [(f"Level {finest_level} (from raw log)...", f"""
+    INSERT INTO {rollup_table(finest_level)} (id_var, bucket, min_value, max_value, sum_value, n_samples)
+    SELECT
+        id_var,
+        (floor(CAST(date AS BIGINT) / 1000)::bigint / {finest_size}) * {finest_size} AS bucket,
+        MIN(value), MAX(value), SUM(value), COUNT(*)
+    FROM variable_log_float
+    WHERE CAST(date AS BIGINT) >= {since_s * 1000}
+      AND value = value -- Filter out NaN
+    GROUP BY 1, 2
+    {upsert}
+    """)]
+
+    for (finer, _), (level, size) in zip(PYRAMID_LEVELS, PYRAMID_LEVELS[1:]):
+        statements.append((f"Level {level} (from {finer})...", f"""
+        INSERT INTO {rollup_table(level)} (id_var, bucket, min_value, max_value, sum_value, n_samples)
+        SELECT
+            id_var,
+            (bucket / {size}) * {size} AS bucket,
+            MIN(min_value), MAX(max_value), SUM(sum_value), SUM(n_samples)
+        FROM {rollup_table(finer)}
+        WHERE bucket >= {since_s}
+        GROUP BY 1, 2
+        {upsert}
+        """))
+
+    connection = get_engine().raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            lock_derived(cursor, ROLLUPS)
+            cursor.execute("SELECT MAX(CAST(date AS BIGINT)) FROM variable_log_float WHERE CAST(date AS BIGINT) >= %s;",
+                           (since_s * 1000,))
+            last_ms = cursor.fetchone()[0]
+            for label, sql in statements:
+                print(label)
+                cursor.execute(sql)
+            # Final up to the last hour read: that (partial) hour is recomputed next time
+            last_s = int(last_ms) // 1000 if last_ms is not None else since_s
+            advance_watermark(cursor, ROLLUPS, (last_s // coarsest_size) * coarsest_size, since_s)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+    print("Pyramid up to date.")
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) != 2:
+        print("\nUsage:")
+        print("  Create the tables and roll up the full history : python rollups.py build")
+        print("  Roll up the rows added since the last refresh  : python rollups.py refresh")
+        sys.exit(1)
+
+    action = sys.argv[1].lower()
+
+    if action == "build":
+        setup_pyramid()
+        refresh_pyramid(since_s=0)
+    elif action == "refresh":
+        refresh_pyramid()
+    else:
+        print(f"Unknown action: {action}. Use 'build' or 'refresh'.")
@@ -0,0 +1,229 @@
+from abc import ABC, abstractmethod
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from working_idle import HOLE_STATE, LEO_WEIGHTS, WeightedEmaEngine
+
+# ----------------------------------------------------------------------
+# Registry of the activity (state) models of the project.
+#
+# Every model takes the same per-second frame, indexed by epoch second:
+#   - distinct_vars_count : number of distinct float variables logged
+#   - var_<id>            : value of sensor <id> in that second (NaN if absent)
+# and returns an RLE timeline: DataFrame(start_s, end_s, state), sorted,
+# with [start_s, end_s) in epoch seconds.
+# ----------------------------------------------------------------------
+
+STATE_MODELS = {}
+
+
+def register_model(cls):
+    """Class decorator adding a StateModel to the registry under its `name`."""
+    STATE_MODELS[cls.name] = cls
+    return cls
+
+
+def get_model(name: str, **kwargs):
+    """Instantiates a registered model by name."""
+    try:
+        return STATE_MODELS[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"Unknown state model '{name}'. Available: {', '.join(STATE_MODELS)}")
+
+
+def sensor_column(id_var: int) -> str:
+    return f"var_{id_var}"
+
+
+def rle_timeline(starts: np.ndarray, ends: np.ndarray, states: np.ndarray) -> pd.DataFrame:
+    """
+    Run-length encodes sorted [start, end) segments (epoch seconds): consecutive
+    segments that touch and share the same state are merged into one row.
+    """
+    if len(starts) == 0:
+        return pd.DataFrame(columns=['start_s', 'end_s', 'state'])
+
+    new_run = np.ones(len(starts), dtype=bool)
+    new_run[1:] = (states[1:] != states[:-1]) | (starts[1:] != ends[:-1])
+    first = np.flatnonzero(new_run)
+    last = np.append(first[1:] - 1, len(starts) - 1)
+
+    return pd.DataFrame({
+        'start_s': starts[first],
+        'end_s': ends[last],
+        'state': states[first],
+    })
+
+
+class StateModel(ABC):
+    """Base class: subclasses set `name`, `states`, `required_variables` and implement classify()."""
+
+    name = None
+    states = ()
+    required_variables = ()   # sensor ids needed as var_<id> columns
+    gap_state = None          # state of a hole in the signal (None: the previous state lasts)
+
+    @abstractmethod
+    def classify(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """Per-second frame -> RLE timeline DataFrame(start_s, end_s, state)."""
+
+
+@register_model
+class DistinctCountModel(StateModel):
+    """
+    V1 model: moving average of the distinct variable count over 15 points
+    (per day, warm-up points ignored), thresholds 14 / 20, and 'True Idle (Off)'
+    for every hole in the per-second signal.
+    """
+
+    name = "distinct_count"
+    states = ('High Activity', 'Intermediate Activity', 'Low Activity', 'True Idle (Off)')
+    gap_state = 'True Idle (Off)'
+
+    def __init__(self, low: float = 14, high: float = 20, window: int = 15):
+        self.low = low
+        self.high = high
+        self.window = window
+
+    def classify(self, frame: pd.DataFrame) -> pd.DataFrame:
+        if frame.empty:
+            return rle_timeline(np.array([]), np.array([]), np.array([]))
+
+        sec = frame.index.to_numpy(dtype=np.int64)
+        smoothed = (
+            frame['distinct_vars_count'].astype(float)
+            .groupby(sec // 86400)
+            .rolling(self.window)
+            .mean()
+            .to_numpy()
+        )
+
+        # Active seconds (warm-up rows have no smoothed value and are skipped)
+        keep = ~np.isnan(smoothed)
+        active_states = np.select(
+            [smoothed[keep] <= self.low, smoothed[keep] <= self.high],
+            ['Low Activity', 'Intermediate Activity'],
+            default='High Activity',
+        )
+
+        # Holes in the signal
+        gap_mask = np.diff(sec) > 1
+        gap_starts = sec[:-1][gap_mask] + 1
+        gap_ends = sec[1:][gap_mask]
+
+        starts = np.concatenate([sec[keep], gap_starts])
+        ends = np.concatenate([sec[keep] + 1, gap_ends])
+        states = np.concatenate([active_states.astype(object), np.full(len(gap_starts), 'True Idle (Off)', dtype=object)])
+
+        order = np.argsort(starts, kind='stable')
+        return rle_timeline(starts[order], ends[order], states[order])
+
+
+class OnlineDistinctCount:
+    """
+    Streaming version of DistinctCountModel (live mode): feed() the per-second
+    distinct counts in chronological order, in as many calls as needed, and
+    get back the RLE segments [(start_s, end_s, state), ...] classified so far.
+    Same smoothing, per-day warm-up, thresholds and idle gaps as classify().
+    """
+
+    def __init__(self, low: float = 14, high: float = 20, window: int = 15):
+        self.low = low
+        self.high = high
+        self._window = deque(maxlen=window)
+        self._day = None
+        self.last_sec = None
+
+    def _state(self, smoothed: float) -> str:
+        if smoothed <= self.low:
+            return 'Low Activity'
+        if smoothed <= self.high:
+            return 'Intermediate Activity'
+        return 'High Activity'
+
+    def feed(self, secs, counts) -> list:
+        segments = []
+
+        def push(start: int, end: int, state: str) -> None:
+            if segments and segments[-1][2] == state and segments[-1][1] == start:
+                segments[-1] = (segments[-1][0], end, state)
+            else:
+                segments.append((start, end, state))
+
+        for sec, count in zip(secs, counts):
+            sec = int(sec)
+            if self._day != sec // 86400:
+                # The moving average restarts every day (warm-up points skipped)
+                self._day = sec // 86400
+                self._window.clear()
+            if self.last_sec is not None and sec - self.last_sec > 1:
+                push(self.last_sec + 1, sec, 'True Idle (Off)')
+            self._window.append(float(count))
+            if len(self._window) == self._window.maxlen:
+                push(sec, sec + 1, self._state(sum(self._window) / len(self._window)))
+            self.last_sec = sec
+        return segments
+
+
+@register_model
+class KMeansModel(StateModel):
+    """
+    TEST1 model: raw distinct variable count with the K-Means thresholds 17 / 24.
+    Each state lasts until the next logged second (no idle gaps).
+    """
+
+    name = "kmeans"
+    states = ('Active', 'Intermediate', 'Idle')
+
+    def __init__(self, low: float = 17, high: float = 24):
+        self.low = low
+        self.high = high
+
+    def classify(self, frame: pd.DataFrame) -> pd.DataFrame:
+        if frame.empty:
+            return rle_timeline(np.array([]), np.array([]), np.array([]))
+
+        sec = frame.index.to_numpy(dtype=np.int64)
+        counts = frame['distinct_vars_count'].to_numpy()
+        states = np.select(
+            [counts <= self.low, counts <= self.high],
+            ['Idle', 'Intermediate'],
+            default='Active',
+        ).astype(object)
+        ends = np.append(sec[1:], sec[-1] + 1)
+        return rle_timeline(sec, ends, states)
+
+
+@register_model
+class WeightedEmaModel(StateModel):
+    """Léo's model: weighted sensor score against a recursive EMA threshold (see working_idle)."""
+
+    name = "weighted_ema"
+    states = ('WORKING', 'IDLE')
+    required_variables = tuple(LEO_WEIGHTS)
+    gap_state = HOLE_STATE
+
+    def __init__(self, **engine_kwargs):
+        self.engine_kwargs = engine_kwargs
+
+    def classify(self, frame: pd.DataFrame) -> pd.DataFrame:
+        columns = {sensor_column(v): v for v in self.required_variables if sensor_column(v) in frame.columns}
+        long = (
+            frame[list(columns)]
+            .rename(columns=columns)
+            .rename_axis('sec')
+            .reset_index()
+            .melt(id_vars='sec', var_name='id_var', value_name='value')
+            .dropna(subset=['value'])
+            .sort_values('sec', kind='stable')
+        )
+
+        engine = WeightedEmaEngine(**self.engine_kwargs)
+        segments = engine.feed(long) + engine.finish()
+        if not segments:
+            return rle_timeline(np.array([]), np.array([]), np.array([]))
+
+        starts, ends, states = (np.array(col) for col in zip(*segments))
+        return rle_timeline(starts.astype(np.int64), ends.astype(np.int64), states.astype(object))
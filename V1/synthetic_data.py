@@ -0,0 +1,281 @@
+import argparse
+import csv
+import json
+import os
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+from ingest import TABLES, copy_batch
+
+# ----------------------------------------------------------------------
+# Synthetic telemetry for load tests and benchmarks.
+# Produces the two log tables of the real machine, day by day:
+#   - variable_log_float : per-second samples; the number of variables
+#     logged per second depends on the activity state (what the
+#     distinct_count / kmeans models measure), with the 260 / 630 load
+#     percentages and Léo's sensors following the state.
+#   - variable_log_string: 447 alarm lists in the real payload format and
+#     557 NC program names.
+#
+#   python synthetic_data.py --start 2021-01-01 --days 365 --machines 4 --format parquet --out synthetic/
+#   python synthetic_data.py --start 2021-03-01 --days 30 --format db
+#
+# Every (seed, machine, day) has its own random stream, so a day is always
+# generated identically, whatever range or machine count it is part of.
+# ----------------------------------------------------------------------
+
+# Activity states: mean number of float variables logged per second, mean
+# dwell time (s) and load percentage of variable 260 (630 follows it)
+STATES = {
+    "OFF": {"vars": 0, "dwell_sec": 2400, "load": 0.0},
+    "LOW": {"vars": 10, "dwell_sec": 600, "load": 8.0},
+    "INTERMEDIATE": {"vars": 17, "dwell_sec": 900, "load": 35.0},
+    "HIGH": {"vars": 26, "dwell_sec": 1500, "load": 70.0},
+}
+STATE_NAMES = list(STATES)
+
+# Transitions between states while the shift is on (rows/cols in STATE_NAMES order)
+TRANSITIONS = np.array([
+    [0.00, 0.70, 0.20, 0.10],
+    [0.10, 0.00, 0.50, 0.40],
+    [0.05, 0.35, 0.00, 0.60],
+    [0.02, 0.28, 0.70, 0.00],
+])
+
+# Variables always logged when the machine is on, then a pool of secondary ones
+LOAD_VARIABLES = [260, 630]
+LEO_VARIABLES = [550, 544, 537, 498, 620, 565]
+SECONDARY_VARIABLES = list(range(600, 640))
+
+SHIFT_START_HOUR = 6
+SHIFT_END_HOUR = 22
+
+# Real 447 entries (code, text, class, group, numeric id), most frequent first
+ALARM_CATALOG = [
+    ("PLC00010", "Puerta  abierta!", 3, 3, 50331658),
+    ("PLC00054", "Poti Avance = 0 !", 3, 3, 50331702),
+    ("PLC00051", "M01 Stop condicional", 3, 3, 50331699),
+    ("2a8-0003", "Colocar volante en el cargador", 2, 2, 44564483),
+    ("PLC00050", "M00 Stop programado", 3, 3, 50331698),
+    ("PLC00586", "ABRIR CARENADO CE", 3, 3, 50332234),
+    ("PLC00499", "PARADA DE AVANCES", 3, 3, 50332147),
+    ("PLC00587", "CERRAR CARENADO CE", 3, 3, 50332235),
+    ("PLC01003", "Colocar la hta 48 (indice 0) en el mandrino", 3, 3, 50332651),
+    ("PLC01001", "Retirar la hta. 48 (indice 0) del mandrino", 3, 3, 50332649),
+    ("PLC00052", "M03/M04 o M19/M20 necesarias", 3, 3, 50331700),
+    ("230-00fc", "Final de carrera (dynamic Limit)  AX_2 -", 1, 3, 36700412),
+    ("130-019b", "Tecla sin función", 1, 1, 19923355),
+]
+ALARM_WEIGHTS = np.array([40, 28, 5, 5, 3, 2, 2, 1, 1, 1, 1, 1, 1])
+ALARMS_PER_WORKING_HOUR = 0.8
+ALARM_MEAN_DURATION_SEC = 240
+
+PROGRAMS = [
+    "/mnt/tnc/CAM/DESBASTE_A-1.4_RESTO_DE_Z90_A_FONDO.h",
+    "/mnt/pcfox/(2H)COPIADO_DFN_A-1.6_LATERAL_1_H2.h",
+    "/mnt/pcfox/(30MIN)COPIADO_DFN_A-1.6_FONDO_1.3_H1.h",
+    "/mnt/tnc/CAM/ACABADO_DFN.h",
+]
+
+
+def _day_start_ms(day: date) -> int:
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def alarm_payload(entries: list) -> str:
+    """447 value for a list of catalogue entries: [["PLC00586","ABRIR CARENADO CE",3,3,50332234],...]."""
+    return json.dumps([list(e) for e in entries], ensure_ascii=False, separators=(",", ":"))
+
+
+class TelemetryGenerator:
+    """
+    Generates the logs of one machine, one UTC day at a time.
+    `vars_per_state` overrides the mean number of float variables logged per
+    second in each state (e.g. {"HIGH": 40} for a heavier day).
+    """
+
+    def __init__(self, seed: int = 0, machine: int = 0, vars_per_state: dict = None):
+        self.seed = seed
+        self.machine = machine
+        self.vars_per_state = {name: cfg["vars"] for name, cfg in STATES.items()}
+        self.vars_per_state.update(vars_per_state or {})
+        self.variables = np.array(LOAD_VARIABLES + LEO_VARIABLES + SECONDARY_VARIABLES, dtype=np.int64)
+        # Per-variable base level and noise, fixed for the machine
+        rng = np.random.default_rng([seed, machine])
+        self.base = rng.uniform(10, 1000, len(self.variables))
+        self.noise = rng.uniform(0.01, 0.1, len(self.variables)) * self.base
+
+    def _rng(self, day: date) -> np.random.Generator:
+        return np.random.default_rng([self.seed, self.machine, day.toordinal()])
+
+    def state_seconds(self, day: date, rng: np.random.Generator) -> np.ndarray:
+        """State index (in STATE_NAMES) of each second of the day; OFF outside the shift and on Sundays."""
+        states = np.zeros(86400, dtype=np.int8)
+        if day.weekday() == 6:
+            return states
+
+        sec = SHIFT_START_HOUR * 3600 + int(rng.integers(-1800, 1800))
+        shift_end = SHIFT_END_HOUR * 3600 + int(rng.integers(-1800, 1800))
+        state = 1
+        while sec < shift_end:
+            dwell = max(30, int(rng.exponential(STATES[STATE_NAMES[state]]["dwell_sec"])))
+            states[sec:min(sec + dwell, shift_end)] = state
+            sec += dwell
+            state = int(rng.choice(len(STATE_NAMES), p=TRANSITIONS[state]))
+        return states
+
+    def float_logs(self, day: date, states: np.ndarray, rng: np.random.Generator) -> pd.DataFrame:
+        """variable_log_float rows (date, id_var, value) of the day."""
+        on_sec = np.flatnonzero(states > 0)
+        if len(on_sec) == 0:
+            return pd.DataFrame({"date": np.array([], dtype=np.int64), "id_var": np.array([], dtype=np.int64), "value": np.array([])})
+
+        on_states = states[on_sec]
+        n_fixed = len(LOAD_VARIABLES) + len(LEO_VARIABLES)
+        n_pool = len(self.variables) - n_fixed
+
+        # Which variables are logged in each second: the fixed ones always,
+        # secondary ones with a probability giving the state's mean count
+        target = np.array([self.vars_per_state[name] for name in STATE_NAMES], dtype=float)[on_states]
+        p_secondary = np.clip((target - n_fixed) / n_pool, 0, 1)
+        mask = np.empty((len(on_sec), len(self.variables)), dtype=bool)
+        mask[:, :n_fixed] = True
+        mask[:, n_fixed:] = rng.random((len(on_sec), n_pool)) < p_secondary[:, None]
+
+        rows, cols = np.nonzero(mask)
+        sec = on_sec[rows]
+        id_var = self.variables[cols]
+
+        # Values: machine-specific level scaled by the activity, plus noise;
+        # 260 / 630 are load percentages
+        activity = (on_states[rows] / (len(STATE_NAMES) - 1)).astype(float)
+        value = self.base[cols] * (0.3 + activity) + rng.normal(0, 1, len(rows)) * self.noise[cols]
+        loads = np.array([STATES[name]["load"] for name in STATE_NAMES])[on_states[rows]]
+        is_260 = id_var == 260
+        is_630 = id_var == 630
+        value[is_260] = loads[is_260] + rng.normal(0, 4, is_260.sum())
+        value[is_630] = 0.9 * loads[is_630] + rng.normal(0, 4, is_630.sum())
+        value[is_260 | is_630] = np.clip(value[is_260 | is_630], 0, 100)
+
+        date_ms = _day_start_ms(day) + sec * 1000 + rng.integers(0, 1000, len(rows))
+        df = pd.DataFrame({"date": date_ms, "id_var": id_var, "value": np.round(value, 3)})
+        return df.sort_values(["date", "id_var"], kind="stable", ignore_index=True)
+
+    def string_logs(self, day: date, states: np.ndarray, rng: np.random.Generator) -> pd.DataFrame:
+        """variable_log_string rows of the day: 447 alarm lists and 557 program names."""
+        day_ms = _day_start_ms(day)
+        rows = []
+
+        # 557: program name at the start of every working (INTERMEDIATE/HIGH) period
+        working = states >= 2
+        starts = np.flatnonzero(working & ~np.concatenate([[False], working[:-1]]))
+        for sec in starts:
+            rows.append((day_ms + int(sec) * 1000, 557, PROGRAMS[int(rng.integers(len(PROGRAMS)))]))
+
+        # 447: alarm incidents while the machine is on; a new list is logged
+        # at every change of the active set
+        on_sec = np.flatnonzero(states > 0)
+        n_alarms = rng.poisson(ALARMS_PER_WORKING_HOUR * len(on_sec) / 3600)
+        if n_alarms:
+            begin = np.sort(rng.choice(on_sec, n_alarms))
+            end = begin + np.maximum(1, rng.exponential(ALARM_MEAN_DURATION_SEC, n_alarms).astype(np.int64))
+            codes = rng.choice(len(ALARM_CATALOG), n_alarms, p=ALARM_WEIGHTS / ALARM_WEIGHTS.sum())
+            changes = sorted(set(begin.tolist()) | set(end.tolist()))
+            for sec in changes:
+                active = sorted({int(c) for b, e, c in zip(begin, end, codes) if b <= sec < e})
+                rows.append((day_ms + min(sec, 86399) * 1000, 447, alarm_payload([ALARM_CATALOG[c] for c in active])))
+
+        df = pd.DataFrame(rows, columns=["date", "id_var", "value"])
+        return df.sort_values(["date", "id_var"], kind="stable", ignore_index=True)
+
+    def generate_day(self, day: date) -> tuple:
+        """(float DataFrame, string DataFrame) of one day, both with columns date, id_var, value."""
+        rng = self._rng(day)
+        states = self.state_seconds(day, rng)
+        return self.float_logs(day, states, rng), self.string_logs(day, states, rng)
+
+    def iter_days(self, start: date, n_days: int):
+        for offset in range(n_days):
+            day = start + timedelta(days=offset)
+            yield (day,) + self.generate_day(day)
+
+
+# ----------------------------------------------------------------------
+# Writers
+# ----------------------------------------------------------------------
+
+def write_parquet_day(root: str, kind: str, day: date, df: pd.DataFrame) -> str:
+    """Writes one day under the Hive layout <root>/<table>/day=YYYY-MM-DD/part-0.parquet."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    folder = os.path.join(root, TABLES[kind], f"day={day.isoformat()}")
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, "part-0.parquet")
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path, compression="zstd")
+    return path
+
+
+def write_copy_rows(stream, df: pd.DataFrame) -> None:
+    """Appends rows in the CSV shape of COPY <table> (date, id_var, value) FROM STDIN WITH (FORMAT csv)."""
+    csv.writer(stream).writerows(df.itertuples(index=False, name=None))
+
+
+def generate(start: date, n_days: int, machines: int = 1, seed: int = 0, fmt: str = "parquet",
+             out: str = "synthetic", batch_size: int = 50000) -> dict:
+    """
+    Generates `n_days` from `start` for `machines` machines and writes them:
+    - parquet: <out>/[machine_<k>/]<table>/day=YYYY-MM-DD/part-0.parquet
+    - csv    : <out>/[machine_<k>/]<table>.csv, ready for COPY ... FROM (FORMAT csv)
+    - db     : COPY into the configured database (one machine only, the schema
+               has no machine column)
+    Returns the number of rows written per table.
+    """
+    if fmt == "db" and machines != 1:
+        raise ValueError("The log tables hold a single machine: use --machines 1 with --format db.")
+
+    totals = {kind: 0 for kind in TABLES}
+    for machine in range(machines):
+        generator = TelemetryGenerator(seed=seed, machine=machine)
+        root = out if machines == 1 else os.path.join(out, f"machine_{machine}")
+        streams = {}
+        if fmt == "csv":
+            os.makedirs(root, exist_ok=True)
+            streams = {kind: open(os.path.join(root, f"{table}.csv"), "w", newline="", encoding="utf-8")
+                       for kind, table in TABLES.items()}
+        try:
+            for day, float_df, string_df in generator.iter_days(start, n_days):
+                for kind, df in (("float", float_df), ("string", string_df)):
+                    if df.empty:
+                        continue
+                    if fmt == "parquet":
+                        write_parquet_day(root, kind, day, df)
+                    elif fmt == "csv":
+                        write_copy_rows(streams[kind], df)
+                    else:
+                        rows = list(df.itertuples(index=False, name=None))
+                        for i in range(0, len(rows), batch_size):
+                            copy_batch(TABLES[kind], rows[i:i + batch_size])
+                    totals[kind] += len(df)
+                print(f"machine {machine} {day}: {len(float_df)} float rows, {len(string_df)} string rows")
+        finally:
+            for stream in streams.values():
+                stream.close()
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic machine telemetry (float / string logs).")
+    parser.add_argument("--start", default="2021-01-01", help="First day (YYYY-MM-DD, UTC).")
+    parser.add_argument("--days", type=int, default=7, help="Number of days.")
+    parser.add_argument("--machines", type=int, default=1, help="Number of machines.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (same seed = same data).")
+    parser.add_argument("--format", choices=["parquet", "csv", "db"], default="parquet", help="Output.")
+    parser.add_argument("--out", default="synthetic", help="Output folder (parquet / csv).")
+    args = parser.parse_args()
+
+    start_day = datetime.strptime(args.start, "%Y-%m-%d").date()
+    written = generate(start_day, args.days, args.machines, args.seed, args.format, args.out)
+    print(f"Done: {written['float']} float rows, {written['string']} string rows.")
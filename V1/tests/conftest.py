@@ -0,0 +1,46 @@
+import os
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+# The modules of V1 are imported flat (python app.py, python api_server.py, ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_service    # noqa: E402
+import database_dao    # noqa: E402
+import duckdb_backend  # noqa: E402
+from ingest import TABLES            # noqa: E402
+from parquet_export import SCHEMAS   # noqa: E402
+
+
+@pytest.fixture
+def parquet_log(tmp_path, monkeypatch):
+    """
+    Points the DAO at a DuckDB backend over a scratch PARQUET_ROOT and returns
+    write(kind, rows) storing (date_ms, id_var, value) rows in their day partitions.
+    """
+    monkeypatch.setattr(database_dao, "DB_BACKEND", "duckdb")
+    monkeypatch.setattr(database_dao, "DB_CONFIG", {"DB_BACKEND": "duckdb", "PARQUET_ROOT": str(tmp_path)})
+    monkeypatch.setattr(data_service, "DB_BACKEND", "duckdb")
+    monkeypatch.setattr(data_service, "ALARM_SQL", data_service.ALARM_SQL_BY_BACKEND["duckdb"])
+    monkeypatch.setattr(duckdb_backend, "_CONNECTION", None)
+    monkeypatch.setattr(duckdb_backend, "_LOCAL", type(duckdb_backend._LOCAL)())
+
+    def write(kind: str, rows: list) -> None:
+        df = pd.DataFrame(rows, columns=["date", "id_var", "value"])
+        days = pd.to_datetime(df["date"], unit="ms").dt.date.astype(str)
+        for part_day, part in df.groupby(days):
+            folder = tmp_path / TABLES[kind] / f"day={part_day}"
+            folder.mkdir(parents=True, exist_ok=True)
+            pq.write_table(pa.Table.from_pandas(part, schema=SCHEMAS[kind], preserve_index=False),
+                           folder / "part-0.parquet")
+
+    # Both log views need at least one file
+    for kind in TABLES:
+        folder = tmp_path / TABLES[kind] / "day=1970-01-01"
+        folder.mkdir(parents=True)
+        pq.write_table(SCHEMAS[kind].empty_table(), folder / "part-0.parquet")
+    return write
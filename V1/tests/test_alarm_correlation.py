@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+from data_service import get_alarm_state_correlation
+from test_state_models import _ms, busy_rows
+
+DOOR = '[["PLC00586","ABRIR CARENADO CE",3,3,50332234]]'
+RANGE = ("2021-03-15 00:00:00", "2021-03-16 23:59:59")
+
+
+@pytest.fixture
+def alarm_over_silent_midnight(parquet_log):
+    # Off from 23:20 to 00:40; the door alarm is active from 23:30 to 00:30
+    parquet_log("float", busy_rows("2021-03-15 22:00:00", "2021-03-15 23:20:00")
+                + busy_rows("2021-03-16 00:40:00", "2021-03-16 02:00:00"))
+    parquet_log("string", [(_ms("2021-03-15 23:30:00"), 447, DOOR), (_ms("2021-03-16 00:30:00"), 447, "[]")])
+
+
+def _minutes(df: pd.DataFrame) -> list:
+    return [(str(day), code, round(minutes, 6)) for day, code, minutes in
+            df[['day', 'alarm_code', 'idle_minutes']].itertuples(index=False)]
+
+
+def test_an_alarm_across_a_window_boundary_keeps_its_idle_minutes(alarm_over_silent_midnight):
+    single = get_alarm_state_correlation(*RANGE, chunk_days=31)
+    assert _minutes(single) == [("2021-03-15", "PLC00586", 30.0), ("2021-03-16", "PLC00586", 30.0)]
+    pd.testing.assert_frame_equal(get_alarm_state_correlation(*RANGE, chunk_days=1), single)
+
+
+def test_low_activity_is_only_counted_on_request(parquet_log):
+    # 10 distinct variables: Low Activity for the whole alarm
+    parquet_log("float", [(sec * 1000, var, 1.0) for sec in range(_ms("2021-03-15 10:00:00") // 1000,
+                                                                 _ms("2021-03-15 11:00:00") // 1000)
+                          for var in range(10)])
+    parquet_log("string", [(_ms("2021-03-15 10:10:00"), 447, DOOR), (_ms("2021-03-15 10:20:00"), 447, "[]")])
+
+    assert get_alarm_state_correlation(*RANGE).empty
+    opted_in = get_alarm_state_correlation(*RANGE, idle_states=('True Idle (Off)', 'Low Activity'))
+    assert _minutes(opted_in) == [("2021-03-15", "PLC00586", 10.0)]
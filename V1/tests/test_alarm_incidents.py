@@ -0,0 +1,45 @@
+from alarm_incidents import AlarmIncidentTracker, parse_alarm_list
+from data_service import ALARM_NOISE_PATTERN
+
+DOOR = '["PLC00586","ABRIR CARENADO CE",3,3,50332234]'
+OIL = '["PLC00123","NIVEL ACEITE",1,2,50332235]'
+NOISE = '["PLC00054","AVISO",1,1,50332236]'
+
+
+def _payload(*entries: str) -> str:
+    return "[" + ",".join(entries) + "]"
+
+
+def test_parse_alarm_list():
+    assert parse_alarm_list(_payload(DOOR, OIL)) == {("PLC00586", "ABRIR CARENADO CE"), ("PLC00123", "NIVEL ACEITE")}
+    assert parse_alarm_list("[]") == set()
+    assert parse_alarm_list(None) == set()
+
+
+def test_incidents_open_on_first_listing_and_close_when_no_longer_listed():
+    tracker = AlarmIncidentTracker()
+    assert tracker.feed(1000, _payload(DOOR)) == [("open", "PLC00586", "ABRIR CARENADO CE", 1000)]
+    # Still listed: nothing happens; a second alarm opens
+    assert tracker.feed(2000, _payload(DOOR, OIL)) == [("open", "PLC00123", "NIVEL ACEITE", 2000)]
+    assert tracker.feed(3000, _payload(OIL)) == [("close", "PLC00586", "ABRIR CARENADO CE", 1000, 3000)]
+    assert tracker.feed(4000, "[]") == [("close", "PLC00123", "NIVEL ACEITE", 2000, 4000)]
+    assert tracker.open_incidents == {}
+
+
+def test_noise_entries_are_ignored_entirely():
+    tracker = AlarmIncidentTracker(ALARM_NOISE_PATTERN)
+    tracker.feed(1000, _payload(DOOR))
+    # An entry with a noise alarm does not close the door incident either
+    assert tracker.feed(2000, _payload(NOISE)) == []
+    assert tracker.last_ms == 1000
+    assert list(tracker.open_incidents) == [("PLC00586", "ABRIR CARENADO CE")]
+
+
+def test_close_all_at_the_end_of_the_range():
+    tracker = AlarmIncidentTracker()
+    tracker.feed(1000, _payload(DOOR))
+    tracker.feed(5000, _payload(DOOR))
+    assert tracker.close_all() == [("close", "PLC00586", "ABRIR CARENADO CE", 1000, 5000)]
+    tracker.feed(6000, _payload(OIL))
+    assert tracker.close_all(9000) == [("close", "PLC00123", "NIVEL ACEITE", 6000, 9000)]
+    assert tracker.close_all() == []
@@ -0,0 +1,100 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+from batch import plan_batch, run_batch
+import data_service
+from data_service import get_energy_consumption, get_energy_consumption_multi, get_stoppages
+
+
+def _item(metric: str, from_date: str, until_date: str) -> dict:
+    return {"metric": metric, "from": from_date, "until": until_date}
+
+
+def test_overlapping_ranges_share_a_scan():
+    items = [
+        _item("ec", "2021-03-15 00:00:00", "2021-03-15 12:00:00"),
+        _item("ec", "2021-03-20 00:00:00", "2021-03-20 23:59:59"),
+        _item("ec", "2021-03-15 06:00:00", "2021-03-15 18:00:00"),
+        _item("ec", "2021-03-15 18:00:00", "2021-03-15 23:59:59"),   # starts where the previous one ends
+        _item("wh", "2021-03-15 00:00:00", "2021-03-15 12:00:00"),
+    ]
+    groups, errors = plan_batch(items)
+    assert errors == {}
+    assert sorted(groups) == [("ec", [0, 2, 3]), ("ec", [1]), ("wh", [4])]
+
+
+def test_stops_and_their_summary_share_a_scan_of_the_same_range():
+    items = [
+        _item("stops", "2021-03-15", "2021-03-16"),
+        _item("stops_summary", "2021-03-15", "2021-03-16"),
+        _item("stops_summary", "2021-03-15", "2021-03-17"),   # overlaps, but another range: its own scan
+    ]
+    groups, _ = plan_batch(items)
+    assert groups == [("stops", [0, 1]), ("stops", [2])]
+
+
+def test_invalid_items_are_reported_by_index():
+    items = [
+        _item("nope", "2021-03-15", "2021-03-16"),
+        {"metric": "ec", "from": "2021-03-15"},
+        _item("ec", "not a date", "2021-03-16"),
+        _item("ec", "2021-03-15", "2021-03-16"),
+    ]
+    groups, errors = plan_batch(items)
+    assert sorted(errors) == [0, 1, 2]
+    assert "Unknown metric" in errors[0]
+    assert groups == [("ec", [3])]
+
+
+def _ms(text: str) -> int:
+    return int(datetime.strptime(text, "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+@pytest.fixture
+def load_day(parquet_log):
+    """Load of 260 every minute of 2021-03-15: 100 % until 06:00, 0 % until 12:00, then 50 %."""
+    rows = []
+    for minute in range(24 * 60):
+        pct = 100.0 if minute < 6 * 60 else 0.0 if minute < 12 * 60 else 50.0
+        rows.append((_ms("2021-03-15 00:00") + minute * 60_000, 260, pct))
+    parquet_log("float", rows)
+
+
+def test_mid_day_ranges_only_see_their_own_samples(load_day):
+    ranges = [("2021-03-15 00:00:00", "2021-03-15 11:59:59"), ("2021-03-15 06:00:00", "2021-03-15 17:59:59")]
+    singles = [get_energy_consumption(*r) for r in ranges]
+    multi = get_energy_consumption_multi(ranges)
+
+    # 6 h at 15 kW; then 5 h 59 min at 7.5 kW (the last sample of the range opens no interval)
+    assert singles[0]['total_energy_kwh'].sum() == pytest.approx(90.0)
+    assert singles[1]['total_energy_kwh'].sum() == pytest.approx(7.5 * (5 + 59 / 60))
+    for single, merged in zip(singles, multi):
+        pd.testing.assert_frame_equal(merged.reset_index(drop=True), single.reset_index(drop=True))
+
+
+def test_run_batch_answers_like_the_single_calls(load_day):
+    items = [_item("ec", "2021-03-15 00:00:00", "2021-03-15 11:59:59"),
+             _item("ec", "2021-03-15 06:00:00", "2021-03-15 17:59:59")]
+    results = run_batch(items)
+    assert [r["status"] for r in results] == ["success", "success"]
+    for item, result in zip(items, results):
+        expected = get_energy_consumption(item["from"], item["until"])
+        assert result["df"]['total_energy_kwh'].sum() == pytest.approx(expected['total_energy_kwh'].sum())
+
+
+def test_stops_and_summary_of_a_batch_come_from_one_scan(parquet_log, monkeypatch):
+    # 447 silent for 10 minutes from 10:01
+    parquet_log("string", [(_ms(f"2021-03-15 {hhmm}"), 447, hhmm) for hhmm in ("10:00", "10:01", "10:11", "10:12")])
+    scans = []
+    scan = data_service._scan_stoppages
+    monkeypatch.setattr(data_service, "_scan_stoppages", lambda *args: scans.append(args) or scan(*args))
+
+    results = run_batch([_item("stops", "2021-03-15", "2021-03-15"), _item("stops_summary", "2021-03-15", "2021-03-15")])
+    assert len(scans) == 1
+    stops, summary = get_stoppages("2021-03-15", "2021-03-15", with_summary=True)
+    pd.testing.assert_frame_equal(results[0]["df"], stops)
+    pd.testing.assert_frame_equal(results[1]["df"], summary)
+    assert list(stops['cause']) == ["10:01"]
+    assert list(summary['stop_count']) == [1]
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_service import _lttb_indices, downsample
+
+
+def _lttb_reference(x: np.ndarray, y: np.ndarray, n_out: int) -> list:
+    """Plain-loop LTTB over the same buckets (inner points split by np.linspace)."""
+    edges = np.linspace(0, len(x) - 2, n_out - 1).astype(np.int64) + 1
+    buckets = [list(range(a, b)) for a, b in zip(edges[:-1], edges[1:])]
+    selected, prev = [0], 0
+    for b, bucket in enumerate(buckets):
+        nxt = buckets[b + 1] if b + 1 < len(buckets) else [len(x) - 1]
+        avg_x, avg_y = np.mean(x[nxt]), np.mean(y[nxt])
+        areas = [abs((x[prev] - avg_x) * (y[i] - y[prev]) - (x[prev] - x[i]) * (avg_y - y[prev])) for i in bucket]
+        prev = bucket[int(np.argmax(areas))]
+        selected.append(prev)
+    return selected + [len(x) - 1]
+
+
+@pytest.mark.parametrize("n, n_out", [(1000, 100), (1003, 17), (50, 49), (10, 3)])
+def test_lttb_matches_the_reference_loop(n, n_out):
+    rng = np.random.default_rng(n)
+    x = np.cumsum(rng.uniform(0.5, 1.5, n))
+    y = rng.normal(size=n)
+    assert list(_lttb_indices(x, y, n_out)) == _lttb_reference(x, y, n_out)
+
+
+def test_lttb_keeps_the_ends_and_a_lone_spike():
+    x = np.arange(1000.0)
+    y = np.zeros(1000)
+    y[537] = 10.0
+    idx = _lttb_indices(x, y, 50)
+    assert len(idx) == 50
+    assert idx[0] == 0 and idx[-1] == 999
+    assert np.all(np.diff(idx) > 0)
+    assert 537 in idx
+
+
+def test_downsample_leaves_small_series_unchanged_and_drops_missing_values():
+    df = pd.DataFrame({"t": pd.date_range("2021-03-15", periods=5, freq="s"), "v": [1.0, None, 3.0, 4.0, 5.0]})
+    assert list(downsample(df, "t", "v", max_points=10)["v"]) == [1.0, 3.0, 4.0, 5.0]
+
+
+def test_downsample_on_timestamps():
+    df = pd.DataFrame({"t": pd.date_range("2021-03-15", periods=5000, freq="s"), "v": np.sin(np.arange(5000) / 40)})
+    for mode in ("lttb", "minmax"):
+        out = downsample(df, "t", "v", max_points=200, mode=mode)
+        assert len(out) <= 200
+        assert out["t"].is_monotonic_increasing
+    with pytest.raises(ValueError):
+        downsample(df, "t", "v", mode="mean")
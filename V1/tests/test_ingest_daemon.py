@@ -0,0 +1,87 @@
+import pytest
+
+import ingest_daemon
+from ingest_daemon import IngestDaemon, format_feed_line, is_data_error, parse_feed_line
+
+BAD_ID = 666       # rows the database rejects
+OUTAGE_ID = 777    # rows whose write fails for another reason
+
+
+class DatabaseError(Exception):
+    """Carries a SQLSTATE like the psycopg2 errors."""
+
+    def __init__(self, pgcode):
+        super().__init__(f"SQLSTATE {pgcode}")
+        self.pgcode = pgcode
+
+
+def test_feed_line_round_trip():
+    for line in ["float,2021-03-15 10:00:01.250,630,12.5", "string,2021-03-15 10:00:02.000,447,[]",
+                 "float,2021-03-15 10:00:03.000,260,"]:
+        kind, row = parse_feed_line(line)
+        assert parse_feed_line(",".join(str(f) for f in format_feed_line(kind, row))) == (kind, row)
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_daemon, "RETRY_SEC", 0.01)
+    daemon = IngestDaemon(batch_size=8, max_wait_sec=0.05, dead_letter_path=str(tmp_path / "dead.csv"))
+    daemon.written = []
+
+    def write_batch(batch, final=False):
+        ids = {row[1] for _, row in batch}
+        if BAD_ID in ids:
+            raise DatabaseError("22P02")    # invalid_text_representation
+        if OUTAGE_ID in ids:
+            raise DatabaseError(daemon.outage_pgcode)
+        daemon.written.extend(batch)
+
+    daemon.write_batch = write_batch
+    daemon.outage_pgcode = None             # e.g. connection lost: no SQLSTATE
+    return daemon
+
+
+def _run(daemon, n_rows: int, bad: set, outage: set = frozenset()) -> None:
+    daemon._flusher.start()
+    for i in range(n_rows):
+        id_var = BAD_ID if i in bad else OUTAGE_ID if i in outage else 630
+        daemon.add_line(f"float,2021-03-15 00:00:{i:02d}.000,{id_var},{i}")
+    daemon.stop()
+
+
+def _values(rows: list) -> list:
+    return [row[2] for _, row in rows]
+
+
+def test_only_data_errors_are_blamed_on_the_rows():
+    assert is_data_error(DatabaseError("22P02"))
+    assert is_data_error(DatabaseError("23505"))     # unique_violation
+    assert not is_data_error(DatabaseError("57P01"))  # admin_shutdown
+    assert not is_data_error(DatabaseError(None))
+    assert not is_data_error(ValueError("no SQLSTATE"))
+
+
+def test_rejected_rows_are_dead_lettered_and_the_others_loaded(daemon):
+    _run(daemon, 20, bad={3, 11})
+    assert len(daemon.written) == 18
+    assert daemon.dead_lettered == 2
+    with open(daemon.dead_letter_path) as f:
+        rows = [parse_feed_line(line) for line in f]
+    assert _values(rows) == [3.0, 11.0]
+
+
+@pytest.mark.parametrize("pgcode", [None, "57P01", "40P01"])
+def test_other_errors_keep_the_rows_at_the_head_of_the_buffer(daemon, pgcode):
+    daemon.outage_pgcode = pgcode
+    _run(daemon, 5, bad=set(), outage={1})
+    assert daemon.dead_lettered == 0
+    assert _values(daemon._rows) == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+def test_a_row_failing_for_another_reason_while_isolating_is_retried(daemon):
+    _run(daemon, 20, bad={3}, outage={11})
+    assert daemon.dead_lettered == 1
+    # Row 11 and what was not written after it wait, in order, in the buffer: nothing lost, nothing twice
+    assert 11.0 in _values(daemon._rows)
+    assert _values(daemon._rows) == sorted(_values(daemon._rows))
+    assert sorted(_values(daemon.written) + _values(daemon._rows)) == [float(i) for i in range(20) if i != 3]
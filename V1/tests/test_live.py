@@ -0,0 +1,99 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from live import EnergyAccumulator, EventLog
+from state_models import DistinctCountModel, OnlineDistinctCount, rle_timeline
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+
+
+def _feed(accumulator: EnergyAccumulator, samples: list) -> dict:
+    return accumulator.feed(np.array([t for t, _ in samples], dtype=np.int64),
+                            np.array([v for _, v in samples], dtype=float))
+
+
+def test_online_distinct_count_matches_the_batch_model():
+    rng = np.random.default_rng(0)
+    # Twenty minutes around midnight (warm-up restarts), with a long hole and random missing seconds
+    secs = np.arange(86400 - 600, 86400 + 600)
+    secs = secs[((secs < 86400 - 300) | (secs > 86400 - 200)) & (rng.random(len(secs)) > 0.05)]
+    counts = rng.integers(5, 30, len(secs))
+    expected = DistinctCountModel().classify(pd.DataFrame({'distinct_vars_count': counts}, index=secs))
+
+    online = OnlineDistinctCount()
+    segments = []
+    for i in range(0, len(secs), 97):
+        segments.extend(online.feed(secs[i:i + 97], counts[i:i + 97]))
+    starts, ends, states = (np.array(column) for column in zip(*segments))
+    got = rle_timeline(starts, ends, states.astype(object))
+
+    pd.testing.assert_frame_equal(got.reset_index(drop=True), expected.reset_index(drop=True), check_dtype=False)
+    assert online.last_sec == secs[-1]
+
+
+def test_energy_of_the_on_intervals():
+    accumulator = EnergyAccumulator(power_kw=15.0)
+    added = _feed(accumulator, [(0, 100.0), (HOUR_MS, 50.0), (2 * HOUR_MS, 0.0), (3 * HOUR_MS, 0.0)])
+    # 1 h at 15 kW + 1 h at 7.5 kW; the 0 % hour adds nothing
+    assert added == {date(1970, 1, 1): pytest.approx(22.5)}
+    assert accumulator.kwh == pytest.approx(22.5)
+
+
+def test_energy_is_split_at_midnight_and_across_feeds():
+    samples = [(DAY_MS - HOUR_MS, 100.0), (DAY_MS + 2 * HOUR_MS, 100.0), (DAY_MS + 3 * HOUR_MS, 0.0)]
+    whole = EnergyAccumulator()
+    assert _feed(whole, samples) == {date(1970, 1, 1): pytest.approx(15.0), date(1970, 1, 2): pytest.approx(45.0)}
+
+    split = EnergyAccumulator()
+    _feed(split, samples[:1])
+    _feed(split, samples[1:])
+    assert split.kwh == pytest.approx(whole.kwh)
+
+
+def test_energy_clamps_the_percentage():
+    accumulator = EnergyAccumulator(power_kw=10.0)
+    _feed(accumulator, [(0, 250.0), (HOUR_MS, -5.0), (2 * HOUR_MS, 0.0)])
+    assert accumulator.kwh == pytest.approx(10.0)
+
+
+def test_late_energy_samples_are_dropped():
+    accumulator = EnergyAccumulator(power_kw=15.0)
+    _feed(accumulator, [(0, 100.0), (HOUR_MS, 100.0), (2 * HOUR_MS, 0.0)])
+    # A late sender: older than the last sample fed, it would open a negative
+    # interval and then re-count the last two hours
+    assert _feed(accumulator, [(HOUR_MS // 2, 100.0)]) == {}
+    assert _feed(accumulator, [(2 * HOUR_MS, 100.0)]) == {}
+    _feed(accumulator, [(HOUR_MS, 100.0), (3 * HOUR_MS, 0.0)])
+    assert accumulator.kwh == pytest.approx(30.0)
+
+
+def test_energy_samples_of_a_batch_are_sorted():
+    in_order = EnergyAccumulator()
+    _feed(in_order, [(0, 100.0), (HOUR_MS, 40.0), (2 * HOUR_MS, 0.0)])
+    shuffled = EnergyAccumulator()
+    _feed(shuffled, [(2 * HOUR_MS, 0.0), (0, 100.0), (HOUR_MS, 40.0)])
+    assert shuffled.kwh == pytest.approx(in_order.kwh) == pytest.approx(21.0)
+
+
+def test_event_log_resumes_after_a_known_id():
+    log = EventLog(max_events=10)
+    log.append([{"n": 1}, {"n": 2}, {"n": 3}])
+    assert log.since(log.event_id(1)) == ([(2, {"n": 2}), (3, {"n": 3})], True)
+    # Up to date, and resuming from just before the oldest kept event
+    assert log.since(log.event_id(3)) == ([], True)
+    assert log.since(log.event_id(0)) == ([(1, {"n": 1}), (2, {"n": 2}), (3, {"n": 3})], True)
+
+
+def test_event_log_asks_for_a_resync_on_unknown_ids():
+    log = EventLog(max_events=3)
+    log.append([{"n": i} for i in range(1, 6)])   # 1 and 2 fell out of the buffer
+    assert log.since(log.event_id(2)) == ([(3, {"n": 3}), (4, {"n": 4}), (5, {"n": 5})], True)
+    assert log.since(log.event_id(1)) == ([], False)
+    assert log.since(log.event_id(6)) == ([], False)       # from the future
+    assert log.since("0-3") == ([], False)                 # another process
+    assert log.since(f"{log.stream}-x") == ([], False)
+    assert log.since(None) == ([], False)
@@ -0,0 +1,33 @@
+import asyncio
+
+from api_server import LiveHub
+
+
+def test_events_logged_before_the_wait_are_not_missed():
+    async def scenario():
+        hub = LiveHub()
+        seen = hub.log.last_seq
+        # A refresh lands while the subscriber is still writing its previous frames
+        hub.log.append([{"type": "state"}])
+        async with hub._changed:
+            hub._changed.notify_all()
+        return await hub.wait(seen, timeout=0.05), await hub.wait(hub.log.last_seq, timeout=0.05)
+
+    assert asyncio.run(scenario()) == (True, False)
+
+
+def test_wait_wakes_up_on_new_events():
+    async def scenario():
+        hub = LiveHub()
+        waiter = asyncio.create_task(hub.wait(hub.log.last_seq, timeout=5))
+        await asyncio.sleep(0.01)
+        async with hub._changed:   # a refresh without events does not wake it up
+            hub._changed.notify_all()
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        hub.log.append([{"type": "alarm_open"}])
+        async with hub._changed:
+            hub._changed.notify_all()
+        return await asyncio.wait_for(waiter, 1)
+
+    assert asyncio.run(scenario())
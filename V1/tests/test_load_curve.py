@@ -0,0 +1,48 @@
+import pandas as pd
+import pytest
+
+import data_service
+from data_service import get_load_curve
+from test_state_models import _ms
+
+RANGE = ("2021-03-15 00:00:00", "2021-03-15 23:59:59")
+
+
+@pytest.fixture
+def load_log(parquet_log):
+    """Load of 260 every minute of 2021-03-15, out of bounds on purpose (-20 .. 140 %)."""
+    parquet_log("float", [(_ms("2021-03-15 00:00:00") + m * 60_000, 260, float(m % 161 - 20)) for m in range(24 * 60)])
+
+
+def test_raw_log_without_a_pyramid_is_clamped(load_log):
+    df = get_load_curve(*RANGE, max_points=5000)
+    assert len(df) == 24 * 60
+    assert df['load_pct'].between(0, 100).all()
+
+
+def test_pyramid_before_its_watermark_then_raw_log(load_log, monkeypatch):
+    fetched = []
+
+    def fake_series(id_var, ms_start, ms_end, level, size):
+        fetched.append((ms_start, ms_end))
+        # Rolled-up hours 00:00 .. 11:00, averages out of bounds like the raw values
+        return pd.DataFrame({'date': pd.date_range("2021-03-15 00:00", periods=12, freq="h"),
+                             'avg_value': [150.0, -10.0] * 6})
+
+    monkeypatch.setattr(data_service, "_pyramid_watermark", lambda: _ms("2021-03-15 12:00:00") // 1000)
+    monkeypatch.setattr(data_service, "_fetch_series", fake_series)
+    df = get_load_curve(*RANGE, max_points=5000)
+
+    # Only the part before the watermark is asked to the pyramid
+    assert fetched == [(_ms("2021-03-15 00:00:00"), _ms("2021-03-15 12:00:00") - 1)]
+    # ... the rest of the day comes from the raw log instead of stopping at 11:00
+    assert len(df) == 12 + 12 * 60
+    assert df['date'].iloc[-1] == pd.Timestamp("2021-03-15 23:59:00")
+    assert df['date'].is_monotonic_increasing
+    assert df['load_pct'].between(0, 100).all()
+
+
+def test_stale_pyramid_before_the_range(load_log, monkeypatch):
+    monkeypatch.setattr(data_service, "_pyramid_watermark", lambda: _ms("2021-03-01 00:00:00") // 1000)
+    monkeypatch.setattr(data_service, "_fetch_series", lambda *args: pytest.fail("pyramid read past its watermark"))
+    assert len(get_load_curve(*RANGE, max_points=5000)) == 24 * 60
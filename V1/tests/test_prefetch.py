@@ -0,0 +1,55 @@
+import threading
+
+from prefetch import RangePrefetcher, adjacent_ranges
+from result_cache import ResultCache
+
+
+def test_adjacent_ranges_with_times():
+    assert adjacent_ranges("2021-03-15 00:00:00", "2021-03-21 23:59:59") == [
+        ("2021-03-08 00:00:00", "2021-03-14 23:59:59"),
+        ("2021-03-22 00:00:00", "2021-03-28 23:59:59"),
+    ]
+
+
+def test_adjacent_ranges_of_a_mid_day_window():
+    assert adjacent_ranges("2021-03-15 06:00:00", "2021-03-15 11:59:59") == [
+        ("2021-03-15 00:00:00", "2021-03-15 05:59:59"),
+        ("2021-03-15 12:00:00", "2021-03-15 17:59:59"),
+    ]
+
+
+def test_adjacent_ranges_with_dates_only():
+    # Whole days, in the input format (across a month end)
+    assert adjacent_ranges("2021-03-29", "2021-04-02") == [
+        ("2021-03-24", "2021-03-28"),
+        ("2021-04-03", "2021-04-07"),
+    ]
+
+
+def test_scopes_are_forgotten_when_done_and_bounded_while_busy():
+    release = threading.Event()
+    calls = {"ec": lambda f, u: (release.wait(5), f)[1]}
+    prefetcher = RangePrefetcher(ResultCache(max_entries=2048), calls, max_scopes=10)
+    try:
+        for i in range(50):
+            prefetcher.schedule(f"session-{i}", ["ec"], f"2021-03-{1 + i % 28:02d}", f"2021-03-{1 + i % 28:02d}")
+        assert prefetcher.tracked_scopes() <= 10
+
+        release.set()
+        prefetcher._executor.submit(lambda: None).result(timeout=5)   # queue drained
+        assert prefetcher.tracked_scopes() == 0
+    finally:
+        release.set()
+        prefetcher.shutdown()
+
+
+def test_same_request_of_a_scope_is_not_queued_twice():
+    prefetcher = RangePrefetcher(ResultCache(), {"ec": lambda f, u: f})
+    try:
+        with prefetcher.foreground():
+            # Held back by the foreground request: still pending on the second call
+            assert prefetcher.schedule("s", ["ec"], "2021-03-15", "2021-03-21") == 2
+            assert prefetcher.schedule("s", ["ec"], "2021-03-15", "2021-03-21") == 0
+            assert prefetcher.schedule("s", ["ec", "unknown"], "2021-03-22", "2021-03-28") == 2
+    finally:
+        prefetcher.shutdown()
@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+
+import pandas as pd
+import pytest
+
+from data_service import evaluate_state_models, get_state_timeline
+
+BUSY_VARS = range(100, 125)   # 25 distinct variables: High Activity
+
+
+def _ms(text: str) -> int:
+    return int(datetime.strptime(text, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def busy_rows(from_text: str, until_text: str) -> list:
+    """Every variable of BUSY_VARS logged on each second of [from, until)."""
+    return [(sec * 1000, var, 1.0) for sec in range(_ms(from_text) // 1000, _ms(until_text) // 1000)
+            for var in BUSY_VARS]
+
+
+@pytest.fixture
+def overnight_hole(parquet_log):
+    # Busy until 23:40:00, silent for 39 minutes across midnight, busy again from 00:19:00
+    parquet_log("float", busy_rows("2021-03-15 23:00:00", "2021-03-15 23:40:00")
+                + busy_rows("2021-03-16 00:19:00", "2021-03-16 01:00:00"))
+
+
+RANGE = ("2021-03-15 00:00:00", "2021-03-16 23:59:59")
+
+
+def test_the_hole_between_two_windows_gets_the_gap_state(overnight_hole):
+    timeline = get_state_timeline(*RANGE, chunk_days=1)
+    hole = timeline[timeline['state'] == 'True Idle (Off)']
+    assert list(hole['start']) == [pd.Timestamp("2021-03-15 23:40:00")]
+    assert list(hole['end']) == [pd.Timestamp("2021-03-16 00:19:00")]
+    pd.testing.assert_frame_equal(timeline, get_state_timeline(*RANGE, chunk_days=31))
+
+
+@pytest.mark.parametrize("model", ["distinct_count", "kmeans"])
+def test_evaluation_does_not_depend_on_the_window_size(overnight_hole, model):
+    daily = evaluate_state_models(*RANGE, models=[model], chunk_days=1)
+    single = evaluate_state_models(*RANGE, models=[model], chunk_days=31)
+    pd.testing.assert_frame_equal(daily, single)
+
+
+def test_evaluation_matches_the_timeline(overnight_hole):
+    totals = evaluate_state_models(*RANGE, models=["distinct_count"], chunk_days=1).set_index('state')['total_hours']
+    timeline = get_state_timeline(*RANGE, chunk_days=1)
+    hours = ((timeline['end'] - timeline['start']).dt.total_seconds() / 3600).groupby(timeline['state']).sum()
+    pd.testing.assert_series_equal(totals.sort_index(), hours.sort_index(), check_names=False)
+    assert totals['True Idle (Off)'] == pytest.approx(39 / 60)
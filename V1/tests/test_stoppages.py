@@ -0,0 +1,71 @@
+import pandas as pd
+
+from data_service import StoppageDetector
+
+DAY_MS = 86400 * 1000
+MIN_MS = 60 * 1000
+
+
+def _entries(rows: list) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=['id_var', 'date', 'value'])
+
+
+ENTRIES = _entries([
+    (447, 0, 'a'),
+    (447, 1 * MIN_MS, 'b'),
+    (447, 11 * MIN_MS, 'c'),          # 10 min after 'b': a stop caused by 'b'
+    (447, 12 * MIN_MS, 'd'),
+    (557, 0, 'x'),
+    (557, DAY_MS + 30 * MIN_MS, 'y'),  # crosses midnight: booked on the day it ends
+])
+
+
+def test_gaps_longer_than_min_gap_are_stops_with_the_previous_entry_as_cause():
+    detector = StoppageDetector(min_gap_sec=300)
+    detector.feed(ENTRIES)
+    stops = detector.stops()
+
+    # Ordered by start
+    assert list(stops['id_var']) == [557, 447]
+    assert list(stops['cause']) == ['x', 'b']
+    assert list(stops['duration_min']) == [24 * 60 + 30.0, 10.0]
+    assert stops['start'].iloc[1] == pd.Timestamp(MIN_MS, unit='ms')
+
+
+def test_short_gaps_are_not_stops():
+    detector = StoppageDetector(min_gap_sec=15 * 60)
+    detector.feed(ENTRIES)
+    assert list(detector.stops()['id_var']) == [557]
+
+
+def test_chunk_boundaries_do_not_change_the_result():
+    whole = StoppageDetector()
+    whole.feed(ENTRIES)
+
+    chunked = StoppageDetector()
+    for start in range(0, len(ENTRIES), 2):
+        # Boundaries fall inside the silence of 447 and between the two variables
+        chunked.feed(ENTRIES.iloc[start:start + 2])
+
+    pd.testing.assert_frame_equal(chunked.stops(), whole.stops())
+    pd.testing.assert_frame_equal(chunked.summary(), whole.summary())
+
+
+def test_summary_counts_stops_per_day_and_variable():
+    detector = StoppageDetector()
+    detector.feed(ENTRIES)
+    summary = detector.summary()
+
+    assert list(zip(summary['day'].astype(str), summary['id_var'], summary['stop_count'])) == [
+        ('1970-01-01', 447, 1),
+        ('1970-01-02', 557, 1),
+    ]
+    assert summary['top_causes'].iloc[1] == ['x']
+
+
+def test_drain_stops_keeps_the_summary():
+    detector = StoppageDetector()
+    detector.feed(ENTRIES)
+    assert len(detector.drain_stops()) == 2
+    assert detector.drain_stops().empty
+    assert detector.summary()['stop_count'].sum() == 2
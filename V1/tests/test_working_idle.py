@@ -0,0 +1,47 @@
+import pandas as pd
+
+from working_idle import HOLE_STATE, LEO_WEIGHTS, SegmentFuser, WeightedEmaEngine
+
+
+def _rows(secs, value: float = 1000.0) -> pd.DataFrame:
+    """Every weighted sensor logged at `value` on each second."""
+    return pd.DataFrame([(s, v, value) for s in secs for v in LEO_WEIGHTS], columns=['sec', 'id_var', 'value'])
+
+
+def _run(chunks: list) -> list:
+    engine = WeightedEmaEngine()
+    segments = []
+    for chunk in chunks:
+        segments.extend(engine.feed(chunk))
+    return segments + engine.finish()
+
+
+def test_a_hole_closes_the_segment_and_is_booked_as_idle():
+    rows = _rows(list(range(0, 100)) + list(range(200, 300)))
+    assert _run([rows]) == [(0, 100, 'WORKING'), (100, 200, HOLE_STATE), (200, 300, 'WORKING')]
+
+
+def test_a_hole_across_a_chunk_boundary():
+    rows = _rows(list(range(0, 100)) + list(range(200, 300)))
+    # The first chunk ends right before the hole
+    chunks = [rows[rows['sec'] < 100], rows[rows['sec'] >= 100]]
+    assert _run(chunks) == [(0, 100, 'WORKING'), (100, 200, HOLE_STATE), (200, 300, 'WORKING')]
+
+
+def test_chunk_size_does_not_change_the_segments():
+    secs = list(range(0, 150)) + list(range(160, 400))
+    rows = pd.concat([_rows(secs[:200]), _rows(secs[200:], value=50.0)], ignore_index=True)
+    whole = _run([rows])
+    assert _run([rows.iloc[i:i + 37] for i in range(0, len(rows), 37)]) == whole
+    # The segments tile the whole span
+    assert whole[0][0] == 0 and whole[-1][1] == 400
+    assert all(a[1] == b[0] for a, b in zip(whole, whole[1:]))
+
+
+def test_fuser_removes_micro_segments_between_identical_states():
+    fuser = SegmentFuser(min_segment_sec=5)
+    emitted = []
+    for segment in [(0, 10, 'WORKING'), (10, 12, 'IDLE'), (12, 30, 'WORKING'), (30, 40, 'IDLE')]:
+        emitted.extend(fuser.push(*segment))
+    emitted.extend(fuser.flush())
+    assert emitted == [(0, 30, 'WORKING'), (30, 40, 'IDLE')]
@@ -0,0 +1,60 @@
+import zlib
+
+from database_dao import execute_sql_command, run_query_data
+
+# ----------------------------------------------------------------------
+# Progress of the batch jobs that rebuild derived tables (rollups.py,
+# daily_kpi.py), stored apart from the tables themselves: ingest_daemon.py
+# adds to the same tables in real time, so their MAX(bucket) / MAX(day)
+# says nothing about what the batch jobs have covered.
+#
+#   derived_watermarks(name, value)   value = epoch second before which the
+#                                     job's rows are final
+#
+# Every writer of a derived table (batch job chunk, daemon micro-batch)
+# first takes its transaction-level advisory lock (lock_derived), so a
+# recomputation and an increment never interleave. Locks are always taken
+# in the order of DERIVED (no deadlock between the daemon and a job).
+# ----------------------------------------------------------------------
+
+WATERMARK_TABLE = "derived_watermarks"
+
+ROLLUPS = "rollups"
+DAILY_KPI = "daily_kpi"
+DERIVED = [ROLLUPS, DAILY_KPI]
+
+
+def setup_watermarks():
+    """Creates the watermark table (no-op if it already exists)."""
+    execute_sql_command(f"""
+        CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (
+            name        TEXT PRIMARY KEY,
+            value       BIGINT NOT NULL,
+            updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+
+
+def get_watermark(name: str) -> int:
+    """Epoch second before which `name` is final, or None if its job never ran."""
+    df = run_query_data(f"SELECT value FROM {WATERMARK_TABLE} WHERE name = :name;", {"name": name})
+    return int(df['value'].iloc[0]) if not df.empty else None
+
+
+def advance_watermark(cursor, name: str, value: int, covered_from: int) -> None:
+    """
+    Moves the watermark of `name` to `value`, in the transaction that wrote its
+    rows. The job covered [covered_from, value): the watermark only moves when
+    that range starts at or before it (no uncovered days skipped), never back.
+    """
+    cursor.execute(f"""
+        INSERT INTO {WATERMARK_TABLE} (name, value) VALUES (%s, %s)
+        ON CONFLICT (name) DO UPDATE SET value = EXCLUDED.value, updated_at = now()
+        WHERE {WATERMARK_TABLE}.value >= %s AND {WATERMARK_TABLE}.value < EXCLUDED.value;
+    """, (name, int(value), int(covered_from)))
+
+
+def lock_derived(cursor, *names: str) -> None:
+    """Takes the advisory locks of the derived tables, held until the transaction ends."""
+    for name in sorted(names, key=DERIVED.index):
+        cursor.execute("SELECT pg_advisory_xact_lock(%s);", (zlib.crc32(f"derived:{name}".encode()),))
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+# ----------------------------------------------------------------------
+# Léo's WORKING / IDLE pipeline (SQL SCRIPTS/Working-Idle_pipeline_Léo)
+# as a streaming engine: chunks in, closed segments out, bounded memory.
+# ----------------------------------------------------------------------
+
+# Weight of each sensor in the activity score
+LEO_WEIGHTS = {
+    550: 0.5,   # spindle rpm
+    544: 0.3,   # spindle load
+    537: 0.05,  # x motor
+    498: 0.05,  # y motor
+    620: 0.05,  # z motor
+    565: 0.05,  # eje5 motor
+}
+
+# Divisors applied before weighting (rpm is rescaled like in 02_weighted_score_ema.sql)
+LEO_SCALES = {550: 1000.0}
+
+EMA_SPAN = 121              # same horizon as the 121-row window of the SQL version
+THRESHOLD_TOLERANCE = 0.95  # WORKING if score > threshold * 0.95
+MIN_SEGMENT_SEC = 5         # isolated segments shorter than this are fused
+HOLE_STATE = 'IDLE'         # seconds without any sensor row
+
+
+class SegmentFuser:
+    """
+    Streaming version of the segment post-processing of final_pipeline_Léo:
+    a segment shorter than `min_segment_sec` whose previous and next segments
+    share the same state is removed, then consecutive identical states are merged.
+    Only the previous state, one pending segment and the open output are kept.
+    """
+
+    def __init__(self, min_segment_sec: int = MIN_SEGMENT_SEC):
+        self.min_segment_sec = min_segment_sec
+        self._prev_state = None
+        self._pending = None   # [start, end, state] waiting for its successor
+        self._out = None       # [start, end, state] being extended
+
+    def push(self, start: int, end: int, state: str) -> list:
+        emitted = []
+        if self._pending is not None:
+            p_start, p_end, p_state = self._pending
+            is_micro = (p_end - p_start) < self.min_segment_sec
+            if not (is_micro and self._prev_state is not None and self._prev_state == state):
+                self._emit(self._pending, emitted)
+            self._prev_state = p_state
+        self._pending = [start, end, state]
+        return emitted
+
+    def flush(self) -> list:
+        emitted = []
+        if self._pending is not None:
+            self._emit(self._pending, emitted)
+            self._pending = None
+        if self._out is not None:
+            emitted.append(tuple(self._out))
+            self._out = None
+        return emitted
+
+    def _emit(self, segment: list, emitted: list) -> None:
+        start, end, state = segment
+        if self._out is not None and self._out[2] == state:
+            self._out[1] = end
+            return
+        if self._out is not None:
+            # Removed micro-segments leave a hole: the previous output covers it
+            self._out[1] = start
+            emitted.append(tuple(self._out))
+        self._out = [start, end, state]
+
+
+class WeightedEmaEngine:
+    """
+    Weighted-score working/idle classifier with a true recursive EMA threshold.
+
+    feed() takes chunks of (sec, id_var, value) ordered by sec. Each second is
+    one row: the last known value of every variable is carried forward (LOCF),
+    the weighted score is computed, the EMA is updated and the row is labelled
+    WORKING or IDLE. Seconds missing from the feed are IDLE. Closed segments
+    (start_s, end_s, state) are returned as soon as they are known; finish()
+    returns the remaining ones.
+    """
+
+    def __init__(self, weights: dict = LEO_WEIGHTS, scales: dict = LEO_SCALES,
+                 span: int = EMA_SPAN, tolerance: float = THRESHOLD_TOLERANCE,
+                 min_segment_sec: int = MIN_SEGMENT_SEC):
+        self.var_ids = list(weights)
+        self.weights = np.array([weights[v] for v in self.var_ids])
+        self.scales = np.array([scales.get(v, 1.0) for v in self.var_ids])
+        self.alpha = 2.0 / (span + 1)
+        self.tolerance = tolerance
+
+        # Streaming state carried from one chunk to the next
+        self._last_values = np.zeros(len(self.var_ids))
+        self._ema = None
+        self._open = None      # [start, state] of the raw segment in progress
+        self._last_sec = None
+        self._carry = None     # rows of the last second, which may continue in the next chunk
+        self._fuser = SegmentFuser(min_segment_sec)
+
+    def feed(self, chunk: pd.DataFrame) -> list:
+        if self._carry is not None:
+            chunk = pd.concat([self._carry, chunk], ignore_index=True)
+        if chunk.empty:
+            return []
+
+        # Hold back the last second: a chunk boundary can cut it in two
+        last_sec = chunk['sec'].iloc[-1]
+        self._carry = chunk[chunk['sec'] == last_sec]
+        return self._process(chunk[chunk['sec'] < last_sec])
+
+    def finish(self) -> list:
+        emitted = []
+        if self._carry is not None:
+            emitted.extend(self._process(self._carry))
+            self._carry = None
+        if self._open is not None:
+            emitted.extend(self._fuser.push(self._open[0], self._last_sec + 1, self._open[1]))
+            self._open = None
+        emitted.extend(self._fuser.flush())
+        return emitted
+
+    def _process(self, chunk: pd.DataFrame) -> list:
+        # 1. One row per second, one column per variable (last value of the second)
+        wide = (
+            chunk[chunk['id_var'].isin(self.var_ids)]
+            .pivot_table(index='sec', columns='id_var', values='value', aggfunc='last')
+            .reindex(columns=self.var_ids)
+        )
+        if wide.empty:
+            return []
+
+        # 2. LOCF, seeded with the last values of the previous chunk
+        seed = pd.DataFrame([self._last_values], columns=self.var_ids)
+        filled = pd.concat([seed, wide]).ffill().fillna(0.0).to_numpy()[1:]
+        self._last_values = filled[-1]
+
+        # 3. Weighted score and recursive EMA (previous EMA prepended as initial state)
+        score = (filled / self.scales) @ self.weights
+        initial = score[0] if self._ema is None else self._ema
+        ema = pd.Series(np.concatenate([[initial], score])).ewm(alpha=self.alpha, adjust=False).mean().to_numpy()[1:]
+        self._ema = ema[-1]
+
+        threshold = 0.95 * ema + 0.05 * score
+        states = np.where(score > threshold * self.tolerance, 'WORKING', 'IDLE')
+        secs = wide.index.to_numpy(dtype=np.int64)
+
+        # 4. Raw segments: close the open one at every state change and at
+        #    every hole in the signal (the hole itself is IDLE, like the
+        #    'True Idle (Off)' gaps of DistinctCountModel)
+        emitted = []
+        if self._open is None:
+            self._open = [int(secs[0]), str(states[0])]
+        prev_secs = np.concatenate([[secs[0] if self._last_sec is None else self._last_sec], secs[:-1]])
+        holes = secs - prev_secs > 1
+        changes = np.flatnonzero(holes | (states != np.concatenate([[self._open[1]], states[:-1]])))
+        for k in changes:
+            if holes[k]:
+                hole_start = int(prev_secs[k]) + 1
+                emitted.extend(self._fuser.push(self._open[0], hole_start, self._open[1]))
+                emitted.extend(self._fuser.push(hole_start, int(secs[k]), HOLE_STATE))
+            else:
+                emitted.extend(self._fuser.push(self._open[0], int(secs[k]), self._open[1]))
+            self._open = [int(secs[k]), str(states[k])]
+        self._last_sec = int(secs[-1])
+        return emitted
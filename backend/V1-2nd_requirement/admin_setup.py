@@ -37,6 +37,171 @@ def setup_materialized_view():
     
     print("Setup terminé. Veuillez rafraîchir la vue maintenant.")
 
+def setup_log_indexes():
+    """
+    Crée les index (id_var, date) sur les tables de logs.
+    Ils permettent de lire une variable dans l'ordre chronologique sans tri
+    (utilisé par 'get_stoppages' pour les variables 447 et 557).
+    """
+    print("--- 🛠️ Création des index (id_var, date) ---")
+
+    index_sqls = [
+        "CREATE INDEX IF NOT EXISTS idx_log_string_var_date ON variable_log_string (id_var, date);",
+        "CREATE INDEX IF NOT EXISTS idx_log_float_var_date ON variable_log_float (id_var, date);",
+    ]
+    for sql in index_sqls:
+        print(f"Tentative : {sql}")
+        execute_sql_command(sql)
+
+    print("Index créés.")
+
+# Tables de logs partitionnées par mois sur 'date' (epoch en ms, UTC)
+LOG_TABLES = {
+    "variable_log_float": "idx_log_float_var_date",
+    "variable_log_string": "idx_log_string_var_date",
+}
+PARTITION_MONTHS_AHEAD = 3
+
+# Crée les partitions mensuelles manquantes, du mois 'first_month' jusqu'à
+# 'months_ahead' mois après le mois courant. Si la partition DEFAULT contient
+# déjà des lignes du mois (insérées avant la création de sa partition), elle
+# est détachée le temps de les déplacer dans la nouvelle partition, puis
+# rattachée : sinon le CREATE échouerait (contrainte de la DEFAULT violée).
+ENSURE_PARTITIONS_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION ensure_log_partitions(parent text, first_month date, months_ahead int)
+RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+    m date := date_trunc('month', first_month)::date;
+    last_month date := (date_trunc('month', now() AT TIME ZONE 'UTC') + make_interval(months => months_ahead))::date;
+    part text;
+    dflt text := parent || '_default';
+    lo bigint;
+    hi bigint;
+    stranded boolean;
+BEGIN
+    WHILE m <= last_month LOOP
+        part := parent || '_p' || to_char(m, 'YYYY_MM');
+        lo := (extract(epoch FROM m::timestamp) * 1000)::bigint;
+        hi := (extract(epoch FROM (m + interval '1 month')::timestamp) * 1000)::bigint;
+        IF to_regclass(part) IS NULL THEN
+            stranded := false;
+            IF to_regclass(dflt) IS NOT NULL THEN
+                EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE date >= %s AND date < %s)', dflt, lo, hi)
+                    INTO stranded;
+            END IF;
+            IF stranded THEN
+                RAISE NOTICE '% : lignes de % déplacées de la partition DEFAULT', parent, to_char(m, 'YYYY-MM');
+                EXECUTE format('ALTER TABLE %I DETACH PARTITION %I', parent, dflt);
+            END IF;
+            EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%s) TO (%s)', part, parent, lo, hi);
+            IF stranded THEN
+                EXECUTE format('INSERT INTO %I SELECT * FROM %I WHERE date >= %s AND date < %s', part, dflt, lo, hi);
+                EXECUTE format('DELETE FROM %I WHERE date >= %s AND date < %s', dflt, lo, hi);
+                EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I DEFAULT', parent, dflt);
+            END IF;
+        END IF;
+        m := (m + interval '1 month')::date;
+    END LOOP;
+END $$;
+"""
+
+def _migrate_to_partitions_sql(table: str, index_name: str) -> str:
+    """
+    Bloc DO (une seule transaction) : renomme la table en <table>_legacy, crée
+    la table partitionnée, ses partitions mensuelles (de la première donnée à
+    PARTITION_MONTHS_AHEAD mois dans le futur) et une partition DEFAULT, puis
+    recopie les lignes. Ne fait rien si la table est déjà partitionnée.
+    """
+    return f"""
+    DO $$
+    DECLARE
+        first_ms bigint;
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM pg_partitioned_table p
+            JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = '{table}'
+        ) THEN
+            RAISE NOTICE '{table} est déjà partitionnée.';
+            RETURN;
+        END IF;
+
+        ALTER TABLE {table} RENAME TO {table}_legacy;
+        ALTER INDEX IF EXISTS {index_name} RENAME TO {index_name}_legacy;
+        CREATE TABLE {table} (LIKE {table}_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE (date);
+
+        SELECT MIN(CAST(date AS BIGINT)) INTO first_ms FROM {table}_legacy;
+        PERFORM ensure_log_partitions(
+            '{table}',
+            COALESCE((to_timestamp(first_ms / 1000.0) AT TIME ZONE 'UTC')::date, CURRENT_DATE),
+            {PARTITION_MONTHS_AHEAD}
+        );
+        CREATE TABLE {table}_default PARTITION OF {table} DEFAULT;
+
+        INSERT INTO {table} SELECT * FROM {table}_legacy;
+    END $$;
+    """
+
+def setup_partitions():
+    """
+    Migre variable_log_float et variable_log_string vers un partitionnement
+    déclaratif mensuel sur 'date'. Les requêtes par période ne lisent plus que
+    les partitions concernées, et un vieux mois se détache sans réécriture :
+        ALTER TABLE variable_log_float DETACH PARTITION variable_log_float_p2021_03;
+    Les anciennes tables restent en <table>_legacy (à supprimer après vérification).
+    """
+    print("--- 🗂️ Partitionnement mensuel des tables de logs ---")
+
+    execute_sql_command(ENSURE_PARTITIONS_FUNCTION_SQL)
+
+    # La vue matérialisée dépend de variable_log_float : elle suivrait la table renommée
+    print("Suppression de la Vue Matérialisée (recréée après la migration)...")
+    execute_sql_command("DROP MATERIALIZED VIEW IF EXISTS variable_counts_per_second;")
+
+    for table, index_name in LOG_TABLES.items():
+        print(f"Migration de {table} (copie des données, ceci peut prendre du temps)...")
+        if not execute_sql_command(_migrate_to_partitions_sql(table, index_name)):
+            print(f"Échec de la migration de {table} : rien n'a été modifié pour cette table.")
+            continue
+        # Index créés sur la table mère : PostgreSQL les crée sur chaque partition,
+        # y compris les partitions futures
+        execute_sql_command(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} (id_var, date);")
+        execute_sql_command(f"CREATE INDEX IF NOT EXISTS idx_{table}_date_brin ON {table} USING brin (date);")
+        execute_sql_command(f"ANALYZE {table};")
+
+    setup_materialized_view()
+    refresh_materialized_view()
+    print("Partitionnement terminé. Pensez à supprimer les tables *_legacy après vérification.")
+
+def ensure_future_partitions() -> bool:
+    """
+    Crée les partitions des prochains mois (appelé à chaque 'refresh'), pour que
+    les nouvelles lignes n'arrivent jamais dans la partition DEFAULT (celles qui
+    y sont déjà sont déplacées dans la partition de leur mois).
+    Retourne False si une table n'a pas pu être mise à jour.
+    """
+    ok = True
+    for table in LOG_TABLES:
+        done = execute_sql_command(
+            f"""
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM pg_partitioned_table p
+                    JOIN pg_class c ON c.oid = p.partrelid
+                    WHERE c.relname = '{table}'
+                ) THEN
+                    PERFORM ensure_log_partitions('{table}', CURRENT_DATE, {PARTITION_MONTHS_AHEAD});
+                END IF;
+            END $$;
+            """
+        )
+        if not done:
+            print(f"Échec de la création des partitions de {table}.")
+            ok = False
+    return ok
+
 def refresh_materialized_view():
     """
     Rafraîchit les données de la Vue Matérialisée.
@@ -56,13 +221,19 @@ if __name__ == "__main__":
         print("\nUsage:")
         print("  Pour l'initialisation : python admin_setup.py setup")
         print("  Pour le rafraîchissement : python admin_setup.py refresh")
+        print("  Pour le partitionnement mensuel : python admin_setup.py partition")
         sys.exit(1)
         
     action = sys.argv[1].lower()
     
     if action == "setup":
         setup_materialized_view()
+        setup_log_indexes()
     elif action == "refresh":
+        if not ensure_future_partitions():
+            sys.exit("Partitions non créées : les nouvelles lignes iraient dans la partition DEFAULT.")
         refresh_materialized_view()
+    elif action == "partition":
+        setup_partitions()
     else:
-        print(f"Action non reconnue : {action}. Utilisez 'setup' ou 'refresh'.")
\ No newline at end of file
+        print(f"Action non reconnue : {action}. Utilisez 'setup', 'refresh' ou 'partition'.")
\ No newline at end of file